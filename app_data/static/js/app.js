@@ -7,6 +7,14 @@ import { VinylPlayer } from './vinyl_player.js';
 const STATES = { OVERVIEW: 0, BROWSE: 1, INSPECT: 2, PLAYER: 3 };
 const STATE_KEYS = ['OVERVIEW', 'BROWSE', 'INSPECT', 'PLAYER'];
 
+// Smallest rendered cover variant at least `size` px wide, else the largest one there is
+function coverUrl(album, size) {
+    const sizes = Object.keys(album.cover_variants || {}).map(Number).sort((a, b) => a - b);
+    if (!sizes.length) return album.cover_url;
+    const pick = sizes.find(s => s >= size) || sizes[sizes.length - 1];
+    return album.cover_variants[pick];
+}
+
 class VinylApp {
     constructor() {
         this.stateIndex = 0; 
@@ -18,6 +26,9 @@ class VinylApp {
         this.browseMeshes = [];
         this.activeAlbum = null;
         this.activeCrate = null;
+        this.pendingInspect = null;
+        this.atlasMap = null;
+        this.atlasMaterials = new Map();
         
         this.currentSortMode = CONFIG.SORT_MODES.RAW;
         this.sortAscending = true; 
@@ -27,6 +38,9 @@ class VinylApp {
         this.hasPlayed = false;
         this.libraryLoaded = false;
         this.pendingSyncData = null;
+        // Set while mirroring another tab's navigation so it is not sent back
+        this.followingNav = false;
+        this.volume = 0.5;
 
         this.scrollTarget = 0;
         this.scrollCurrent = 0;
@@ -87,10 +101,8 @@ class VinylApp {
         this.setupUIEvents();
         this.setupNetworkEvents();
         
-        this.loadLibrary().then(() => {
-            this.animate();
-            document.getElementById('loader-overlay').style.display = 'none';
-        });
+        this.animate();
+        this.loadLibrary();
     }
 
     createGradientTexture() {
@@ -165,6 +177,10 @@ class VinylApp {
     }
 
     setupNetworkEvents() {
+        this.network.onBinary((buffer) => {
+            if (this.player) this.player.applySpectrum(buffer);
+        });
+
         this.network.onMessage((data) => {
             if (data.status === 'sync') {
                 if (data.playback && data.playback.isPlaying) {
@@ -186,6 +202,17 @@ class VinylApp {
                     if(data.navigation) this.restoreNavState(data.navigation);
                 }
 
+            } else if (data.status === 'nav') {
+                // Another tab moved; follow it without echoing the change back
+                if (this.libraryLoaded) this.followNavState(data.navigation);
+                else this.pendingSyncData = data.navigation;
+
+            } else if (data.status === 'position') {
+                if (this.player) this.player.syncPosition(data);
+
+            } else if (data.status === 'volume') {
+                this.setVolumeKnob(data.value);
+
             } else if (data.status === 'playing') {
                 this.ui.status.innerText = "Playing";
 
@@ -199,6 +226,7 @@ class VinylApp {
                 
                 this.currentTrackInfo.title = data.track;
                 this.currentTrackInfo.artist = data.artist || "";
+                if (data.file_path && this.player) this.player.syncTrack(data.file_path);
 
                 this.ui.pTitle.innerText = data.track;
                 this.ui.pArtist.innerText = data.artist || "";
@@ -214,14 +242,34 @@ class VinylApp {
                 this.ui.iconPause.classList.add('hidden');
                 this.updateTitleMarquee("", false);
 
+            } else if (data.status === 'scan_progress') {
+                this.showScanProgress(data);
+
+            } else if (data.status === 'library_delta') {
+                this.applyLibraryDelta(data);
+                this.loadAtlasMap();
+
             } else if (data.status === 'finished') {
                 console.log("[App] Received FINISHED signal from server");
-                // IMPORTANT: Pause local visual immediately
+                // Every open tab advances; the server starts only the first PLAY tagged with this seq
+                if (this.player) this.player.finished = { seq: data.seq, at: Date.now() };
                 this.playNextTrack();
             }
         });
     }
 
+    showScanProgress(event) {
+        // Library scan running in the launcher; reload the page after "done" to see a full rescan
+        const labels = {
+            discover: `Scanning: ${event.discovered} files found`,
+            tags: `Scanning: ${event.processed}/${event.discovered} files`,
+            albums: `Scanning: ${event.albums}/${event.albums_total} albums`,
+            done: 'Scan complete',
+            cancelled: 'Scan cancelled'
+        };
+        this.ui.status.innerText = labels[event.phase] || '';
+    }
+
     playNextTrack() {
         if (!this.player || !this.player.currentDiscData) {
             console.warn("[App] Cannot play next: No disc loaded in player.");
@@ -246,14 +294,8 @@ class VinylApp {
 
         if (currentIndex !== -1 && currentIndex < tracks.length - 1) {
             // Next track exists on this disc
+            console.log(`[App] Sending PLAY for next track: ${tracks[currentIndex + 1].title}`);
             this.player.playTrack(currentIndex + 1, 0);
-            const nextTrack = tracks[currentIndex + 1];
-            console.log(`[App] Sending PLAY for next track: ${nextTrack.title}`);
-            this.network.send("PLAY", { 
-                file_path: nextTrack.file_path, 
-                title: nextTrack.title, 
-                artist: this.activeAlbum.artist 
-            });
         } else {
             // End of disc
             console.log("[App] End of disc reached. Calling handleDiscFinish().");
@@ -341,7 +383,7 @@ class VinylApp {
         document.getElementById('btn-prev').onclick = () => this.player.prevTrack(); 
 
         
-        let isDragging = false; let startY = 0; let vol = 0.5;
+        let isDragging = false; let startY = 0;
         if (this.ui.volKnob) {
             this.ui.volKnob.onmousedown = (e) => { isDragging = true; startY = e.clientY; };
             window.addEventListener('mouseup', () => { isDragging = false; });
@@ -349,14 +391,18 @@ class VinylApp {
                 if(!isDragging) return;
                 const delta = startY - e.clientY;
                 startY = e.clientY;
-                vol = Math.min(1, Math.max(0, vol + delta * 0.01));
-                const deg = (vol * 270) - 135;
-                if(this.ui.knobMarker) this.ui.knobMarker.style.transform = `translateX(-50%) rotate(${deg}deg)`;
-                this.network.send("VOLUME", { value: vol });
+                this.setVolumeKnob(Math.min(1, Math.max(0, this.volume + delta * 0.01)));
+                this.network.send("VOLUME", { value: this.volume });
             });
         }
     }
 
+    setVolumeKnob(vol) {
+        this.volume = vol;
+        const deg = (vol * 270) - 135;
+        if(this.ui.knobMarker) this.ui.knobMarker.style.transform = `translateX(-50%) rotate(${deg}deg)`;
+    }
+
     setupEvents() {
         this.raycaster = new THREE.Raycaster();
         this.mouse = new THREE.Vector2();
@@ -404,25 +450,150 @@ class VinylApp {
     }
 
     async loadLibrary() {
+        this.loadAtlasMap();
         try {
-            const res = await fetch('/api/library');
-            const data = await res.json();
-            this.fullLibrary = data;
-            this.libraryLoaded = true;
+            // Album summaries arrive page by page; the first crates are on screen
+            // before the rest of the collection has been fetched.
+            let cursor = null;
+            let firstPage = true;
+            do {
+                const params = new URLSearchParams({ limit: CONFIG.LIBRARY.PAGE_SIZE });
+                if (cursor) params.set('cursor', cursor);
+                const res = await fetch(`/api/albums?${params}`);
+                const page = await res.json();
+                // Skip albums a library_delta already delivered while we were paging
+                const known = new Set(this.fullLibrary.map(a => a.id));
+                this.fullLibrary.push(...page.albums.filter(a => !known.has(a.id)));
+                cursor = page.next_cursor;
+
+                if (firstPage) {
+                    firstPage = false;
+                    document.getElementById('loader-overlay').style.display = 'none';
+                    this.processLibrary(CONFIG.SORT_MODES.RAW);
+                    this.enterOverview(false);
+                } else {
+                    this.refreshCrates();
+                }
+            } while (cursor);
 
-            document.getElementById('loader-overlay').style.display = 'none';
+            this.libraryLoaded = true;
 
             if (this.pendingSyncData) {
                 this.restoreNavState(this.pendingSyncData);
                 this.pendingSyncData = null;
-            } else {
-                this.processLibrary(CONFIG.SORT_MODES.RAW);
-                this.enterOverview();
             }
 
         } catch(e) { console.error(e); }
     }
 
+    async loadAtlasMap() {
+        // Without a map (or before it arrives) crates load covers one by one
+        try {
+            const res = await fetch(CONFIG.COVERS.ATLAS_MAP, { cache: 'no-cache' });
+            if (res.ok) this.atlasMap = await res.json();
+        } catch(e) { console.warn("[App] No cover atlas", e); }
+    }
+
+    atlasMaterial(index) {
+        const url = this.atlasMap.atlases[index];
+        let mat = this.atlasMaterials.get(url);
+        if (mat) {
+            this.atlasMaterials.delete(url);
+        } else {
+            const tex = new THREE.TextureLoader().load(url);
+            tex.colorSpace = THREE.SRGBColorSpace;
+            mat = new THREE.MeshBasicMaterial({map: tex});
+        }
+        // Map order doubles as recency; the current crate's atlases are always the newest
+        this.atlasMaterials.set(url, mat);
+        while (this.atlasMaterials.size > CONFIG.COVERS.ATLAS_CACHE) {
+            const [oldUrl, oldMat] = this.atlasMaterials.entries().next().value;
+            oldMat.map.dispose();
+            oldMat.dispose();
+            this.atlasMaterials.delete(oldUrl);
+        }
+        return mat;
+    }
+
+    crateAtlasEntries(crate) {
+        // Atlas tile per album id, or null when the crate is spread over too many atlases
+        if (!this.atlasMap) return null;
+        const entries = {};
+        const used = new Set();
+        crate.albums.forEach(item => {
+            const entry = item.type !== 'separator' && this.atlasMap.albums[item.id];
+            if (entry) { entries[item.id] = entry; used.add(entry[0]); }
+        });
+        return used.size <= CONFIG.COVERS.ATLAS_MAX_PER_CRATE ? entries : null;
+    }
+
+    setAtlasUVs(geometry, entry) {
+        // BoxGeometry face order is px, nx, py, ny, pz, nz with 4 vertices each; the cover is on pz
+        const { tile, grid, padding } = this.atlasMap;
+        const edge = tile * grid;
+        const inner = tile - 2 * padding;
+        const [, col, row] = entry;
+        const uv = geometry.attributes.uv;
+        for (let i = 16; i < 20; i++) {
+            const u = (col * tile + padding + uv.getX(i) * inner) / edge;
+            const v = 1 - (row * tile + padding + (1 - uv.getY(i)) * inner) / edge;
+            uv.setXY(i, u, v);
+        }
+        uv.needsUpdate = true;
+        return geometry;
+    }
+
+    async loadAlbumDetails(album) {
+        if (!album.discs) {
+            const id = encodeURIComponent(album.id);
+            // Waveforms only shade the grooves, so a failed request is not an error
+            const [details, waveforms] = await Promise.all([
+                fetch(`/api/albums/${id}`).then(res => res.json()),
+                fetch(`/api/albums/${id}/waveforms`).then(res => res.ok ? res.json() : {}).catch(() => ({}))
+            ]);
+            details.discs.forEach(disc => disc.tracks.forEach(track => {
+                const encoded = waveforms[track.file_path];
+                if (encoded) track.waveform = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+            }));
+            album.discs = details.discs;
+            album.type = details.type;
+        }
+        return album;
+    }
+
+    applyLibraryDelta(delta) {
+        // Live update from the folder watcher: drop removed/changed albums, then
+        // insert the new summaries where the scanner's artist/title order puts them
+        const changed = new Set([...delta.removed, ...delta.updated.map(a => a.id)]);
+        this.fullLibrary = this.fullLibrary.filter(a => !changed.has(a.id));
+
+        const orderKey = (a) => `${a.artist.toLowerCase()}\u0000${a.title.toLowerCase()}`;
+        delta.updated.forEach(album => {
+            const key = orderKey(album);
+            let i = this.fullLibrary.findIndex(a => orderKey(a) > key);
+            if (i === -1) i = this.fullLibrary.length;
+            this.fullLibrary.splice(i, 0, album);
+        });
+
+        if (this.fullLibrary.length > 0) this.refreshCrates();
+    }
+
+    refreshCrates() {
+        // Rebuild crates after more albums arrived without moving the user
+        const activeIdx = this.activeCrate ? this.crates.indexOf(this.activeCrate) : -1;
+        const scrollTarget = this.scrollTarget;
+        const scrollCurrent = this.scrollCurrent;
+
+        this.processLibrary(this.currentSortMode);
+        if (activeIdx >= 0 && activeIdx < this.crates.length) this.activeCrate = this.crates[activeIdx];
+
+        if (this.stateIndex === STATES.OVERVIEW) {
+            this.buildOverview();
+            this.scrollTarget = scrollTarget;
+            this.scrollCurrent = scrollCurrent;
+        }
+    }
+
     processLibrary(mode) {
         this.currentSortMode = mode || CONFIG.SORT_MODES.RAW;
         this.crates = [];
@@ -643,6 +814,7 @@ class VinylApp {
     }
 
     saveNavState() {
+        if (this.followingNav) return;
         const accent = getComputedStyle(document.documentElement).getPropertyValue('--primary').trim();
         const state = {
             sortMode: this.currentSortMode,
@@ -656,7 +828,16 @@ class VinylApp {
         this.network.send("UPDATE_NAV", state);
     }
 
-    restoreNavState(savedState) {
+    async followNavState(savedState) {
+        this.followingNav = true;
+        try {
+            await this.restoreNavState(savedState);
+        } finally {
+            this.followingNav = false;
+        }
+    }
+
+    async restoreNavState(savedState) {
         const sort = (savedState && savedState.sortMode) ? savedState.sortMode : CONFIG.SORT_MODES.RAW;
         
         if (savedState) {
@@ -696,7 +877,7 @@ class VinylApp {
             if (crateIdx < this.crates.length) this.enterBrowse(crateIdx); 
         }
         if (targetView >= STATES.INSPECT && album) {
-            this.enterInspect(album); 
+            await this.enterInspect(album); 
         }
         if (targetView === STATES.PLAYER && album) {
             const discIndex = savedState.discIndex || 0;
@@ -925,11 +1106,18 @@ class VinylApp {
         }
     }
 
-    enterOverview() {
-        this.saveNavState();
+    enterOverview(save = true) {
+        if (save) this.saveNavState();
         this.changeState(STATES.OVERVIEW);
         this.ui.title.innerText = `Collection (${this.currentSortMode})`;
+        this.buildOverview();
         
+        this.scrollTarget = 0;
+        this.scrollCurrent = 0;
+        this.updateView(true);
+    }
+
+    buildOverview() {
         while(this.worldGroup.children.length) this.worldGroup.remove(this.worldGroup.children[0]);
 
         const boxGeo = new THREE.BoxGeometry(CONFIG.CRATE.WIDTH, CONFIG.CRATE.HEIGHT, CONFIG.CRATE.DEPTH);
@@ -954,10 +1142,6 @@ class VinylApp {
                 this.worldGroup.add(helper);
             }
         });
-        
-        this.scrollTarget = 0;
-        this.scrollCurrent = 0;
-        this.updateView(true);
     }
 
     enterBrowse(index) {
@@ -979,6 +1163,7 @@ class VinylApp {
         this.crateGroup.add(floor, left, right, front, back);
 
         const loader = new THREE.TextureLoader();
+        const atlasEntries = this.crateAtlasEntries(this.activeCrate);
         
         this.activeCrate.albums.forEach((item, i) => {
             if (item.type === 'separator') {
@@ -1001,11 +1186,19 @@ class VinylApp {
             } 
             else {
                 const thickness = CONFIG.DIGGING.ALBUM_THICKNESS;
-                const tex = loader.load(item.cover_url);
-                tex.colorSpace = THREE.SRGBColorSpace;
-                const mat = new THREE.MeshBasicMaterial({map: tex});
+                const geometry = new THREE.BoxGeometry(10, 10, thickness);
+                const entry = atlasEntries && atlasEntries[item.id];
+                let mat;
+                if (entry) {
+                    mat = this.atlasMaterial(entry[0]);
+                    this.setAtlasUVs(geometry, entry);
+                } else {
+                    const tex = loader.load(coverUrl(item, CONFIG.COVERS.BROWSE));
+                    tex.colorSpace = THREE.SRGBColorSpace;
+                    mat = new THREE.MeshBasicMaterial({map: tex});
+                }
                 const matEdge = new THREE.MeshBasicMaterial({color: item.accent_color || CONFIG.DIGGING.SLEEVE_COLOR});
-                const mesh = new THREE.Mesh(new THREE.BoxGeometry(10, 10, thickness), [matEdge, matEdge, matEdge, matEdge, mat, matEdge]);
+                const mesh = new THREE.Mesh(geometry, [matEdge, matEdge, matEdge, matEdge, mat, matEdge]);
                 mesh.position.set(0, CONFIG.DIGGING.BASE_HEIGHT, -i * CONFIG.DIGGING.SPACING);
                 mesh.userData = { type: 'album', data: item, index: i };
                 this.crateGroup.add(mesh);
@@ -1018,7 +1211,12 @@ class VinylApp {
         this.updateView(true);
     }
 
-    enterInspect(album) {
+    async enterInspect(album) {
+        // Discs and tracks are only fetched once the sleeve is pulled out
+        this.pendingInspect = album;
+        await this.loadAlbumDetails(album);
+        if (this.pendingInspect !== album) return;
+
         this.activeAlbum = album;
         if(album.accent_color) {
             document.documentElement.style.setProperty('--primary', album.accent_color);
@@ -1031,7 +1229,7 @@ class VinylApp {
         while(this.inspectGroup.children.length) this.inspectGroup.remove(this.inspectGroup.children[0]);
 
         const loader = new THREE.TextureLoader();
-        const tex = loader.load(album.cover_url);
+        const tex = loader.load(coverUrl(album, CONFIG.COVERS.INSPECT));
         tex.colorSpace = THREE.SRGBColorSpace;
 
         const matEdge = new THREE.MeshBasicMaterial({ color: album.accent_color || "#fff" });
@@ -1079,7 +1277,7 @@ class VinylApp {
         document.documentElement.style.setProperty('--primary', accent);
 
         const loader = new THREE.TextureLoader();
-        loader.load(this.activeAlbum.cover_url, (tex) => {
+        loader.load(coverUrl(this.activeAlbum, CONFIG.COVERS.PLAYER), (tex) => {
             tex.colorSpace = THREE.SRGBColorSpace;
             this.player.loadDisc(discData, tex, {x: -10, y: 5, z: 0}, this.activeAlbum.artist, instant);
         });
@@ -3,6 +3,13 @@ export const CONFIG = {
         SHOW_HITBOXES: false, 
         LOG_NETWORK: true 
     },
+
+    NETWORK: {
+        // Offered in order; the server picks the first it supports (json is always available)
+        PROTOCOLS: ['vinyl.msgpack', 'vinyl.json'],
+        // Coalesced actions (VOLUME, SEEK, UPDATE_NAV) are held this long and sent together
+        FLUSH_MS: 50
+    },
     
     // --- GLOBAL FONTS ---
     FONTS: {
@@ -24,6 +31,20 @@ export const CONFIG = {
         ZOOM_SPEED: 0.05       
     },
     
+    LIBRARY: {
+        PAGE_SIZE: 500 // Album summaries per /api/albums request
+    },
+
+    // Requested cover edge length (px) per view; the nearest rendered variant is used
+    COVERS: {
+        BROWSE: 256,
+        INSPECT: 1024,
+        PLAYER: 512,
+        ATLAS_MAP: '/static/covers/atlas/atlas.json',
+        ATLAS_MAX_PER_CRATE: 4, // More atlases than this for one crate -> load covers one by one
+        ATLAS_CACHE: 8          // Atlas textures kept on the GPU across crate switches
+    },
+
     SORT_MODES: {
         ARTIST: 'ARTIST',
         ALBUM: 'ALBUM',
@@ -174,6 +195,7 @@ GIMBAL: {
         ANGLE_ARM_START: -0.42, 
         ANGLE_ARM_END: -0.83, 
         ROTATION_SPEED: 0.035,
+        CROSSFADE: 0, // Seconds of overlap between tracks of a disc; 0 = gapless
         GROOVE_COLOR: '#151515',
         FOV_MIN: 10, 
         FOV_MAX: 75, 
@@ -0,0 +1,130 @@
+// Minimal MessagePack codec for the WebSocket protocol: nil, booleans,
+// numbers, strings, binary, arrays and maps (no extension types).
+
+const textEncoder = new TextEncoder();
+const textDecoder = new TextDecoder();
+
+class Writer {
+    constructor() {
+        this.bytes = new Uint8Array(256);
+        this.view = new DataView(this.bytes.buffer);
+        this.length = 0;
+    }
+
+    reserve(n) {
+        if (this.length + n <= this.bytes.length) return;
+        let size = this.bytes.length * 2;
+        while (size < this.length + n) size *= 2;
+        const bytes = new Uint8Array(size);
+        bytes.set(this.bytes.subarray(0, this.length));
+        this.bytes = bytes;
+        this.view = new DataView(bytes.buffer);
+    }
+
+    u8(v) { this.reserve(1); this.view.setUint8(this.length, v); this.length += 1; }
+    u16(v) { this.reserve(2); this.view.setUint16(this.length, v); this.length += 2; }
+    u32(v) { this.reserve(4); this.view.setUint32(this.length, v); this.length += 4; }
+    raw(bytes) { this.reserve(bytes.length); this.bytes.set(bytes, this.length); this.length += bytes.length; }
+
+    header(len, fixBase, fixMax, tag8, tag16, tag32) {
+        if (fixBase !== null && len <= fixMax) this.u8(fixBase | len);
+        else if (tag8 !== null && len < 0x100) { this.u8(tag8); this.u8(len); }
+        else if (len < 0x10000) { this.u8(tag16); this.u16(len); }
+        else { this.u8(tag32); this.u32(len); }
+    }
+
+    value(v) {
+        if (v === null || v === undefined) this.u8(0xc0);
+        else if (v === false) this.u8(0xc2);
+        else if (v === true) this.u8(0xc3);
+        else if (typeof v === 'number') this.number(v);
+        else if (typeof v === 'string') {
+            const bytes = textEncoder.encode(v);
+            this.header(bytes.length, 0xa0, 31, 0xd9, 0xda, 0xdb);
+            this.raw(bytes);
+        } else if (v instanceof Uint8Array || v instanceof ArrayBuffer) {
+            const bytes = v instanceof Uint8Array ? v : new Uint8Array(v);
+            this.header(bytes.length, null, 0, 0xc4, 0xc5, 0xc6);
+            this.raw(bytes);
+        } else if (Array.isArray(v)) {
+            this.header(v.length, 0x90, 15, null, 0xdc, 0xdd);
+            v.forEach(item => this.value(item));
+        } else {
+            const keys = Object.keys(v).filter(k => v[k] !== undefined);
+            this.header(keys.length, 0x80, 15, null, 0xde, 0xdf);
+            keys.forEach(k => { this.value(k); this.value(v[k]); });
+        }
+    }
+
+    number(v) {
+        if (Number.isInteger(v) && v >= -0x80000000 && v <= 0xffffffff) {
+            if (v >= 0) {
+                if (v < 0x80) this.u8(v);
+                else if (v < 0x100) { this.u8(0xcc); this.u8(v); }
+                else if (v < 0x10000) { this.u8(0xcd); this.u16(v); }
+                else { this.u8(0xce); this.u32(v); }
+            } else if (v >= -32) {
+                this.u8(v & 0xff);
+            } else {
+                this.u8(0xd2); this.reserve(4); this.view.setInt32(this.length, v); this.length += 4;
+            }
+        } else {
+            this.u8(0xcb); this.reserve(8); this.view.setFloat64(this.length, v); this.length += 8;
+        }
+    }
+}
+
+export function encode(value) {
+    const writer = new Writer();
+    writer.value(value);
+    return writer.bytes.slice(0, writer.length);
+}
+
+export function decode(buffer) {
+    const bytes = buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let pos = 0;
+
+    const str = (len) => { const s = textDecoder.decode(bytes.subarray(pos, pos + len)); pos += len; return s; };
+    const bin = (len) => { const b = bytes.slice(pos, pos + len); pos += len; return b; };
+    const array = (len) => { const a = new Array(len); for (let i = 0; i < len; i++) a[i] = read(); return a; };
+    const map = (len) => { const m = {}; for (let i = 0; i < len; i++) { const k = read(); m[k] = read(); } return m; };
+    const take = (n, get) => { const v = get(pos); pos += n; return v; };
+
+    function read() {
+        const tag = bytes[pos++];
+        if (tag < 0x80) return tag;
+        if (tag < 0x90) return map(tag & 0x0f);
+        if (tag < 0xa0) return array(tag & 0x0f);
+        if (tag < 0xc0) return str(tag & 0x1f);
+        if (tag >= 0xe0) return tag - 0x100;
+        switch (tag) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: return bin(take(1, p => view.getUint8(p)));
+            case 0xc5: return bin(take(2, p => view.getUint16(p)));
+            case 0xc6: return bin(take(4, p => view.getUint32(p)));
+            case 0xca: return take(4, p => view.getFloat32(p));
+            case 0xcb: return take(8, p => view.getFloat64(p));
+            case 0xcc: return take(1, p => view.getUint8(p));
+            case 0xcd: return take(2, p => view.getUint16(p));
+            case 0xce: return take(4, p => view.getUint32(p));
+            case 0xcf: return take(8, p => Number(view.getBigUint64(p)));
+            case 0xd0: return take(1, p => view.getInt8(p));
+            case 0xd1: return take(2, p => view.getInt16(p));
+            case 0xd2: return take(4, p => view.getInt32(p));
+            case 0xd3: return take(8, p => Number(view.getBigInt64(p)));
+            case 0xd9: return str(take(1, p => view.getUint8(p)));
+            case 0xda: return str(take(2, p => view.getUint16(p)));
+            case 0xdb: return str(take(4, p => view.getUint32(p)));
+            case 0xdc: return array(take(2, p => view.getUint16(p)));
+            case 0xdd: return array(take(4, p => view.getUint32(p)));
+            case 0xde: return map(take(2, p => view.getUint16(p)));
+            case 0xdf: return map(take(4, p => view.getUint32(p)));
+        }
+        throw new Error(`msgpack: unsupported type 0x${tag.toString(16)}`);
+    }
+
+    return read();
+}
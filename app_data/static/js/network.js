@@ -1,4 +1,8 @@
 import { CONFIG } from './config.js';
+import { encode, decode } from './msgpack.js';
+
+// High-frequency actions: 'latest' keeps only the newest pending payload, 'merge' folds them together
+const COALESCE = { VOLUME: 'latest', SEEK: 'latest', UPDATE_NAV: 'merge' };
 
 export class NetworkManager {
     constructor(statusCallback) {
@@ -6,19 +10,27 @@ export class NetworkManager {
         this.connected = false;
         this.statusCallback = statusCallback; // Updates UI text
         this.msgHandlers = [];
+        this.binaryHandlers = [];
+        // Negotiated at connect: MessagePack batches or one JSON text frame per message
+        this.msgpack = false;
+        this.outbox = [];
+        this.flushTimer = null;
         this.connect();
     }
 
     connect() {
-        this.socket = new WebSocket("ws://127.0.0.1:8000/ws");
+        this.socket = new WebSocket("ws://127.0.0.1:8000/ws", CONFIG.NETWORK.PROTOCOLS);
+        this.socket.binaryType = 'arraybuffer';
 
         this.socket.onopen = () => {
             this.connected = true;
-            if(CONFIG.DEBUG.LOG_NETWORK) console.log("[Net] Connected");
+            this.msgpack = this.socket.protocol === 'vinyl.msgpack';
+            if(CONFIG.DEBUG.LOG_NETWORK) console.log(`[Net] Connected (${this.socket.protocol || 'json'})`);
         };
 
         this.socket.onclose = () => {
             this.connected = false;
+            this.outbox = [];
             this.statusCallback("Connection Lost. Retrying...");
             setTimeout(() => this.connect(), 3000); // Auto-retry
         };
@@ -28,6 +40,14 @@ export class NetworkManager {
         };
 
         this.socket.onmessage = (e) => {
+            if (this.msgpack) {
+                decode(e.data).forEach(item => this.dispatch(item));
+                return;
+            }
+            if (e.data instanceof ArrayBuffer) {
+                this.binaryHandlers.forEach(h => h(e.data));
+                return;
+            }
             try {
                 const data = JSON.parse(e.data);
                 this.msgHandlers.forEach(h => h(data));
@@ -37,15 +57,47 @@ export class NetworkManager {
         };
     }
 
+    dispatch(item) {
+        if (item instanceof Uint8Array) this.binaryHandlers.forEach(h => h(item.buffer));
+        else this.msgHandlers.forEach(h => h(item));
+    }
+
     send(action, payload = {}) {
         if (!this.connected) {
             console.warn("[Net] Cannot send, disconnected.");
             return;
         }
-        this.socket.send(JSON.stringify({ action, payload }));
+        const mode = COALESCE[action];
+        const pending = mode ? this.outbox.findIndex(m => m.action === action) : -1;
+        if (pending !== -1) {
+            // Re-queued at the end so it still follows any PLAY sent in between
+            const previous = this.outbox.splice(pending, 1)[0];
+            if (mode === 'merge') payload = { ...previous.payload, ...payload };
+        }
+        this.outbox.push({ action, payload });
+
+        if (!mode) this.flush();
+        else if (!this.flushTimer) this.flushTimer = setTimeout(() => this.flush(), CONFIG.NETWORK.FLUSH_MS);
+    }
+
+    flush() {
+        clearTimeout(this.flushTimer);
+        this.flushTimer = null;
+        if (!this.connected || this.outbox.length === 0) return;
+        if (this.msgpack) {
+            this.socket.send(encode(this.outbox.map(m => [m.action, m.payload])));
+        } else {
+            this.outbox.forEach(m => this.socket.send(JSON.stringify(m)));
+        }
+        this.outbox = [];
     }
 
     onMessage(handler) {
         this.msgHandlers.push(handler);
     }
-}
\ No newline at end of file
+
+    // Binary frames (spectrum analysis) arrive as ArrayBuffers
+    onBinary(handler) {
+        this.binaryHandlers.push(handler);
+    }
+}
@@ -18,8 +18,13 @@ export class VinylPlayer {
         this.currentDiscData = null;
         this.currentArtist = "Unknown";
         this.currentTrackIndex = 0;
+        // { seq, at } of the last server "finished" event, consumed by the next auto-advance PLAY
+        this.finished = null;
         this.playbackStartTime = 0; 
         this.trackOffset = 0; 
+        // Smoothed loudness from the server's spectrum frames, 0..1
+        this.level = 0;
+        this.spectrum = new Uint8Array(0);
         
         this._buildTurntable();
     }
@@ -65,7 +70,11 @@ export class VinylPlayer {
 
         ctx.strokeStyle = CONFIG.PLAYER.GROOVE_COLOR; 
         ctx.lineWidth = 1;
+        const grooveLevel = this._grooveLevels(tracks, 150, size/2 - 10);
         for(let r=150; r<size/2 - 10; r+=3) { 
+            // Loud passages are cut wider and catch more light, as on a real record
+            const level = grooveLevel(r);
+            if (level !== null) ctx.strokeStyle = `rgb(${21 + level * 40}, ${21 + level * 40}, ${21 + level * 40})`;
             ctx.beginPath(); ctx.arc(cx, cy, r, 0, Math.PI*2); ctx.stroke();
         }
 
@@ -87,6 +96,35 @@ export class VinylPlayer {
         return tex;
     }
 
+    // Maps a groove radius to the scan-time waveform peak (0..1) at that point of the disc, or null
+    _grooveLevels(tracks, rMin, rMax) {
+        if (!tracks || !tracks.some(t => t.waveform)) return () => null;
+        const totalDur = tracks.reduce((sum, t) => sum + (t.duration || 180), 0);
+        return (r) => {
+            let time = (rMax - r) / (rMax - rMin) * totalDur;
+            for (const t of tracks) {
+                const dur = t.duration || 180;
+                if (time <= dur) {
+                    if (!t.waveform) return null;
+                    const i = Math.min(t.waveform.length - 1, Math.floor(time / dur * t.waveform.length));
+                    return t.waveform[i] / 255;
+                }
+                time -= dur;
+            }
+            return null;
+        };
+    }
+
+    // Binary frame from the server's SpectrumAnalyzer: u8 type, u8 bands, u16 seq, f32 position, u8 rms L/R, u8 bands[]
+    applySpectrum(buffer) {
+        const view = new DataView(buffer);
+        if (view.getUint8(0) !== 1) return;
+        const bands = view.getUint8(1);
+        const rms = (view.getUint8(8) + view.getUint8(9)) / 510;
+        this.spectrum = new Uint8Array(buffer, 10, bands);
+        this.level = Math.max(rms, this.level * 0.85);
+    }
+
     loadDisc(discData, coverTexture, startPosition, artistName, instant = false) {
         if (this.state !== P_STATES.EMPTY) this.unloadDisc();
         this.state = P_STATES.LOADING;
@@ -143,13 +181,30 @@ export class VinylPlayer {
         this.playbackStartTime = Date.now();
         this.state = P_STATES.PLAYING;
         const track = this.currentDiscData.tracks[trackIndex];
-        
-        this.network.send("PLAY", { 
+        const payload = { 
             file_path: track.file_path, 
             title: track.title, 
             artist: this.currentArtist, 
-            start_time: timeOffset 
-        });
+            start_time: timeOffset,
+            // The server preloads these and plays them back to back
+            queue: this.currentDiscData.tracks.slice(trackIndex + 1).map(t => ({ file_path: t.file_path, title: t.title })),
+            crossfade: CONFIG.PLAYER.CROSSFADE
+        };
+        // Auto-advance after a "finished" event carries its seq so the server can drop duplicates.
+        // The window covers the disc swap animation; a later click is a user action.
+        if (this.finished && Date.now() - this.finished.at < 10000) payload.finished_seq = this.finished.seq;
+        this.finished = null;
+        this.network.send("PLAY", payload);
+    }
+
+    // The server moved on to another track of this disc by itself (gapless queue)
+    syncTrack(filePath) {
+        if (!this.currentDiscData || this.state !== P_STATES.PLAYING) return;
+        const index = this.currentDiscData.tracks.findIndex(t => t.file_path === filePath);
+        if (index === -1 || index === this.currentTrackIndex) return;
+        this.currentTrackIndex = index;
+        this.trackOffset = 0;
+        this.playbackStartTime = Date.now();
     }
 
     nextTrack() {
@@ -186,6 +241,16 @@ pause() {
         new TWEEN.Tween(this.toneArm.rotation).to({ y: CONFIG.PLAYER.ANGLE_ARM_REST }, 1000).start();
     }
 
+    // Server's position for the playing track; getProgress() interpolates between updates
+    syncPosition(data) {
+        if (!this.currentDiscData || (this.state !== P_STATES.PLAYING && this.state !== P_STATES.PAUSED)) return;
+        this.syncTrack(data.file_path);
+        const track = this.currentDiscData.tracks[this.currentTrackIndex];
+        if (!track || track.file_path !== data.file_path) return;
+        this.trackOffset = data.position;
+        this.playbackStartTime = Date.now();
+    }
+
     // NEW: Helper to get current playback time for UI
     getProgress() {
         if (this.state !== P_STATES.PLAYING && this.state !== P_STATES.PAUSED) return 0;
@@ -198,6 +263,10 @@ pause() {
     }
 
     update() {
+        // Platter glow follows the music; decays when frames stop arriving
+        if (this.state !== P_STATES.PLAYING) this.level *= 0.9;
+        this.platter.material.emissive.setRGB(this.level * 0.25, this.level * 0.25, this.level * 0.3);
+
         if (this.state === P_STATES.PLAYING && this.discMesh) {
             this.discMesh.rotation.y -= CONFIG.PLAYER.ROTATION_SPEED;
             
@@ -0,0 +1,133 @@
+import os
+import struct
+import base64
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Only the scan-time waveform decodes audio; imported there
+pygame = None
+
+
+class SpectrumAnalyzer:
+    """
+    Turns one block of the playing PCM into a compact binary frame for the
+    visualizer: log-spaced FFT band levels and per-channel RMS, each scaled
+    to one byte. Frame layout (little endian):
+
+        u8 type (FRAME_TYPE), u8 band count, u16 seq, f32 position,
+        u8 rms left, u8 rms right, u8 band[band count]
+    """
+
+    FRAME_TYPE = 1
+    HEADER = struct.Struct("<BBHf")
+    # Samples per FFT; about 46 ms at 44.1 kHz
+    BLOCK = 2048
+    BANDS = 32
+    MIN_FREQ = 40.0
+    # Band levels map FLOOR_DB..0 dBFS onto 0..255
+    FLOOR_DB = -70.0
+
+    def __init__(self, rate: int, channels: int):
+        self.rate = rate
+        self.channels = channels
+        self.seq = 0
+        self.window = np.hanning(self.BLOCK).astype(np.float32)
+        self._scale = 2.0 / self.window.sum()
+
+        # First FFT bin of each band; every band gets at least one bin
+        freqs = np.fft.rfftfreq(self.BLOCK, 1.0 / rate)
+        edges = np.searchsorted(freqs, np.geomspace(self.MIN_FREQ, rate / 2, self.BANDS + 1))
+        starts = np.maximum(edges[:-1], np.arange(self.BANDS) + edges[0])
+        self.band_starts = np.minimum(starts, len(freqs) - 1)
+        self.band_widths = np.diff(np.append(self.band_starts, len(freqs)))
+
+    def frame(self, pcm: bytes, position: float) -> bytes:
+        """pcm is interleaved 16-bit audio, ideally BLOCK frames long."""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        samples = samples[:len(samples) - len(samples) % self.channels].reshape(-1, self.channels)
+        levels = samples.astype(np.float32) / 32768.0
+
+        if not len(levels): levels = np.zeros((1, self.channels), dtype=np.float32)
+
+        rms = np.sqrt(np.mean(levels * levels, axis=0))
+        mono = levels.mean(axis=1)
+        if len(mono) < self.BLOCK: mono = np.pad(mono, (0, self.BLOCK - len(mono)))
+
+        magnitude = np.abs(np.fft.rfft(mono[-self.BLOCK:] * self.window)) * self._scale
+        band_power = np.add.reduceat(magnitude * magnitude, self.band_starts) / self.band_widths
+        band_db = 10.0 * np.log10(np.maximum(band_power, 1e-12))
+        bands = np.clip((band_db - self.FLOOR_DB) * (255.0 / -self.FLOOR_DB), 0, 255).astype(np.uint8)
+
+        rms = np.clip(np.resize(rms, 2) * 255.0, 0, 255).astype(np.uint8)
+        self.seq = (self.seq + 1) & 0xFFFF
+        return self.HEADER.pack(self.FRAME_TYPE, self.BANDS, self.seq, position) + rms.tobytes() + bands.tobytes()
+
+
+# Peaks per track in the scan-time waveform
+WAVEFORM_POINTS = 256
+
+
+# The app process hands waveforms to this one-process pool (see compute_waveform)
+_decoder_pool = None
+_decoder_pool_lock = threading.Lock()
+
+
+# Process whose silent mixer _ensure_decoder opened
+_decoder_pid = None
+
+
+def _ensure_decoder():
+    # Only ever called in a child process, which decodes with a silent mixer of its own. A mixer it
+    # did not open itself (inherited by a fork of the launcher) plays on the sound device: replace it.
+    global pygame, _decoder_pid
+    import pygame
+    if _decoder_pid == os.getpid(): return
+    if pygame.mixer.get_init() is not None: pygame.mixer.quit()
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pygame.mixer.init(frequency=22050, size=-16, channels=1)
+    _decoder_pid = os.getpid()
+
+
+def _run_in_decoder_process(file_path: str, points: int) -> Optional[str]:
+    global _decoder_pool
+    with _decoder_pool_lock:
+        if _decoder_pool is None:
+            # Spawned, not forked: a fork would inherit the AudioEngine's open mixer
+            _decoder_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        return _decoder_pool.submit(compute_waveform, file_path, points).result()
+    except Exception:
+        return None
+
+
+def compute_waveform(file_path, points: int = WAVEFORM_POINTS) -> Optional[str]:
+    """
+    Peak amplitude of `points` equal slices of the track, one byte each,
+    base64 encoded. None without NumPy or when the file cannot be decoded.
+
+    Decoding needs an open pygame mixer. In the app's own process the mixer
+    belongs to the AudioEngine (sound device, playback format), so serial
+    scans and watcher updates decode in a separate process instead.
+    """
+    if np is None: return None
+    if multiprocessing.parent_process() is None:
+        return _run_in_decoder_process(str(file_path), points)
+    try:
+        _ensure_decoder()
+        channels = pygame.mixer.get_init()[2]
+        samples = np.frombuffer(pygame.mixer.Sound(str(file_path)).get_raw(), dtype=np.int16)
+    except Exception:
+        return None
+    frames = len(samples) // channels
+    if frames < points: return None
+
+    amplitude = np.abs(samples[:frames * channels].reshape(frames, channels).astype(np.int32)).max(axis=1)
+    peaks = np.maximum.reduceat(amplitude, np.linspace(0, frames, points, endpoint=False).astype(np.int64))
+    return base64.b64encode((peaks * 255 // 32768).astype(np.uint8).tobytes()).decode("ascii")
@@ -1,78 +1,417 @@
-import pygame
 import threading
 import logging
 import os
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+
+DECODE_SECONDS = metrics.REGISTRY.histogram("vinyl_audio_decode_seconds", "Decoding a track to PCM (cache misses only)")
+COMMAND_SECONDS = metrics.REGISTRY.histogram(
+    "vinyl_audio_command_seconds", "Engine commands from request to done, including time queued", ("action",))
+COMMANDS_COALESCED = metrics.REGISTRY.counter(
+    "vinyl_audio_commands_coalesced_total", "Seeks and volume changes replaced by a newer one before running", ("action",))
+PCM_CACHE = metrics.REGISTRY.counter("vinyl_audio_pcm_cache_total", "Decoded PCM cache lookups", ("result",))
+
+# Imported with the mixer on first playback; a server that never plays never loads it
+pygame = None
+
+class PcmCache:
+    """Decoded tracks as raw mixer-format PCM, least recently used evicted first once over max_bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_path):
+        with self._lock:
+            pcm = self._entries.get(file_path)
+            if pcm is not None: self._entries.move_to_end(file_path)
+            return pcm
+
+    def put(self, file_path, pcm):
+        with self._lock:
+            old = self._entries.pop(file_path, None)
+            if old is not None: self.size -= len(old)
+            self._entries[file_path] = pcm
+            self.size += len(pcm)
+            # The newest entry always stays, even if it alone exceeds the budget
+            while self.size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
 
 class AudioEngine:
-    def __init__(self):
-        # Increased buffer to prevent stutter
-        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
+    """
+    Plays tracks as decoded Sounds on two reserved mixer channels.
+
+    A track is decoded to PCM whole (pygame cannot decode part of a file), so
+    the first play of a track waits for the full decode, about a millisecond
+    per second of MP3 audio; replays and seeks reuse the cached PCM. It is
+    handed to SDL in segments of SEGMENT_SECONDS, each queued with
+    Channel.queue() while the previous one plays, so a seek copies one segment
+    instead of the rest of the track.
+
+    play() takes the rest of the disc as a queue. The next track is decoded in
+    the background while the current one plays and queued behind its last
+    segment, so it starts on the sample the current one ends. With a
+    crossfade it starts on the other channel instead, fading in while the
+    current one fades out.
+
+    play/stop/pause/seek/set_volume only post a command and return a Future;
+    a single command thread runs them in order. A seek or volume change that
+    arrives while the previous one is still waiting replaces it.
+
+    The mixer is opened on the first play, not here, so a server starts
+    without waiting for (or failing on) the sound device.
+    """
+
+    # Commands where only the latest of a burst matters
+    COALESCED = ("seek", "set_volume")
+
+    # How often the watcher polls the mixer while a track is playing
+    WATCH_INTERVAL = 0.02
+    # About three 5-minute tracks at 44.1 kHz 16-bit stereo: the current one, the next and the previous
+    PCM_CACHE_BYTES = 160 * 1024 * 1024
+    # Length of the Sounds a track is played as; the watcher queues each one long before it is due
+    SEGMENT_SECONDS = 10.0
+
+    FREQUENCY = 44100
+    SAMPLE_SIZE = -16
+    CHANNELS = 2
+    # Increased buffer to prevent stutter
+    BUFFER = 4096
+
+    def __init__(self, crossfade=0.0):
+        # The requested format until the mixer is open; SDL may pick another one
+        self.sample_rate = self.FREQUENCY
+        self.channels = self.CHANNELS
+        self._frame_bytes = abs(self.SAMPLE_SIZE) // 8 * self.CHANNELS
+        # The two reserved mixer channels, once the mixer is open
+        self._channels = []
+        self._active = 0
+
         self.is_playing = False
         self._lock = threading.Lock()
         self.volume = 0.5
+        self.crossfade = crossfade
         self.current_file = None
-        pygame.mixer.music.set_volume(self.volume)
+        # Files to play after current_file, in order
+        self.queue = []
+        # Seeks and replays cut a new Sound from cached PCM instead of decoding again
+        self._pcm = PcmCache(self.PCM_CACHE_BYTES)
+        metrics.REGISTRY.gauge("vinyl_audio_pcm_cache_bytes", "Decoded PCM held in memory", function=lambda: self._pcm.size)
+        self._current_pcm = None
+        # Byte offset in _current_pcm up to which segments have been handed to the channel
+        self._queued_end = 0
+        # (first segment, PCM, its end offset) of the next track once decoded
+        self._next = None
+        # Whether _next is queued on the channel behind the current track
+        self._next_queued = False
+        # Position clock: the track was at _offset seconds at monotonic time _started
+        self._offset = 0.0
+        self._started = 0.0
+        self._paused_at = None
+        self._decoder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AudioDecode")
+        self._commands = deque()
+        self._commands_ready = threading.Condition()
+        threading.Thread(target=self._run_commands, name="AudioCommands", daemon=True).start()
+
+        # Listeners get (event, file_path): "advanced" when a queued track starts,
+        # "finished" when the last one ends. Both fire from the watcher thread.
+        self._listeners = []
+        self._state_changed = threading.Condition()
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def _ensure_mixer(self):
+        """Opens the mixer on first use. Called with the lock held."""
+        global pygame
+        if self._channels: return
+        import pygame
+        if pygame.mixer.get_init() is not None:
+            # Opened by other code in this process, possibly on another driver or format
+            pygame.mixer.quit()
+        pygame.mixer.init(frequency=self.FREQUENCY, size=self.SAMPLE_SIZE, channels=self.CHANNELS, buffer=self.BUFFER)
+        rate, size, channels = pygame.mixer.get_init()
+        self.sample_rate = rate
+        self.channels = channels
+        self._frame_bytes = abs(size) // 8 * channels
+        pygame.mixer.set_reserved(2)
+        self._channels = [pygame.mixer.Channel(0), pygame.mixer.Channel(1)]
+        print(f"[AudioEngine] Mixer opened: {rate} Hz, {channels} channels")
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _emit(self, event, file_path):
+        for callback in list(self._listeners):
+            try:
+                callback(event, file_path)
+            except Exception as e:
+                print(f"[AudioEngine] Listener error: {e}")
+
+    def _notify(self):
+        with self._state_changed:
+            self._state_changed.notify_all()
+
+    def _watch(self):
+        # pygame's end event needs the display/event system, which cannot run
+        # next to Tk on every platform, so the mixer is polled instead. The
+        # thread sleeps on a condition whenever nothing is playing.
+        while True:
+            with self._state_changed:
+                while not self.is_playing:
+                    self._state_changed.wait()
+            time.sleep(self.WATCH_INTERVAL)
+            with self._lock:
+                event = self._poll()
+            if event:
+                if event[0] == "advanced": self._preload_next()
+                self._emit(*event)
+
+    def _decode(self, file_path):
+        pcm = self._pcm.get(file_path)
+        PCM_CACHE.inc(result="miss" if pcm is None else "hit")
+        if pcm is None:
+            with metrics.timed(DECODE_SECONDS, os.path.basename(file_path), slow=2.0):
+                pcm = pygame.mixer.Sound(file_path).get_raw()
+            self._pcm.put(file_path, pcm)
+        return pcm
+
+    def _segment(self, pcm, offset):
+        """A Sound of at most SEGMENT_SECONDS of pcm from byte offset, and the offset it ends at."""
+        frame_rate = self.sample_rate * self._frame_bytes
+        end = offset + int(self.SEGMENT_SECONDS * self.sample_rate) * self._frame_bytes
+        # A short tail goes with the segment before it. The last segment also spans the
+        # crossfade, since a sound queued behind a fading channel would play after the fade.
+        if len(pcm) - end < max(self.SEGMENT_SECONDS / 2, self.crossfade + 1.0) * frame_rate:
+            end = len(pcm)
+        return pygame.mixer.Sound(buffer=memoryview(pcm)[offset:end]), end
+
+    def _feed(self, channel):
+        """Queues the current track's next segment once the channel has room. Called with the lock held."""
+        if self._current_pcm is None or self._queued_end >= len(self._current_pcm) or channel.get_queue() is not None:
+            return
+        sound, self._queued_end = self._segment(self._current_pcm, self._queued_end)
+        if channel.get_busy(): channel.queue(sound)
+        # Only if the watcher fell a whole segment behind
+        else: channel.play(sound)
+
+    def _preload_next(self):
+        with self._lock:
+            if not self.queue or self._next is not None: return
+            file_path, current = self.queue[0], self.current_file
+        self._decoder.submit(self._preload, file_path, current)
+
+    def _preload(self, file_path, current):
+        try:
+            pcm = self._decode(file_path)
+            sound, end = self._segment(pcm, 0)
+        except Exception as e:
+            print(f"[AudioEngine] Skipping {os.path.basename(file_path)}: {e}")
+            pcm = sound = None
+        with self._lock:
+            # The queue may have changed while decoding
+            if self.current_file != current or not self.queue or self.queue[0] != file_path: return
+            if sound is None:
+                self.queue.pop(0)
+            else:
+                # The watcher queues it behind the current track's last segment
+                self._next = (sound, pcm, end)
+        if sound is None: self._preload_next()
 
-    def play(self, file_path, start_time=0.0):
+    def _poll(self):
+        """Moves through the queue and returns the event to emit, if any. Called with the lock held."""
+        if not self.is_playing: return None
+        channel = self._channels[self._active]
+        self._feed(channel)
+        if self._next is not None:
+            if self.crossfade > 0:
+                # A segment still queued would play once the fade ends, so the fade waits for it
+                if channel.get_busy() and (self.duration - self.position > self.crossfade or channel.get_queue() is not None):
+                    return None
+                fade_ms = int(self.crossfade * 1000)
+                channel.fadeout(fade_ms)
+                self._active = 1 - self._active
+                incoming = self._channels[self._active]
+                incoming.set_volume(self.volume)
+                incoming.play(self._next[0], fade_ms=fade_ms)
+                started = time.monotonic()
+            elif self._next_queued:
+                if channel.get_queue() is not None: return None
+                # SDL has switched to the queued sound
+                started = self._started + (self.duration - self._offset)
+            elif not channel.get_busy():
+                # The current track ran out before the next one was decoded
+                channel.play(self._next[0])
+                started = time.monotonic()
+            else:
+                if self._queued_end >= len(self._current_pcm) and channel.get_queue() is None:
+                    channel.queue(self._next[0])
+                    self._next_queued = True
+                return None
+            self.current_file = self.queue.pop(0)
+            _, self._current_pcm, self._queued_end = self._next
+            self._next, self._next_queued = None, False
+            self._offset, self._started = 0.0, started
+            self._feed(self._channels[self._active])
+            print(f"[AudioEngine] Advanced to: {os.path.basename(self.current_file)}")
+            return ("advanced", self.current_file)
+
+        if channel.get_busy() or self.queue: return None
+        print("[AudioEngine] Track finished naturally detected.")
+        self.is_playing = False
+        return ("finished", self.current_file)
+
+    def _post(self, action, *args):
+        future = Future()
+        with self._commands_ready:
+            if action in self.COALESCED and self._commands and self._commands[-1][0] == action:
+                replaced = self._commands.pop()[2]
+                if replaced.set_running_or_notify_cancel(): replaced.set_result(None)
+                COMMANDS_COALESCED.inc(action=action)
+            self._commands.append((action, args, future, time.perf_counter()))
+            self._commands_ready.notify()
+        return future
+
+    def _run_commands(self):
+        while True:
+            with self._commands_ready:
+                while not self._commands:
+                    self._commands_ready.wait()
+                action, args, future, posted = self._commands.popleft()
+            # A caller that gave up (a client that disconnected) cancels its Future; the command still runs
+            waited_for = future.set_running_or_notify_cancel()
+            try:
+                result = getattr(self, "_" + action)(*args)
+            except Exception as e:
+                print(f"[AudioEngine] Exception in {action}: {e}")
+                if waited_for: future.set_exception(e)
+            else:
+                if waited_for: future.set_result(result)
+            COMMAND_SECONDS.observe(time.perf_counter() - posted, action=action)
+
+    @property
+    def position(self):
+        if self._paused_at is not None: return self._paused_at
+        if not self.is_playing: return self._offset
+        return self._offset + time.monotonic() - self._started
+
+    @property
+    def duration(self):
+        if self._current_pcm is None: return 0.0
+        return len(self._current_pcm) / (self.sample_rate * self._frame_bytes)
+
+    def get_position(self):
+        """Authoritative playback position of the current track, in seconds."""
+        with self._lock:
+            return {
+                "file_path": self.current_file,
+                "position": round(self.position, 3),
+                "duration": round(self.duration, 3),
+                "playing": self.is_playing,
+                "paused": self._paused_at is not None
+            }
+
+    def pcm_block(self, frames):
+        """(position, PCM) of the `frames` frames leading up to the current position, or None when not playing."""
+        with self._lock:
+            if not self.is_playing or self._current_pcm is None: return None
+            position = self.position
+            end = min(int(position * self.sample_rate), len(self._current_pcm) // self._frame_bytes)
+            start = max(0, end - frames)
+            return position, self._current_pcm[start * self._frame_bytes:end * self._frame_bytes]
+
+    def play(self, file_path, start_time=0.0, queue=None, crossfade=None):
+        """`queue` replaces the files to play afterwards; None keeps the current queue."""
+        return self._post("play", file_path, start_time, queue, crossfade)
+
+    def stop(self):
+        return self._post("stop")
+
+    def pause(self):
+        """Toggles pause; the Future resolves to True if playback is running afterwards."""
+        return self._post("pause")
+
+    def set_volume(self, val):
+        return self._post("set_volume", val)
+
+    def seek(self, timestamp):
+        return self._post("seek", timestamp)
+
+    def _play(self, file_path, start_time=0.0, queue=None, crossfade=None):
         with self._lock:
             try:
                 if not os.path.exists(file_path):
                     print(f"[AudioEngine] ERROR: File not found: {file_path}")
                     return
 
-                # Stop existing playback
-                if pygame.mixer.music.get_busy():
-                    pygame.mixer.music.stop()
-                
                 print(f"[AudioEngine] Loading: {os.path.basename(file_path)}")
-                pygame.mixer.music.load(file_path)
-                pygame.mixer.music.play(loops=0, start=start_time)
-                
-                # Wait a tiny bit for Pygame to actually register the busy state
-                time.sleep(0.1)
-                
+                self._ensure_mixer()
+                if crossfade is not None: self.crossfade = max(0.0, float(crossfade))
+                pcm = self._decode(file_path)
+                offset = min(max(0, int(start_time * self.sample_rate)) * self._frame_bytes, len(pcm))
+                sound, end = self._segment(pcm, offset)
+                # Stopping a channel also drops the sound queued on it
+                for channel in self._channels: channel.stop()
+                self._next_queued = False
+
+                # Seeking within the track keeps the preloaded next one
+                if queue is not None:
+                    self.queue = list(queue)
+                    self._next = None
+
+                channel = self._channels[self._active]
+                channel.set_volume(self.volume)
+                channel.play(sound)
+
                 self.current_file = file_path
+                self._current_pcm, self._queued_end = pcm, end
+                self._feed(channel)
+                self._offset, self._started = float(start_time), time.monotonic()
+                self._paused_at = None
                 self.is_playing = True
             except Exception as e:
                 print(f"[AudioEngine] Exception in play: {e}")
                 self.is_playing = False
+        self._notify()
+        self._preload_next()
 
-    def stop(self):
+    def _stop(self):
         with self._lock:
             print("[AudioEngine] Stopping playback manually.")
-            pygame.mixer.music.stop()
+            for channel in self._channels: channel.stop()
             self.is_playing = False
             self.current_file = None
+            self.queue = []
+            self._current_pcm = None
+            self._next, self._next_queued = None, False
+            self._paused_at = None
 
-    def pause(self):
-        if self.is_playing:
-            pygame.mixer.music.pause()
-            self.is_playing = False
-            print("[AudioEngine] Paused.")
-        else:
-            pygame.mixer.music.unpause()
-            self.is_playing = True
-            print("[AudioEngine] Unpaused.")
+    def _pause(self):
+        with self._lock:
+            if self.is_playing:
+                pygame.mixer.pause()
+                self._paused_at = self.position
+                self.is_playing = False
+                print("[AudioEngine] Paused.")
+            elif self.current_file:
+                pygame.mixer.unpause()
+                self._offset, self._started = self._paused_at or 0.0, time.monotonic()
+                self._paused_at = None
+                self.is_playing = True
+                print("[AudioEngine] Unpaused.")
+        self._notify()
+        return self.is_playing
 
-    def set_volume(self, val):
-        self.volume = float(val)
-        pygame.mixer.music.set_volume(self.volume)
+    def _set_volume(self, val):
+        with self._lock:
+            self.volume = float(val)
+            for channel in self._channels: channel.set_volume(self.volume)
 
-    def seek(self, timestamp):
+    def _seek(self, timestamp):
         if not self.current_file: return
-        self.play(self.current_file, start_time=timestamp)
-
-    def check_track_finished(self):
-        """
-        Checks if playback stopped naturally.
-        Returns True ONLY if we think we are playing but mixer is idle.
-        """
-        if self.is_playing:
-            is_busy = pygame.mixer.music.get_busy()
-            if not is_busy:
-                print("[AudioEngine] Track finished naturally detected.")
-                with self._lock:
-                    self.is_playing = False
-                return True
-        return False
\ No newline at end of file
+        self._play(self.current_file, start_time=timestamp)
@@ -0,0 +1,177 @@
+import os
+import shutil
+import logging
+import mimetypes
+import subprocess
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+
+logger = logging.getLogger("AudioStream")
+
+# mimetypes does not know every audio type on every platform
+MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".m4a": "audio/mp4",
+    ".wav": "audio/wav",
+}
+
+
+def media_type(path) -> str:
+    suffix = Path(path).suffix.lower()
+    return MEDIA_TYPES.get(suffix) or mimetypes.guess_type(str(path))[0] or "application/octet-stream"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive of a single "bytes=" range, or None to serve the
+    whole file (no range, a malformed one, or several). Raises ValueError
+    when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec: return None
+    first, sep, last = (part.strip() for part in spec.partition("-"))
+    if not sep or not (first or last) or not (first or "0").isdigit() or not (last or "0").isdigit(): return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0: raise ValueError("Unsatisfiable suffix range")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if start >= size: raise ValueError("Range starts past the end of the file")
+    end = int(last) if last else size - 1
+    if end < start: return None
+    return start, min(end, size - 1)
+
+
+class StreamResponse(Response):
+    """
+    A file, or one byte range of it. The body goes out with the server's
+    zero-copy sendfile extension when it offers one, and in CHUNK_SIZE reads
+    on a worker thread otherwise.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, path, media_type: str, range_header: str = None, if_range: str = None):
+        self.path = str(path)
+        stat = os.stat(self.path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        headers = {"Accept-Ranges": "bytes", "ETag": etag, "Cache-Control": "no-cache"}
+
+        self.start, self.count, status = 0, size, 200
+        # If-Range: a client resuming a file that changed since gets all of it
+        if range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                byte_range, status = None, 416
+                headers["Content-Range"] = f"bytes */{size}"
+                self.count = 0
+            if byte_range:
+                start, end = byte_range
+                self.start, self.count, status = start, end - start + 1, 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        headers["Content-Length"] = str(self.count)
+        super().__init__(status_code=status, media_type=media_type, headers=headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(),
+                            "offset": self.start, "count": self.count, "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.count
+            while remaining:
+                chunk = await f.read(min(self.CHUNK_SIZE, remaining))
+                if not chunk: break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining:
+                # The file shrank while streaming; end the body where it ends
+                await send({"type": "http.response.body", "body": b""})
+
+
+class Transcoder:
+    """
+    Transcodes tracks with ffmpeg for clients that cannot play the original
+    format. Results are cached on disk under the track id, the source's mtime
+    and the format, so each file is transcoded once however many clients ask;
+    the least recently served files are deleted once the cache outgrows
+    max_bytes.
+    """
+
+    # format: (ffmpeg codec arguments, container, file extension)
+    FORMATS = {
+        "opus": (["-c:a", "libopus", "-b:a", "128k"], "ogg", ".opus"),
+        "mp3": (["-c:a", "libmp3lame", "-q:a", "2"], "mp3", ".mp3"),
+    }
+    # Transcodes of the same file share a lock; a fixed set of them, so unrelated
+    # files only rarely wait on each other and nothing grows per file served
+    LOCK_STRIPES = 64
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, ffmpeg=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg is not None
+
+    def _lock(self, key) -> threading.Lock:
+        return self._locks[hash(key) % self.LOCK_STRIPES]
+
+    def get(self, track_id: str, source, fmt: str) -> Path:
+        """Path of the transcoded file, transcoding first if needed. Blocks; raises on ffmpeg errors."""
+        args, container, ext = self.FORMATS[fmt]
+        target = self.cache_dir / f"{track_id}-{os.stat(source).st_mtime_ns:x}{ext}"
+        # Concurrent requests for the same file wait for one transcode
+        with self._lock(target.name):
+            if target.exists():
+                os.utime(target)
+                return target
+
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            pending = target.with_name(target.name + ".part")
+            logger.info(f"Transcoding {os.path.basename(source)} to {fmt}")
+            subprocess.run(
+                [self.ffmpeg, "-nostdin", "-v", "error", "-y", "-i", str(source), "-vn", *args, "-f", container, str(pending)],
+                check=True, capture_output=True
+            )
+            os.replace(pending, target)
+        self._evict(keep=target)
+        return target
+
+    def _evict(self, keep: Path):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".part"): continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes: break
+            if path == str(keep): continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,326 @@
+"""
+Scanner and server benchmarks on a synthetic library.
+
+    python -m benchmarks.run --albums 200 --out results.json
+    python -m benchmarks.run --albums 200 --compare results.json
+
+Suites:
+    scan         full scan into an empty app_data, rescan with nothing
+                 changed, rescan after touching TOUCH_SHARE of the files
+    covers       render_cover throughput over the library's distinct artwork
+    api          /api/library cold and warm latency, 304 revalidation and
+                 payload size per encoding; one /api/albums page
+    websocket    command round trips (PAUSE -> "paused") per protocol
+
+Results are JSON: {"meta": {...}, "results": {suite: {metric: value}}}.
+Metrics ending in _ms or _s are timings; --compare flags the ones that got
+more than --threshold slower than in the given results file.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import argparse
+import contextlib
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+# The server's audio engine opens the mixer; benchmarks run without a sound card
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from benchmarks.synth_library import generate
+from scanner import Config, LibraryScanner, TagParser, read_artwork, cover_hash, render_cover
+from server_manager import VinylServer
+from event_hub import msgpack
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+SUITES = ("scan", "covers", "api", "websocket")
+# Share of files touched for the incremental rescan
+TOUCH_SHARE = 0.05
+
+
+def timings(samples: List[float]) -> Dict:
+    """Summary of per-call durations in seconds, reported in milliseconds."""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+
+
+def _scan(music_dir, app_data, args) -> Dict:
+    scanner = LibraryScanner(Config(music_dir, app_data, scan_workers=args.workers, waveforms=args.waveforms,
+                                    io_workers=args.io_workers))
+    started = time.perf_counter()
+    for event in scanner.scan_iter(): pass
+    elapsed = time.perf_counter() - started
+    return {"elapsed_s": round(elapsed, 3), "files": event["discovered"], "parsed": event["parsed"],
+            "albums": event["albums_total"], "files_per_sec": round(event["discovered"] / elapsed, 1)}
+
+
+def bench_scan(music_dir, app_data, args) -> Dict:
+    results = {"full": _scan(music_dir, app_data, args)}
+    results["rescan"] = _scan(music_dir, app_data, args)
+
+    files = sorted(p for p in Path(music_dir).rglob("*") if p.suffix.lower() in (".mp3", ".flac"))
+    touched = files[::max(1, round(1 / TOUCH_SHARE))]
+    now = time.time()
+    for path in touched: os.utime(path, (now, now))
+    results["rescan_touched"] = _scan(music_dir, app_data, args)
+    results["rescan_touched"]["touched"] = len(touched)
+    return results
+
+
+def bench_covers(music_dir, work_dir) -> Dict:
+    # One artwork source per album directory, deduplicated by content like the scanner does
+    config = Config(music_dir, work_dir / "covers_app_data")
+    sources = {}
+    for directory in sorted({p.parent for p in Path(music_dir).rglob("*") if p.suffix.lower() in config.AUDIO_EXT}):
+        track = next(p for p in sorted(directory.iterdir()) if p.suffix.lower() in config.AUDIO_EXT)
+        data = read_artwork(track, bool(TagParser.read_tags(track).get("has_embedded_cover")), config.IMAGE_EXT)
+        if data: sources.setdefault(cover_hash(data), data)
+
+    started = time.perf_counter()
+    for cover_id, data in sources.items():
+        render_cover(data, cover_id, config)
+    elapsed = time.perf_counter() - started
+    source_bytes = sum(len(data) for data in sources.values())
+    return {"covers": len(sources), "elapsed_s": round(elapsed, 3),
+            "covers_per_sec": round(len(sources) / elapsed, 2) if elapsed else 0.0,
+            "source_mb_per_sec": round(source_bytes / elapsed / 1e6, 2) if elapsed else 0.0}
+
+
+def bench_api(server: VinylServer, requests: int) -> Dict:
+    from fastapi.testclient import TestClient
+    client = TestClient(server._create_app())
+    server.invalidate_library()
+
+    started = time.perf_counter()
+    response = client.get("/api/library", headers={"Accept-Encoding": "identity"})
+    results = {"library_cold_ms": round((time.perf_counter() - started) * 1000, 3),
+               "library_bytes": {"identity": len(response.content)}}
+    etag = response.headers["etag"]
+
+    for encoding in ("gzip", "br"):
+        response = client.get("/api/library", headers={"Accept-Encoding": encoding})
+        if response.headers.get("content-encoding") == encoding:
+            results["library_bytes"][encoding] = int(response.headers["content-length"])
+
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get("/api/library", headers={"Accept-Encoding": "gzip"})
+        samples.append(time.perf_counter() - started)
+    results["library_warm"] = timings(samples)
+
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get("/api/library", headers={"If-None-Match": etag})
+        samples.append(time.perf_counter() - started)
+    results["library_304"] = timings(samples)
+
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get("/api/albums", params={"limit": 200})
+        samples.append(time.perf_counter() - started)
+    results["albums_page"] = timings(samples)
+    return results
+
+
+def _events(data, protocol) -> list:
+    """Status messages in one server frame; spectrum payloads are skipped."""
+    if isinstance(data, str): return [json.loads(data)]
+    if protocol == "vinyl.json": return []
+    return [m for m in msgpack.unpackb(data, raw=False) if isinstance(m, dict)]
+
+
+async def _round_trips(url, protocol, count) -> List[float]:
+    async with websockets.connect(url, subprotocols=[protocol]) as ws:
+        async def receive_until(status):
+            while not any(m.get("status") == status for m in _events(await ws.recv(), protocol)): pass
+
+        command = msgpack.packb([["PAUSE", None]]) if protocol == "vinyl.msgpack" else json.dumps({"action": "PAUSE"})
+        await receive_until("sync")
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            await ws.send(command)
+            await receive_until("paused")
+            samples.append(time.perf_counter() - started)
+        return samples
+
+
+def bench_websocket(server: VinylServer, count: int) -> Dict:
+    if websockets is None: return {"skipped": "websockets is not installed"}
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        server.port = probe.getsockname()[1]
+    server.start()
+    try:
+        url = f"ws://{server.host}:{server.port}/ws"
+        deadline = time.monotonic() + 10
+        while not (server.uvicorn_server and server.uvicorn_server.started):
+            if time.monotonic() > deadline: raise RuntimeError("Server did not start")
+            time.sleep(0.05)
+        results = {}
+        for protocol in ("vinyl.json", "vinyl.msgpack"):
+            if protocol == "vinyl.msgpack" and msgpack is None:
+                results[protocol] = {"skipped": "msgpack is not installed"}
+                continue
+            results[protocol] = timings(asyncio.run(_round_trips(url, protocol, count)))
+        return results
+    finally:
+        server.stop()
+
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict): flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)): flat[name] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Prints every timing side by side; returns the ones more than `threshold` slower."""
+    now, before = _flatten(current["results"]), _flatten(baseline["results"])
+    regressions = []
+    print(f"{'metric':52} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(now.keys() & before.keys()):
+        if not name.endswith(("_ms", "_s")) or not before[name]: continue
+        change = now[name] / before[name] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:52} {before[name]:12.3f} {now[name]:12.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def _git_commit() -> str:
+    try:
+        root = Path(__file__).resolve().parent.parent
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except OSError:
+        return "unknown"
+
+
+def run_suites(args, suites: List[str], work_dir: Path):
+    """Generates (or reuses) the library and runs the suites; returns (library summary, results)."""
+    music_dir = Path(args.library) if args.library else work_dir / "music"
+    stamp = music_dir / "synth_library.json"
+    params = {"albums": args.albums, "tracks": args.tracks, "seconds": args.seconds, "seed": args.seed}
+    try:
+        stamped = json.loads(stamp.read_text())
+    except (OSError, ValueError):
+        stamped = None
+    if stamped and stamped.get("params") == params:
+        library = stamped["library"]
+    else:
+        # Only a library this script generated is ever deleted; --library could point at real music
+        if not stamp.exists() and music_dir.exists() and any(music_dir.iterdir()):
+            sys.exit(f"{music_dir} is not empty and was not generated by the benchmarks; pass an empty or new directory")
+        shutil.rmtree(music_dir, ignore_errors=True)
+        print(f"Generating {args.albums} albums in {music_dir}...")
+        library = generate(music_dir, args.albums, args.tracks, args.seconds, seed=args.seed)
+        stamp.write_text(json.dumps({"params": params, "library": library}))
+
+    app_data = work_dir / "app_data"
+    results = {}
+    if "scan" in suites:
+        print("scan...")
+        results["scan"] = bench_scan(music_dir, app_data, args)
+    elif "api" in suites or "websocket" in suites:
+        # The server suites need a scanned library
+        _scan(music_dir, app_data, args)
+    if "covers" in suites:
+        print("covers...")
+        results["covers"] = bench_covers(music_dir, work_dir)
+    if "api" in suites or "websocket" in suites:
+        server = VinylServer(str(app_data))
+        server.load_metadata_map()
+        if "api" in suites:
+            print("api...")
+            results["api"] = bench_api(server, args.requests)
+        if "websocket" in suites:
+            print("websocket...")
+            results["websocket"] = bench_websocket(server, args.requests)
+    return library, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the scanner and server benchmarks.")
+    parser.add_argument("--albums", type=int, default=100)
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scan_workers for the scans")
+    parser.add_argument("--io-workers", type=int, help="read-ahead threads for the scans (default: the scanner's)")
+    parser.add_argument("--no-waveforms", dest="waveforms", action="store_false")
+    parser.add_argument("--requests", type=int, default=50, help="samples per HTTP and WebSocket timing")
+    parser.add_argument("--suites", default=",".join(SUITES))
+    parser.add_argument("--library", help="reuse (or create) the synthetic library here instead of a temp dir; "
+                                           "must be new, empty or generated by an earlier run")
+    parser.add_argument("--out", help="write the results JSON here")
+    parser.add_argument("--compare", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown counted as a regression")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown: parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    work_dir = Path(tempfile.mkdtemp(prefix="vinyl-bench-"))
+    try:
+        # The scanner and server print as they go; stdout is kept for the results
+        with contextlib.redirect_stdout(sys.stderr):
+            library, results = run_suites(args, suites, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+            "library": library,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressions: sys.exit(1)
+    elif not args.out:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Synthetic music libraries for the benchmarks.
+
+Albums are laid out as <root>/<artist>/<album>/NN - <title>.(mp3|flac) with
+realistic tags (title, artist, album, track number, year, genre). Cover art
+comes in several sizes: embedded in every track, as a folder image next to
+the tracks, shared between albums (compilations), or missing. Everything is
+derived from the seed, so the same arguments always give the same bytes.
+
+MP3 tracks are real MPEG-1 Layer III frames (silence, 128 kbps), so they
+decode and have a waveform. FLAC tracks carry a valid STREAMINFO with the
+duration but no audio frames: tag and cover work is realistic, decoding
+is not.
+
+    python -m benchmarks.synth_library /tmp/library --albums 200
+"""
+import io
+import json
+import random
+import struct
+import argparse
+from pathlib import Path
+from typing import Dict
+
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, TRCK, TDRC, TCON, APIC
+from mutagen.flac import FLAC, Picture
+from PIL import Image, ImageDraw
+
+WORDS = (
+    "blue night river glass echo velvet static paper ghost summer winter neon golden silent wild "
+    "electric desert ocean garden city morning midnight fire stone silver broken hollow distant "
+    "radio empire heart shadow light motion signal north south crystal thunder honey analog"
+).split()
+GENRES = ["Rock", "Jazz", "Electronic", "Folk", "Hip-Hop", "Classical", "Ambient", "Soul"]
+
+# Edge lengths of the generated artwork, picked per album
+ART_SIZES = (300, 600, 1200, 3000)
+# Share of albums per artwork placement; the rest have embedded art
+FOLDER_ART = 0.2
+SHARED_ART = 0.1
+NO_ART = 0.05
+
+# One silent MPEG-1 Layer III frame: 128 kbps, 44.1 kHz, stereo, 1152 samples
+MP3_FRAME = b"\xff\xfb\x90\x00" + b"\x00" * 413
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+def _name(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def _art(rng: random.Random, size: int, fmt: str = "JPEG") -> bytes:
+    # Gradient, shapes and noise so the encoders do realistic work
+    top, bottom = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(2)]
+    image = Image.linear_gradient("L").resize((size, size))
+    image = Image.merge("RGB", [image.point(lambda v, a=a, b=b: a + (b - a) * v // 255) for a, b in zip(top, bottom)])
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y, r = rng.randrange(size), rng.randrange(size), rng.randrange(size // 20, size // 4)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    noise = Image.frombytes("L", (64, 64), rng.randbytes(64 * 64)).resize((size, size), Image.BICUBIC).convert("RGB")
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **({"quality": 90} if fmt == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def write_mp3(path: Path, tags: Dict, seconds: float, art: bytes = None):
+    path.write_bytes(MP3_FRAME * max(1, int(seconds / MP3_FRAME_SECONDS)))
+    id3 = ID3()
+    id3.add(TIT2(encoding=3, text=tags["title"]))
+    id3.add(TPE1(encoding=3, text=tags["artist"]))
+    id3.add(TALB(encoding=3, text=tags["album"]))
+    id3.add(TRCK(encoding=3, text=f"{tags['track']}/{tags['tracks']}"))
+    id3.add(TDRC(encoding=3, text=str(tags["year"])))
+    id3.add(TCON(encoding=3, text=tags["genre"]))
+    if art: id3.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=art))
+    id3.save(path)
+
+
+def write_flac(path: Path, tags: Dict, seconds: float, art: bytes = None):
+    rate = 44100
+    # STREAMINFO: block sizes, frame sizes, then rate(20) channels-1(3) bits-1(5) total samples(36), md5
+    info = struct.pack(">HH", 4096, 4096) + b"\x00" * 6
+    info += ((rate << 44) | (1 << 41) | (15 << 36) | int(rate * seconds)).to_bytes(8, "big") + b"\x00" * 16
+    path.write_bytes(b"fLaC" + bytes([0x80]) + len(info).to_bytes(3, "big") + info)
+    flac = FLAC(path)
+    flac["title"] = tags["title"]
+    flac["artist"] = tags["artist"]
+    flac["album"] = tags["album"]
+    flac["tracknumber"] = str(tags["track"])
+    flac["date"] = str(tags["year"])
+    flac["genre"] = tags["genre"]
+    if art:
+        picture = Picture()
+        picture.type, picture.mime, picture.data = 3, "image/jpeg", art
+        flac.add_picture(picture)
+    flac.save()
+
+
+def generate(root, albums: int = 100, tracks: int = 10, seconds: float = 30.0,
+             flac_share: float = 0.4, seed: int = 1) -> Dict:
+    """Writes the library under root and returns a summary of what was written."""
+    root = Path(root)
+    rng = random.Random(seed)
+    artists = [_name(rng, rng.randint(1, 3)) for _ in range(max(1, albums // 3))]
+    shared_art = [_art(rng, rng.choice(ART_SIZES)) for _ in range(3)]
+    summary = {"albums": 0, "tracks": 0, "bytes": 0, "art": {"embedded": 0, "folder": 0, "shared": 0, "none": 0}}
+
+    for index in range(albums):
+        artist = rng.choice(artists)
+        album = f"{_name(rng, rng.randint(1, 4))} {index}"
+        directory = root / artist / album
+        directory.mkdir(parents=True, exist_ok=True)
+
+        roll = rng.random()
+        if roll < NO_ART:
+            placement, art = "none", None
+        elif roll < NO_ART + SHARED_ART:
+            placement, art = "shared", rng.choice(shared_art)
+        elif roll < NO_ART + SHARED_ART + FOLDER_ART:
+            placement, art = "folder", None
+            name, fmt = rng.choice([("cover.jpg", "JPEG"), ("folder.jpg", "JPEG"), ("cover.png", "PNG")])
+            (directory / name).write_bytes(_art(rng, rng.choice(ART_SIZES), fmt))
+        else:
+            placement, art = "embedded", _art(rng, rng.choice(ART_SIZES))
+        summary["art"][placement] += 1
+
+        writer, ext = (write_flac, ".flac") if rng.random() < flac_share else (write_mp3, ".mp3")
+        count = max(1, int(rng.gauss(tracks, tracks / 4)))
+        for number in range(1, count + 1):
+            title = _name(rng, rng.randint(1, 5))
+            tags = {"title": title, "artist": artist, "album": album, "track": number, "tracks": count,
+                    "year": rng.randint(1960, 2024), "genre": rng.choice(GENRES)}
+            path = directory / f"{number:02d} - {title}{ext}"
+            writer(path, tags, seconds * rng.uniform(0.5, 1.5), art)
+            summary["tracks"] += 1
+            summary["bytes"] += path.stat().st_size
+        summary["albums"] += 1
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic music library.")
+    parser.add_argument("root")
+    parser.add_argument("--albums", type=int, default=100)
+    parser.add_argument("--tracks", type=int, default=10, help="average tracks per album")
+    parser.add_argument("--seconds", type=float, default=30.0, help="average track length")
+    parser.add_argument("--flac-share", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    summary = generate(args.root, args.albums, args.tracks, args.seconds, args.flac_share, args.seed)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+
+class CoverAtlas:
+    """
+    Packs low-res cover thumbnails into square atlas images, GRID x GRID tiles
+    each, in library order, plus a JSON map from album id to its tile. A crate
+    then needs one or two texture fetches instead of one per album.
+
+    Each atlas is named by a hash of its members and their source files, so a
+    rescan only re-renders atlases whose albums or covers changed; atlases no
+    longer referenced by the map are deleted.
+    """
+
+    TILE = 128
+    GRID = 8
+    # Each tile's cover is drawn inset by PADDING px over a stretched copy of
+    # itself, so mipmapped sampling does not bleed into the neighbouring tile
+    PADDING = 4
+    # Cover variant the tiles are downsampled from
+    SOURCE_SIZE = "256"
+    SAVE_OPTIONS = {"WEBP": {"quality": 85}}
+    MAP_NAME = "atlas.json"
+    VERSION = 1
+
+    def __init__(self, output_base: Path, image_format: str = "WEBP"):
+        self.output_base = Path(output_base)
+        self.atlas_dir = self.output_base / "static" / "covers" / "atlas"
+        self.image_format = image_format
+        self.ext = ".webp" if image_format == "WEBP" else ".png"
+
+    @property
+    def map_path(self) -> Path:
+        return self.atlas_dir / self.MAP_NAME
+
+    def _source(self, album: Dict) -> Path:
+        url = (album.get("cover_variants") or {}).get(self.SOURCE_SIZE) or album.get("cover_url") or ""
+        return self.output_base / url.lstrip("/")
+
+    def _atlas_key(self, members: List[Tuple[str, Path]]) -> str:
+        h = hashlib.md5(f"{self.VERSION}|{self.TILE}|{self.GRID}|{self.PADDING}|{self.image_format}".encode("utf-8"))
+        for album_id, source in members:
+            try:
+                mtime = source.stat().st_mtime_ns
+            except OSError:
+                mtime = 0
+            h.update(f"|{album_id}|{source}|{mtime}".encode("utf-8"))
+        return h.hexdigest()
+
+    def _render(self, members: List[Tuple[str, Path]], output_path: Path):
+        edge = self.TILE * self.GRID
+        inner = self.TILE - 2 * self.PADDING
+        atlas = Image.new("RGB", (edge, edge))
+        for i, (_, source) in enumerate(members):
+            col, row = i % self.GRID, i // self.GRID
+            x, y = col * self.TILE, row * self.TILE
+            try:
+                with Image.open(source) as image:
+                    image = image.convert("RGB")
+                    atlas.paste(image.resize((self.TILE, self.TILE), Image.BILINEAR), (x, y))
+                    atlas.paste(image.resize((inner, inner), Image.LANCZOS), (x + self.PADDING, y + self.PADDING))
+            except Exception as e:
+                logging.warning(f"Atlas tile failed for {source}: {e}")
+        tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+        atlas.save(tmp_path, self.image_format, **self.SAVE_OPTIONS.get(self.image_format, {}))
+        os.replace(tmp_path, output_path)
+
+    def build(self, library: List[Dict]) -> Dict:
+        """
+        (Re)builds the atlases for albums in library order and writes the map:
+        {"tile", "grid", "padding", "atlases": [url, ...], "albums": {id: [atlas, col, row]}}
+        """
+        self.atlas_dir.mkdir(parents=True, exist_ok=True)
+        members = [(album["id"], self._source(album)) for album in library]
+        members = [(album_id, source) for album_id, source in members if source.is_file()]
+
+        per_atlas = self.GRID * self.GRID
+        atlases, albums, rendered = [], {}, 0
+        for start in range(0, len(members), per_atlas):
+            chunk = members[start:start + per_atlas]
+            output_path = self.atlas_dir / f"{self._atlas_key(chunk)}{self.ext}"
+            if not output_path.exists():
+                self._render(chunk, output_path)
+                rendered += 1
+            index = len(atlases)
+            atlases.append(f"/static/covers/atlas/{output_path.name}")
+            for i, (album_id, _) in enumerate(chunk):
+                albums[album_id] = [index, i % self.GRID, i // self.GRID]
+
+        atlas_map = {
+            "version": self.VERSION, "tile": self.TILE, "grid": self.GRID, "padding": self.PADDING,
+            "atlases": atlases, "albums": albums
+        }
+        tmp_path = self.map_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(atlas_map, f)
+        os.replace(tmp_path, self.map_path)
+
+        live = {url.rsplit("/", 1)[1] for url in atlases} | {self.MAP_NAME}
+        for entry in os.scandir(self.atlas_dir):
+            if entry.name not in live: os.remove(entry.path)
+
+        logging.info(f"Cover atlases: {len(atlases)} total, {rendered} rendered")
+        return atlas_map
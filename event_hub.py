@@ -0,0 +1,168 @@
+import asyncio
+import json
+import struct
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger("EventHub")
+
+MESSAGES_SENT = metrics.REGISTRY.counter("vinyl_ws_messages_sent_total", "Messages written to WebSocket clients", ("protocol",))
+FRAMES_SENT = metrics.REGISTRY.counter("vinyl_ws_frames_sent_total", "WebSocket frames written to clients", ("protocol",))
+MESSAGES_DROPPED = metrics.REGISTRY.counter("vinyl_ws_messages_dropped_total", "Messages dropped because a client's queue was full")
+
+
+class JsonCodec:
+    """The original protocol: one JSON text frame per message, binary payloads as raw binary frames."""
+
+    subprotocol = "vinyl.json"
+    batched = False
+
+    @staticmethod
+    def encode(message):
+        return message if isinstance(message, bytes) else json.dumps(message)
+
+    @staticmethod
+    def decode(data) -> List[Tuple[str, dict]]:
+        cmd = json.loads(data)
+        return [(cmd.get("action"), cmd.get("payload"))]
+
+
+class MsgpackCodec:
+    """
+    Every frame is a MessagePack array. Client -> server: [[action, payload], ...];
+    server -> client: messages (maps) and binary payloads (bin), in order.
+    """
+
+    subprotocol = "vinyl.msgpack"
+    batched = True
+
+    @staticmethod
+    def encode(message) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    @staticmethod
+    def frame(encoded: List[bytes]) -> bytes:
+        # Messages are packed once per publish; a batch only adds the array header
+        count = len(encoded)
+        header = bytes([0x90 | count]) if count < 16 else b"\xdc" + struct.pack(">H", count)
+        return header + b"".join(encoded)
+
+    @staticmethod
+    def decode(data) -> List[Tuple[str, dict]]:
+        if isinstance(data, str): return JsonCodec.decode(data)
+        return [(action, payload) for action, payload in msgpack.unpackb(data, raw=False)]
+
+
+# Preferred first; msgpack is optional
+CODECS = [codec for codec in (MsgpackCodec if msgpack else None, JsonCodec) if codec]
+
+
+def negotiate(requested: List[str]):
+    """Codec for the client's offered subprotocols; JSON for clients that offer none."""
+    for codec in CODECS:
+        if codec.subprotocol in requested: return codec
+    return JsonCodec
+
+
+class EventHub:
+    """
+    Fans server events out to every connected WebSocket client.
+
+    Each client gets its own bounded queue drained by a writer task, so a slow
+    or stalled tab never delays the others; when its queue is full the oldest
+    message is dropped. A message is encoded once per codec, not per client,
+    and batched codecs send everything queued since the last write as one
+    frame. publish() and publish_binary() may be called from any thread.
+    """
+
+    QUEUE_SIZE = 256
+    # Messages per frame for batched codecs
+    MAX_BATCH = 64
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Dict[object, Tuple[asyncio.Queue, type]] = {}
+        self._writers: Dict[object, asyncio.Task] = {}
+
+    def __len__(self):
+        return len(self._clients)
+
+    async def register(self, websocket, codec=JsonCodec):
+        self.loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._clients[websocket] = (queue, codec)
+        self._writers[websocket] = asyncio.create_task(self._writer(websocket, queue, codec))
+
+    def unregister(self, websocket):
+        self._clients.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer and writer is not asyncio.current_task(): writer.cancel()
+
+    async def _writer(self, websocket, queue: asyncio.Queue, codec):
+        try:
+            while True:
+                encoded = await queue.get()
+                if codec.batched:
+                    batch = [encoded]
+                    while not queue.empty() and len(batch) < self.MAX_BATCH:
+                        batch.append(queue.get_nowait())
+                    await websocket.send_bytes(codec.frame(batch))
+                    MESSAGES_SENT.inc(len(batch), protocol=codec.subprotocol)
+                elif isinstance(encoded, bytes):
+                    await websocket.send_bytes(encoded)
+                    MESSAGES_SENT.inc(protocol=codec.subprotocol)
+                else:
+                    await websocket.send_text(encoded)
+                    MESSAGES_SENT.inc(protocol=codec.subprotocol)
+                FRAMES_SENT.inc(protocol=codec.subprotocol)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Dropping client: {e}")
+            self.unregister(websocket)
+
+    def _enqueue(self, websocket, encoded):
+        queue = self._clients[websocket][0]
+        if queue.full():
+            queue.get_nowait()
+            MESSAGES_DROPPED.inc()
+        queue.put_nowait(encoded)
+
+    def _fanout(self, message, exclude=None):
+        encoded = {}
+        for websocket, (_, codec) in list(self._clients.items()):
+            if websocket is exclude: continue
+            if codec not in encoded: encoded[codec] = codec.encode(message)
+            self._enqueue(websocket, encoded[codec])
+
+    def send(self, websocket, message: dict):
+        """Queues a message for one client (call from the event loop)."""
+        client = self._clients.get(websocket)
+        if client: self._enqueue(websocket, client[1].encode(message))
+
+    def publish(self, message: dict, exclude=None):
+        """Queues a message for every client except `exclude`. Safe to call from any thread."""
+        if self.loop is None or not self._clients: return
+        self._dispatch(message, exclude)
+
+    def publish_binary(self, data: bytes, exclude=None):
+        """Like publish(), for an opaque binary payload."""
+        if self.loop is None or not self._clients: return
+        self._dispatch(bytes(data), exclude)
+
+    def _dispatch(self, message, exclude):
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._fanout(message, exclude)
+        else:
+            self.loop.call_soon_threadsafe(self._fanout, message, exclude)
@@ -0,0 +1,149 @@
+"""
+Scanning and serving without the Tk launcher, for a home server with no display.
+
+    python headless.py scan /music
+    python headless.py serve --host 0.0.0.0 --music-dir /music --watch
+
+Each command imports only what it uses: `scan` never loads the web stack, and
+`serve` never loads customtkinter or the scanner unless it scans or watches.
+The server accepts connections before the library is loaded and opens the
+sound device on the first PLAY. Ctrl+C or SIGTERM shuts it down cleanly.
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+
+
+def _print_progress(event):
+    phase = event["phase"]
+    if phase == "discover":
+        text = f"Finding files... {event['discovered']}"
+    elif phase == "tags":
+        text = f"Reading tags: {event['processed']}/{event['discovered']} ({event['files_per_sec']:.0f} files/s)"
+        if event["failed"]: text += f", {event['failed']} failed"
+    elif phase == "albums":
+        text = f"Saving albums: {event['albums']}/{event['albums_total']}"
+    elif phase == "done":
+        text = f"Done: {event['albums_total']} albums in {event['elapsed']:.1f}s"
+    elif phase == "cancelled":
+        text = "Scan cancelled"
+    else:
+        return
+    print(f"[Scan] {text}", flush=True)
+
+
+def make_scanner(music_dir, app_data_dir, workers=1, io_workers=None):
+    from scanner import Config, LibraryScanner
+    return LibraryScanner(Config(music_dir, app_data_dir, scan_workers=workers, io_workers=io_workers))
+
+
+def run_scan(scanner, on_event=None) -> bool:
+    """Full scan, printing progress; True when it ran to the end."""
+    phase = None
+    try:
+        # Events come at the scanner's progress rate, not once per file
+        for event in scanner.scan_iter():
+            _print_progress(event)
+            phase = event["phase"]
+            if on_event: on_event(event)
+    except KeyboardInterrupt:
+        print("[Scan] Interrupted", flush=True)
+        return False
+    return phase == "done"
+
+
+def cmd_scan(args):
+    if not os.path.isdir(args.music_dir):
+        sys.exit(f"Not a directory: {args.music_dir}")
+    return 0 if run_scan(make_scanner(args.music_dir, args.app_data, args.workers, args.io_workers)) else 1
+
+
+def cmd_serve(args):
+    if args.no_audio:
+        # Streaming-only hosts: the mixer opens on SDL's silent driver instead of failing
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    if (args.scan or args.watch) and not (args.music_dir and os.path.isdir(args.music_dir)):
+        sys.exit("--scan and --watch need --music-dir")
+
+    started = time.perf_counter()
+    from server_manager import VinylServer
+    server = VinylServer(args.app_data, host=args.host, port=args.port)
+    print(f"[Server] Loaded in {time.perf_counter() - started:.2f}s, starting on http://{args.host}:{args.port}/", flush=True)
+
+    scan_lock = threading.Lock()
+    scanner = scan_thread = watcher = None
+
+    if args.scan:
+        scanner = make_scanner(args.music_dir, args.app_data, args.workers, args.io_workers)
+
+        def scan():
+            with scan_lock:
+                if run_scan(scanner, lambda event: server.broadcast({"status": "scan_progress", **event})):
+                    server.load_metadata_map()
+        scan_thread = threading.Thread(target=scan, name="Scan")
+        scan_thread.start()
+
+    if args.watch:
+        from library_watcher import LibraryWatcher
+        watch_scanner = make_scanner(args.music_dir, args.app_data)
+
+        def on_changes(paths):
+            with scan_lock:
+                delta = watch_scanner.update_files(paths)
+            server.apply_library_delta(delta)
+
+        watcher = LibraryWatcher(args.music_dir, on_changes, watch_scanner.cfg.AUDIO_EXT)
+        watcher.start()
+
+    # uvicorn handles SIGINT/SIGTERM itself, drains connections and then re-raises the signal
+    # with the previous handlers: KeyboardInterrupt, or this SystemExit, so the cleanup below runs
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve(log_level=args.log_level)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher:
+            watcher.stop()
+            watch_scanner.flush_exports()
+        if scan_thread:
+            # Stops at the next file or album batch; what was written so far stays consistent
+            scanner.cancel()
+            scan_thread.join()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vinyl Visualizer without the desktop launcher.")
+    parser.add_argument("--app-data", default=os.path.abspath("./app_data"),
+                        help="library, covers and frontend (default: ./app_data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="scan a music directory into the library and exit")
+    scan.add_argument("music_dir")
+    scan.add_argument("--workers", type=int, default=os.cpu_count(), help="scan processes (default: one per core)")
+    scan.add_argument("--io-workers", type=int, help="files read ahead of the parsers at once; raise for network mounts, 0 for none")
+    scan.set_defaults(func=cmd_scan)
+
+    serve = commands.add_parser("serve", help="run the web server until interrupted")
+    serve.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to serve other machines on the network")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--music-dir", help="music directory for --scan and --watch")
+    serve.add_argument("--scan", action="store_true", help="rescan the music directory in the background after starting")
+    serve.add_argument("--watch", action="store_true", help="apply changes in the music directory while serving")
+    serve.add_argument("--workers", type=int, default=os.cpu_count(), help="scan processes for --scan")
+    serve.add_argument("--io-workers", type=int, help="files read ahead of the parsers at once; raise for network mounts, 0 for none")
+    serve.add_argument("--no-audio", action="store_true", help="no local playback (no sound device); streaming still works")
+    serve.add_argument("--log-level", default="info", choices=["critical", "error", "warning", "info", "debug"])
+    serve.set_defaults(func=cmd_serve)
+
+    args = parser.parse_args(argv)
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,451 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class LibraryStore:
+    """
+    Indexed SQLite (WAL) copy of the library. A scan writes it in batches of
+    albums, one transaction each (put_albums), then drops the albums it no
+    longer found (retain_albums); a cancelled scan only renumbers, keeping
+    albums it has not reached. Readers never see a half-written album, but
+    mid-scan they see the batches written so far next to the previous
+    versions of the rest. Watcher updates go through update_albums. The
+    server reads it without parsing the whole collection.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS albums (
+            id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            type TEXT,
+            cover_id TEXT,
+            cover_url TEXT,
+            cover_variants TEXT,
+            accent_color TEXT
+        );
+        CREATE TABLE IF NOT EXISTS discs (
+            album_id TEXT NOT NULL REFERENCES albums(id) ON DELETE CASCADE,
+            disc_number INTEGER NOT NULL,
+            PRIMARY KEY (album_id, disc_number)
+        );
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            album_id TEXT NOT NULL REFERENCES albums(id) ON DELETE CASCADE,
+            disc_number INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            duration REAL,
+            duration_str TEXT,
+            file_path TEXT NOT NULL,
+            waveform BLOB,
+            track_id TEXT
+        );
+    """
+    # Created after MIGRATIONS, since an older store only gets some of the indexed columns there
+    INDEXES = """
+        CREATE INDEX IF NOT EXISTS idx_albums_position ON albums(position);
+        CREATE INDEX IF NOT EXISTS idx_albums_artist_position ON albums(artist COLLATE NOCASE, position);
+        CREATE INDEX IF NOT EXISTS idx_albums_title_position ON albums(title COLLATE NOCASE, position);
+        CREATE INDEX IF NOT EXISTS idx_tracks_album ON tracks(album_id, disc_number, position);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_file_path ON tracks(file_path);
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tracks_track_id ON tracks(track_id);
+    """
+
+    # Sort keys accepted by album_page; position is the scanner's artist/title order
+    SORT_COLUMNS = {"position": None, "artist": "artist", "title": "title"}
+    SUMMARY_FIELDS = ("id", "title", "artist", "cover_url", "cover_variants", "accent_color")
+    # Columns added after the first release (SCHEMA declares them too), created on stores that predate them
+    MIGRATIONS = {"albums": {"cover_variants": "TEXT", "cover_id": "TEXT"}, "tracks": {"waveform": "BLOB", "track_id": "TEXT"}}
+    # Cover edge length used where a thumbnail is enough (launcher, track map)
+    THUMB_SIZE = "64"
+    # Distance between neighbouring album positions after a scan, so a watcher
+    # update can slot an album in without moving the rest of the library
+    POSITION_GAP = 1 << 16
+    # Albums read per query while exporting library.json
+    EXPORT_PAGE = 200
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._schema_ready = False
+
+    def exists(self) -> bool:
+        return self.db_path.exists()
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation: WAL lets the server keep
+        # reading while a scan commits, and no connection crosses threads.
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            if not self._schema_ready:
+                self._ensure_schema(conn)
+                self._schema_ready = True
+            yield conn
+        finally:
+            conn.close()
+
+    def _ensure_schema(self, conn):
+        conn.executescript(self.SCHEMA)
+        for table, columns in self.MIGRATIONS.items():
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for column, decl in columns.items():
+                if column not in existing: conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        # Tracks stored before track ids existed
+        missing = conn.execute("SELECT id, file_path FROM tracks WHERE track_id IS NULL").fetchall()
+        if missing:
+            with conn:
+                conn.executemany("UPDATE tracks SET track_id = ? WHERE id = ?", [(self.track_id(row["file_path"]), row["id"]) for row in missing])
+        conn.executescript(self.INDEXES)
+
+    @staticmethod
+    def track_id(file_path: str) -> str:
+        """Stable id of a track: the same file keeps it across rescans."""
+        return hashlib.md5(file_path.encode("utf-8")).hexdigest()[:16]
+
+    def replace_library(self, library_list: List[Dict]):
+        """Swaps the whole library in a single transaction."""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            with conn:
+                conn.execute("DELETE FROM tracks")
+                conn.execute("DELETE FROM discs")
+                conn.execute("DELETE FROM albums")
+                for position, album in enumerate(library_list):
+                    self._insert_album(conn, album, position * self.POSITION_GAP)
+
+    def update_albums(self, albums: List[Dict], removed_ids: List[str] = ()):
+        """
+        Upserts and deletes individual albums in one transaction, keeping the
+        library order: each album goes into the gap between its neighbours, so
+        the rest of the library keeps its positions unless a gap is used up.
+        """
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            with conn:
+                kept = self._kept_waveforms(conn, albums)
+                self._delete_albums(conn, [album["id"] for album in albums] + list(removed_ids))
+                self._release_tracks(conn, albums)
+                for album in albums:
+                    position = self._free_position(conn, album)
+                    if position is None:
+                        self._renumber(conn)
+                        position = self._free_position(conn, album)
+                    self._insert_album(conn, album, position, kept)
+
+    def put_albums(self, positioned: List[Tuple[int, Dict]]):
+        """Writes (position, album) pairs in one transaction, replacing earlier versions of the same ids."""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            with conn:
+                kept = self._kept_waveforms(conn, [album for _, album in positioned])
+                self._delete_albums(conn, [album["id"] for _, album in positioned])
+                self._release_tracks(conn, [album for _, album in positioned])
+                for position, album in positioned:
+                    self._insert_album(conn, album, position * self.POSITION_GAP, kept)
+
+    def retain_albums(self, album_ids: set):
+        """Deletes every album not in album_ids and closes the gaps in positions."""
+        if not self.exists(): return
+        with self._connect() as conn:
+            with conn:
+                stale = [row["id"] for row in conn.execute("SELECT id FROM albums") if row["id"] not in album_ids]
+                self._delete_albums(conn, stale)
+                if stale: self._renumber(conn)
+
+    def renumber(self):
+        """Restores the library order after a partial rewrite (a cancelled scan)."""
+        if not self.exists(): return
+        with self._connect() as conn:
+            with conn:
+                self._renumber(conn)
+
+    @staticmethod
+    def _delete_albums(conn, album_ids):
+        params = [(album_id,) for album_id in album_ids]
+        conn.executemany("DELETE FROM tracks WHERE album_id = ?", params)
+        conn.executemany("DELETE FROM discs WHERE album_id = ?", params)
+        conn.executemany("DELETE FROM albums WHERE id = ?", params)
+
+    def _release_tracks(self, conn, albums: List[Dict]):
+        """
+        Deletes the stored rows of tracks the albums are about to take over: a retagged
+        file moves to another album, possibly one written earlier in the same scan.
+        Discs and albums left without tracks go too.
+        """
+        track_ids = [(self.track_id(t["file_path"]),) for album in albums for disc in album.get("discs", []) for t in disc["tracks"]]
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS released (album_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM released")
+        conn.executemany("INSERT OR IGNORE INTO released SELECT album_id FROM tracks WHERE track_id = ?", track_ids)
+        conn.executemany("DELETE FROM tracks WHERE track_id = ?", track_ids)
+        conn.execute("DELETE FROM discs WHERE album_id IN (SELECT album_id FROM released) AND NOT EXISTS "
+                     "(SELECT 1 FROM tracks WHERE tracks.album_id = discs.album_id AND tracks.disc_number = discs.disc_number)")
+        conn.execute("DELETE FROM albums WHERE id IN (SELECT album_id FROM released) AND NOT EXISTS "
+                     "(SELECT 1 FROM tracks WHERE tracks.album_id = albums.id)")
+
+    @staticmethod
+    def _sort_key(album) -> Tuple[str, str]:
+        # Same order the scanner writes: artist, then title, case-insensitive
+        return album["artist"].lower(), album["title"].lower()
+
+    @classmethod
+    def _renumber(cls, conn):
+        rows = conn.execute("SELECT id, artist, title FROM albums ORDER BY position").fetchall()
+        rows.sort(key=cls._sort_key)
+        conn.executemany("UPDATE albums SET position = ? WHERE id = ?", [(i * cls.POSITION_GAP, r["id"]) for i, r in enumerate(rows)])
+
+    def _free_position(self, conn, album: Dict) -> Optional[int]:
+        """
+        A position between the last album that sorts with or before `album` and
+        the first one after it, found by bisecting positions (each probe is one
+        index lookup); None when the two are adjacent.
+        """
+        key = self._sort_key(album)
+        low, high = conn.execute("SELECT MIN(position), MAX(position) FROM albums").fetchone()
+        if low is None: return 0
+        high += 1
+        # The first album at or after `high` sorts after key; none at or after `low` is known to
+        while low < high:
+            middle = (low + high) // 2
+            row = conn.execute("SELECT artist, title FROM albums WHERE position >= ? ORDER BY position LIMIT 1", (middle,)).fetchone()
+            if row is None or self._sort_key(row) > key: high = middle
+            else: low = middle + 1
+        after = conn.execute("SELECT MIN(position) FROM albums WHERE position >= ?", (high,)).fetchone()[0]
+        before = conn.execute("SELECT MAX(position) FROM albums WHERE position < ?", (high,)).fetchone()[0]
+        if after is None: return before + self.POSITION_GAP
+        if before is None: return after - self.POSITION_GAP
+        return (before + after) // 2 if after - before > 1 else None
+
+    def _kept_waveforms(self, conn, albums: List[Dict]) -> Dict[str, bytes]:
+        """Stored waveforms of the tracks that come without one (their files were not decoded again), by track id."""
+        kept = {}
+        for album in albums:
+            for disc in album.get("discs", []):
+                for t in disc["tracks"]:
+                    if t.get("waveform"): continue
+                    track_id = self.track_id(t["file_path"])
+                    row = conn.execute("SELECT waveform FROM tracks WHERE track_id = ? AND waveform IS NOT NULL", (track_id,)).fetchone()
+                    if row: kept[track_id] = row[0]
+        return kept
+
+    def _insert_album(self, conn, album: Dict, position: int, kept_waveforms: Dict[str, bytes] = None):
+        conn.execute(
+            "INSERT INTO albums (id, position, title, artist, type, cover_id, cover_url, cover_variants, accent_color) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (album["id"], position, album["title"], album["artist"], album.get("type"), album.get("cover_id"),
+             album.get("cover_url"), json.dumps(album.get("cover_variants") or {}), album.get("accent_color"))
+        )
+        for disc in album.get("discs", []):
+            conn.execute("INSERT INTO discs (album_id, disc_number) VALUES (?, ?)", (album["id"], disc["disc_number"]))
+            conn.executemany(
+                "INSERT INTO tracks (album_id, disc_number, position, title, duration, duration_str, file_path, track_id, waveform) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(album["id"], disc["disc_number"], i, t["title"], t["duration"], t["duration_str"], t["file_path"], self.track_id(t["file_path"]),
+                  base64.b64decode(t["waveform"]) if t.get("waveform") else (kept_waveforms or {}).get(self.track_id(t["file_path"])))
+                 for i, t in enumerate(disc["tracks"])]
+            )
+
+    def _attach_discs(self, conn, albums: Dict[str, Dict], album_ids: List[str] = None):
+        where, params = (f"WHERE album_id IN ({','.join('?' * len(album_ids))})", tuple(album_ids)) if album_ids else ("", ())
+        discs = {}
+        for row in conn.execute(f"SELECT album_id, disc_number FROM discs {where} ORDER BY album_id, disc_number", params):
+            disc = discs[(row["album_id"], row["disc_number"])] = {"disc_number": row["disc_number"], "tracks": []}
+            albums[row["album_id"]]["discs"].append(disc)
+        for row in conn.execute(
+            "SELECT album_id, disc_number, title, duration, duration_str, file_path, track_id FROM tracks "
+            f"{where} ORDER BY album_id, disc_number, position", params
+        ):
+            discs[(row["album_id"], row["disc_number"])]["tracks"].append({
+                "id": row["track_id"],
+                "title": row["title"],
+                "duration": row["duration"],
+                "duration_str": row["duration_str"],
+                "file_path": row["file_path"]
+            })
+
+    @staticmethod
+    def _album_from_row(row) -> Dict:
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "artist": row["artist"],
+            "cover_id": row["cover_id"],
+            "cover_url": row["cover_url"],
+            "cover_variants": json.loads(row["cover_variants"] or "{}"),
+            "accent_color": row["accent_color"],
+            "type": row["type"],
+            "discs": []
+        }
+
+    @classmethod
+    def _summary_from_row(cls, row) -> Dict:
+        summary = {field: row[field] for field in cls.SUMMARY_FIELDS}
+        summary["cover_variants"] = json.loads(summary["cover_variants"] or "{}")
+        return summary
+
+    def load_library(self) -> List[Dict]:
+        """Returns the library in the same shape as library.json."""
+        if not self.exists(): return []
+        with self._connect() as conn:
+            albums = {}
+            for row in conn.execute("SELECT id, title, artist, type, cover_id, cover_url, cover_variants, accent_color FROM albums ORDER BY position"):
+                albums[row["id"]] = self._album_from_row(row)
+            self._attach_discs(conn, albums)
+        return list(albums.values())
+
+    def get_album(self, album_id: str) -> Optional[Dict]:
+        """One album with its discs and tracks, as stored in library.json."""
+        if not self.exists(): return None
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, title, artist, type, cover_id, cover_url, cover_variants, accent_color FROM albums WHERE id = ?", (album_id,)).fetchone()
+            if row is None: return None
+            albums = {album_id: self._album_from_row(row)}
+            self._attach_discs(conn, albums, [album_id])
+        return albums[album_id]
+
+    @staticmethod
+    def _encode_cursor(value, position: int) -> str:
+        raw = json.dumps([value, position]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        value, position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, int(position)
+
+    def album_page(self, sort: str = "position", descending: bool = False, cursor: str = None, limit: int = 200) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Album summaries (no discs or tracks) using keyset pagination on
+        (sort column, position). Returns the page and the cursor for the next
+        one, or None on the last page. Raises ValueError on a bad sort or cursor.
+        """
+        if sort not in self.SORT_COLUMNS: raise ValueError(f"Unknown sort: {sort}")
+        if not self.exists(): return [], None
+
+        column = self.SORT_COLUMNS[sort]
+        direction, op = ("DESC", "<") if descending else ("ASC", ">")
+        where, params = "", []
+        if cursor:
+            try:
+                value, position = self._decode_cursor(cursor)
+            except Exception:
+                raise ValueError("Invalid cursor")
+            if column:
+                where = f"WHERE ({column} COLLATE NOCASE, position) {op} (?, ?)"
+                params = [value, position]
+            else:
+                where = f"WHERE position {op} ?"
+                params = [position]
+        order = f"{column} COLLATE NOCASE {direction}, position {direction}" if column else f"position {direction}"
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, position, title, artist, cover_url, cover_variants, accent_color FROM albums {where} ORDER BY {order} LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = self._encode_cursor(last[column] if column else None, last["position"])
+        return [self._summary_from_row(row) for row in rows], next_cursor
+
+    def album_summaries(self) -> List[Dict]:
+        """Every album summary in library order."""
+        if not self.exists(): return []
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, title, artist, cover_url, cover_variants, accent_color FROM albums ORDER BY position").fetchall()
+        return [self._summary_from_row(row) for row in rows]
+
+    def cover_ids(self, among: set = None) -> set:
+        """Every cover id some album refers to; only those in `among` when given."""
+        if not self.exists(): return set()
+        with self._connect() as conn:
+            if among is None:
+                return {row[0] for row in conn.execute("SELECT DISTINCT cover_id FROM albums WHERE cover_id IS NOT NULL")}
+            return {cover_id for cover_id in among if conn.execute("SELECT 1 FROM albums WHERE cover_id = ? LIMIT 1", (cover_id,)).fetchone()}
+
+    def cover_urls(self) -> set:
+        """Every cover_url some album refers to."""
+        if not self.exists(): return set()
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute("SELECT DISTINCT cover_url FROM albums WHERE cover_url IS NOT NULL")}
+
+    def album_count(self) -> int:
+        if not self.exists(): return 0
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM albums").fetchone()[0]
+
+    def album_waveforms(self, album_id: str) -> Dict[str, str]:
+        """file_path -> base64 waveform for the album's tracks that have one. Kept out of load_library()."""
+        if not self.exists(): return {}
+        with self._connect() as conn:
+            rows = conn.execute("SELECT file_path, waveform FROM tracks WHERE album_id = ? AND waveform IS NOT NULL", (album_id,))
+            return {row["file_path"]: base64.b64encode(row["waveform"]).decode("ascii") for row in rows}
+
+    def track_path(self, track_id: str) -> Optional[str]:
+        """File path of a track id, or None if no track has it."""
+        if not self.exists(): return None
+        with self._connect() as conn:
+            row = conn.execute("SELECT file_path FROM tracks WHERE track_id = ?", (track_id,)).fetchone()
+        return row["file_path"] if row else None
+
+    def track_cover_map(self) -> Dict[str, str]:
+        """file_path -> thumbnail cover url for every track, without loading the album tree."""
+        if not self.exists(): return {}
+        with self._connect() as conn:
+            rows = conn.execute("SELECT t.file_path, a.cover_url, a.cover_variants FROM tracks t JOIN albums a ON a.id = t.album_id")
+            return {row["file_path"]: self.thumbnail_url(row["cover_url"], json.loads(row["cover_variants"] or "{}")) for row in rows}
+
+    @classmethod
+    def thumbnail_url(cls, cover_url: Optional[str], variants: Dict[str, str]) -> str:
+        return variants.get(cls.THUMB_SIZE) or cover_url or ""
+
+    def export_json(self, json_path):
+        """
+        Writes the legacy library.json for tools that still read it, a page of
+        albums at a time so the export never holds the whole library. The
+        output is what json.dump(load_library(), f, indent=4) would write.
+        """
+        json_path = Path(json_path)
+        tmp_path = json_path.with_name(json_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            written = 0
+            for page in self._album_pages():
+                for album in page:
+                    f.write((",\n    " if written else "[\n    ") + json.dumps(album, indent=4).replace("\n", "\n    "))
+                    written += 1
+            f.write("\n]" if written else "[]")
+        os.replace(tmp_path, json_path)
+
+    def _album_pages(self) -> Iterator[List[Dict]]:
+        """The library in position order, EXPORT_PAGE albums per list."""
+        if not self.exists(): return
+        last = (-1, "")
+        while True:
+            with self._connect() as conn:
+                albums = {}
+                for row in conn.execute(
+                    "SELECT id, title, artist, type, cover_id, cover_url, cover_variants, accent_color, position FROM albums "
+                    "WHERE (position, id) > (?, ?) ORDER BY position, id LIMIT ?", (*last, self.EXPORT_PAGE)
+                ):
+                    albums[row["id"]] = self._album_from_row(row)
+                    last = (row["position"], row["id"])
+                if not albums: return
+                self._attach_discs(conn, albums, list(albums))
+            yield list(albums.values())
+
+    def import_json(self, json_path):
+        """Seeds the store from a library.json written before the store existed."""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            self.replace_library(json.load(f))
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Callable, Iterable, Set
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger("LibraryWatcher")
+
+
+class _EventForwarder(FileSystemEventHandler):
+    def __init__(self, notify: Callable[[str, bool], None]):
+        self.notify = notify
+
+    def on_any_event(self, event):
+        if event.event_type in ("opened", "closed_no_write"): return
+        # A directory "modified" only means its listing changed; the entries themselves report separately
+        if event.is_directory and event.event_type == "modified": return
+        self.notify(event.src_path, event.is_directory)
+        dest = getattr(event, "dest_path", None)
+        if dest: self.notify(dest, event.is_directory)
+
+
+class LibraryWatcher:
+    """
+    Watches the music directory and reports changed paths in debounced batches.
+
+    Uses watchdog (inotify on Linux, ReadDirectoryChangesW on Windows, FSEvents
+    on macOS) when installed and falls back to polling size/mtime snapshots.
+    A burst of events (copying an album, a tagger rewriting a folder) is
+    delivered as one on_changes(paths) call once the tree has been quiet for
+    `debounce` seconds. on_changes runs on the watcher's own thread.
+    """
+
+    def __init__(self, root, on_changes: Callable[[Set[str]], None], extensions: Iterable[str],
+                 debounce: float = 2.0, poll_interval: float = 10.0):
+        self.root = Path(root)
+        self.on_changes = on_changes
+        self.extensions = {e.lower() for e in extensions}
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._pending = set()
+        self._last_event = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        self._threads = []
+        self.mode = None
+
+    @property
+    def is_running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    def _relevant(self, path: str, is_directory: bool) -> bool:
+        # Directories matter for moves and deletions of whole albums, whatever their name ("Vol. 2");
+        # a deleted one can no longer be stat'ed, so the event has to say what it was
+        if is_directory: return True
+        suffix = os.path.splitext(path)[1].lower()
+        return suffix in self.extensions or not suffix or os.path.isdir(path)
+
+    def notify(self, path: str, is_directory: bool = False):
+        if not self._relevant(path, is_directory): return
+        with self._lock:
+            self._pending.add(path)
+            self._last_event = time.monotonic()
+        self._wake.set()
+
+    def start(self):
+        if self.is_running: return
+        self._stop.clear()
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_EventForwarder(self.notify), str(self.root), recursive=True)
+                self._observer.start()
+                self.mode = "events"
+            except Exception as e:
+                logger.warning(f"Native file events unavailable ({e}), falling back to polling")
+                self._observer = None
+        if self._observer is None:
+            self.mode = "polling"
+            self._threads.append(threading.Thread(target=self._poll_loop, daemon=True))
+        self._threads.append(threading.Thread(target=self._debounce_loop, daemon=True))
+        for t in self._threads: t.start()
+        logger.info(f"Watching {self.root} ({self.mode})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        for t in self._threads:
+            if t is not threading.current_thread(): t.join()
+        self._threads = []
+
+    def _debounce_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            with self._lock:
+                quiet_for = time.monotonic() - self._last_event
+                if not self._pending:
+                    self._wake.clear()
+                    continue
+                if quiet_for >= self.debounce:
+                    batch, self._pending = self._pending, set()
+                    self._wake.clear()
+                else:
+                    batch = None
+            if batch is None:
+                self._stop.wait(self.debounce - quiet_for)
+                continue
+            try:
+                self.on_changes(batch)
+            except Exception as e:
+                logger.error(f"Change handler failed: {e}")
+
+    def _snapshot(self) -> dict:
+        snapshot = {}
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in self.extensions: continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def _poll_loop(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            for path in previous.keys() | current.keys():
+                if previous.get(path) != current.get(path):
+                    self.notify(path)
+            previous = current
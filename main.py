@@ -9,6 +9,7 @@ from PIL import Image
 # Import our modules
 from scanner import Config, LibraryScanner
 from server_manager import VinylServer
+from library_watcher import LibraryWatcher
 
 # UI Settings
 ctk.set_appearance_mode("Dark")
@@ -32,6 +33,12 @@ class VinylApp(ctk.CTk):
         
         # Initialize Backend Components
         self.server = VinylServer(self.app_data_dir)
+        self.watcher = None
+        self.watch_scanner = None
+        self.watch_enabled = ctk.BooleanVar(value=False)
+        self.active_scanner = None
+        # Full scans and watcher updates both write the cache and the store
+        self.scan_lock = threading.Lock()
         
         # Layout
         self._create_widgets()
@@ -66,6 +73,9 @@ class VinylApp(ctk.CTk):
         self.btn_scan = ctk.CTkButton(self.frame_scan, text="Start New Scan", command=self.run_scan, state="disabled", fg_color="green")
         self.btn_scan.pack(pady=10)
 
+        self.sw_watch = ctk.CTkSwitch(self.frame_scan, text="Watch folder for changes", variable=self.watch_enabled, command=self.toggle_watch, state="disabled")
+        self.sw_watch.pack(pady=(0, 10))
+
         # --- Section 2: Server ---
         self.frame_server = ctk.CTkFrame(self)
         self.frame_server.pack(pady=10, padx=20, fill="x")
@@ -148,34 +158,90 @@ class VinylApp(ctk.CTk):
         if path:
             self.music_dir.set(path)
             self.btn_scan.configure(state="normal")
+            self.sw_watch.configure(state="normal")
+            if self.watcher: self._start_watcher()
 
     def run_scan(self):
+        if self.active_scanner:
+            # The button doubles as "Cancel" while a scan runs
+            self.active_scanner.cancel()
+            self.btn_scan.configure(state="disabled")
+            return
+
         path = self.music_dir.get()
         if not os.path.exists(path): return
 
-        self.btn_scan.configure(state="disabled")
+        self.active_scanner = LibraryScanner(Config(path, self.app_data_dir, scan_workers=os.cpu_count()))
+        self.btn_scan.configure(text="Cancel Scan", fg_color="red")
         self.lbl_lib_status.configure(text="Scanning... (Please Wait)", text_color="white")
         
-        thread = threading.Thread(target=self._scan_process, args=(path,))
+        thread = threading.Thread(target=self._scan_process, args=(self.active_scanner,))
         thread.start()
 
-    def _scan_process(self, path):
+    def _scan_process(self, scanner):
         try:
-            config = Config(path, self.app_data_dir)
-            scanner = LibraryScanner(config)
-            scanner.run()
+            with self.scan_lock:
+                for event in scanner.scan_iter():
+                    self.after(0, self._show_scan_progress, event)
+                    if self.server.is_running:
+                        self.server.broadcast({"status": "scan_progress", **event})
             self.after(0, self._on_scan_complete)
         except Exception as e:
             print(f"Error: {e}")
-            self.lbl_lib_status.configure(text=f"Error: {e}")
+            self.after(0, self._on_scan_complete, f"Error: {e}")
+
+    def _show_scan_progress(self, event):
+        phase = event["phase"]
+        if phase == "discover":
+            text = f"Finding files... {event['discovered']}"
+        elif phase == "tags":
+            text = f"Reading tags: {event['processed']}/{event['discovered']} ({event['files_per_sec']:.0f} files/s)"
+            if event["failed"]: text += f", {event['failed']} failed"
+        elif phase == "albums":
+            text = f"Saving albums: {event['albums']}/{event['albums_total']}"
+        elif phase == "cancelled":
+            text = "Scan cancelled"
+        else:
+            text = f"Done: {event['albums_total']} albums in {event['elapsed']:.1f}s"
+        self.lbl_lib_status.configure(text=text, text_color="white")
 
-    def _on_scan_complete(self):
-        self.btn_scan.configure(state="normal")
+    def _on_scan_complete(self, error=None):
+        self.active_scanner = None
+        self.btn_scan.configure(state="normal", text="Start New Scan", fg_color="green")
         self._check_existing_library()
+        if error: self.lbl_lib_status.configure(text=error, text_color="orange")
         # Reload server map in case it was running
         if self.server.is_running:
             self.server.load_metadata_map()
 
+    def toggle_watch(self):
+        if self.watch_enabled.get():
+            self._start_watcher()
+        else:
+            self._stop_watcher()
+
+    def _start_watcher(self):
+        self._stop_watcher()
+        path = self.music_dir.get()
+        if not os.path.exists(path): return
+        self.watch_scanner = LibraryScanner(Config(path, self.app_data_dir))
+        self.watcher = LibraryWatcher(path, self._on_library_changes, self.watch_scanner.cfg.AUDIO_EXT)
+        self.watcher.start()
+
+    def _stop_watcher(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+            self.watch_scanner.flush_exports()
+
+    def _on_library_changes(self, paths):
+        # Runs on the watcher thread
+        with self.scan_lock:
+            delta = self.watch_scanner.update_files(paths)
+        if self.server.is_running:
+            self.server.apply_library_delta(delta)
+        self.after(0, self._check_existing_library)
+
     def toggle_server(self):
         if not self.server.is_running:
             try:
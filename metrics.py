@@ -0,0 +1,284 @@
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger("Metrics")
+
+# Seconds; from a cached tag read up to a cold decode of a long FLAC
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(label_names: Tuple[str, ...], labels: Dict) -> Tuple[str, ...]:
+    if set(labels) != set(label_names):
+        raise ValueError(f"Expected labels {label_names}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(self.label_names, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.label_names, key), value
+
+    def export(self):
+        with self._lock:
+            state, self._values = self._values, {}
+        return state
+
+    def merge(self, state):
+        with self._lock:
+            for key, value in state.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge:
+    """A value set by the code, or read from `function` at every scrape."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), function: Callable[[], float] = None):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.function = function
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[_label_key(self.label_names, labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                yield self.name, "", self.function()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} failed: {e}")
+            return
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.label_names, key), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.label_names, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None: entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_labels(self.label_names + ("le",), key + (_format_value(bound),))
+                yield self.name + "_bucket", le, cumulative
+            labels = _format_labels(self.label_names, key)
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+    def export(self):
+        with self._lock:
+            state, self._values = self._values, {}
+        return state
+
+    def merge(self, state):
+        with self._lock:
+            for key, (counts, total) in state.items():
+                entry = self._values.get(key)
+                if entry is None: entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        # Modules are imported by the app and by pool workers alike; registering twice returns the first
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=(), function=None) -> Gauge:
+        gauge = self._add(Gauge(name, help, labels))
+        if function is not None: gauge.function = function
+        return gauge
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def export(self) -> Dict:
+        """Takes the counters and histograms recorded so far, for merge() in another process."""
+        return {name: metric.export() for name, metric in self._metrics.items() if hasattr(metric, "export")}
+
+    def merge(self, state: Dict):
+        for name, values in state.items():
+            metric = self._metrics.get(name)
+            if metric is not None and values: metric.merge(values)
+
+
+REGISTRY = Registry()
+
+
+def init_worker():
+    """
+    ProcessPoolExecutor initializer for pools that run collected() tasks. A
+    forked worker starts with a copy of the parent's values, which its first
+    export would send back and the parent would count again.
+    """
+    REGISTRY.export()
+
+
+def collected(fn, *args, **kwargs):
+    """
+    Runs fn in a process pool worker (started with init_worker) and returns
+    (result, metrics) so the parent can merge() what the worker recorded.
+    """
+    return fn(*args, **kwargs), REGISTRY.export()
+
+
+@contextmanager
+def timed(histogram: Histogram, subject: str = None, slow: float = None, **labels):
+    """Observes the block's duration; logs `subject` when it takes longer than `slow` seconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed, **labels)
+        if slow is not None and elapsed >= slow:
+            step = " ".join(str(v) for v in labels.values())
+            logger.warning(f"Slow {histogram.name} {step}: {subject} took {elapsed:.2f}s")
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every Python thread each `interval` seconds and
+    counts identical stacks. report() returns them in the collapsed format
+    ("frame;frame;frame count") that flamegraph.pl and speedscope read.
+    Meant to be switched on for a while when something is slow, not left on.
+    """
+
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._stacks = _Tally()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.01):
+        with self._lock:
+            if self._thread: return
+            self.interval = max(0.001, interval)
+            self.samples = 0
+            self._stacks = _Tally()
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread:
+            self._stop.set()
+            thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own: continue
+                stack = [f"{entry.name} ({os.path.basename(entry.filename)}:{entry.lineno})"
+                         for entry in traceback.extract_stack(frame)]
+                self._stacks[";".join([names.get(ident, str(ident))] + stack)] += 1
+            self.samples += 1
+
+    def status(self) -> Dict:
+        return {"running": self.running, "interval_ms": round(self.interval * 1000, 3),
+                "samples": self.samples, "started_at": self.started_at}
+
+    def report(self) -> str:
+        stacks = self._stacks.copy()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+PROFILER = SamplingProfiler()
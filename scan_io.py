@@ -0,0 +1,171 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import metrics
+
+PREFETCH_BYTES = metrics.REGISTRY.counter("vinyl_scan_prefetch_bytes_total", "Bytes read ahead of the tag parser")
+
+# DirEntry.inode() is free on POSIX (it comes with readdir) but costs a call per file on Windows
+_HAS_FREE_INODES = os.name != "nt"
+
+
+class DirectoryCache:
+    """
+    Directory listings made during a scan, so each directory is listed once:
+    the walk records the image files it sees, and the cover pass looks up an
+    album's folder art here instead of listing the album directory again.
+    """
+
+    def __init__(self, image_ext: Iterable[str]):
+        self.image_ext = {e.lower() for e in image_ext}
+        self._images: Dict[str, List[str]] = {}
+
+    def images(self, directory) -> List[str]:
+        """Names of the image files in directory, in listing order."""
+        key = str(directory)
+        names = self._images.get(key)
+        if names is None:
+            try:
+                with os.scandir(key) as entries:
+                    names = [e.name for e in entries if os.path.splitext(e.name)[1].lower() in self.image_ext]
+            except OSError:
+                names = []
+            self._images[key] = names
+        return names
+
+    def walk(self, top, extensions: Iterable[str]) -> Iterator[Tuple[Path, list, Tuple[int, int]]]:
+        """
+        (path, fingerprint, locality) of every file under top with one of the
+        extensions, top-down like os.walk (symlinked directories are not
+        followed, unreadable ones are skipped). Files are stat'ed in inode
+        order, which reads a directory's inode table sequentially on a spinning
+        disk, and yielded in listing order. locality is (directory inode,
+        inode): sorting by it approximates the files' order on disk.
+        """
+        extensions = {e.lower() for e in extensions}
+        top = str(top)
+        try:
+            top_inode = os.stat(top).st_ino if _HAS_FREE_INODES else 0
+        except OSError:
+            return
+        pending = [(top, top_inode)]
+        while pending:
+            directory, dir_inode = pending.pop()
+            try:
+                with os.scandir(directory) as listing:
+                    entries = list(listing)
+            except OSError:
+                continue
+
+            files, images, subdirs = [], [], []
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    if not entry.is_symlink(): subdirs.append(entry)
+                    continue
+                ext = os.path.splitext(entry.name)[1].lower()
+                if ext in extensions: files.append(entry)
+                elif ext in self.image_ext: images.append(entry.name)
+            self._images[directory] = images
+
+            inodes = {entry.name: entry.inode() if _HAS_FREE_INODES else 0 for entry in files}
+            fingerprints = {}
+            for entry in sorted(files, key=lambda e: inodes[e.name]):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                fingerprints[entry.name] = [st.st_size, st.st_mtime_ns]
+            for entry in files:
+                if entry.name in fingerprints:
+                    yield Path(entry.path), fingerprints[entry.name], (dir_inode, inodes[entry.name])
+
+            # Reversed so the stack visits subdirectories in listing order
+            for entry in reversed(subdirs):
+                pending.append((entry.path, entry.inode() if _HAS_FREE_INODES else 0))
+
+
+class Prefetcher:
+    """
+    Reads files on its own threads just ahead of the tag parser, so the
+    parser (and the waveform decoder) find them in the OS page cache. Up to
+    `workers` reads are in flight however many processes parse, and at most
+    `window` bytes are read ahead of the consumer. On a network mount or a
+    spinning disk this turns one small read per round trip or seek into a
+    few large reads per file, many files at a time.
+
+    Whole files are read when the waveform decoder will read them anyway;
+    otherwise the head of each file, which holds the tags and the first
+    audio frames the parser needs.
+    """
+
+    CHUNK = 1024 * 1024
+    # Tags only: the head of a file, or its whole ID3v2 tag plus this much of the audio after it
+    HEAD_BYTES = 1024 * 1024
+    MPEG_PROBE_BYTES = 64 * 1024
+
+    def __init__(self, workers: int, whole_files: bool, window: int = 256 * 1024 * 1024):
+        self.workers = workers
+        self.whole_files = whole_files
+        self.window = window
+
+    def _head_bytes(self, f) -> int:
+        header = f.read(10)
+        if len(header) == 10 and header[:3] == b"ID3":
+            tag_size = 10 + sum((b & 0x7F) << (7 * (3 - i)) for i, b in enumerate(header[6:10]))
+            return max(self.HEAD_BYTES, tag_size + self.MPEG_PROBE_BYTES)
+        return self.HEAD_BYTES
+
+    def _read(self, path, size: int) -> int:
+        total = 0
+        try:
+            with open(path, "rb", buffering=0) as f:
+                limit = size if self.whole_files else min(size, self._head_bytes(f))
+                buffer = bytearray(min(self.CHUNK, max(limit, 1)))
+                f.seek(0)
+                while total < limit:
+                    read = f.readinto(buffer)
+                    if not read: break
+                    total += read
+        except OSError:
+            # The parser reports the file
+            pass
+        PREFETCH_BYTES.inc(total)
+        return total
+
+    def _expected(self, size: int) -> int:
+        return size if self.whole_files else min(size, self.HEAD_BYTES)
+
+    def warmed(self, items: Iterable[Tuple]) -> Iterator[Tuple]:
+        """(path, size, ...) items, each yielded back in order once its file has been read ahead."""
+        if self.workers <= 0:
+            yield from items
+            return
+        items = iter(items)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ScanPrefetch")
+        in_flight = deque()
+        ahead = 0
+        exhausted = False
+        try:
+            while True:
+                # Keep the window full, but never fewer reads than workers
+                while not exhausted and (ahead < self.window or len(in_flight) < self.workers):
+                    item = next(items, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    in_flight.append((item, executor.submit(self._read, item[0], item[1])))
+                    ahead += self._expected(item[1])
+                if not in_flight: return
+                item, future = in_flight.popleft()
+                future.result()
+                ahead -= self._expected(item[1])
+                yield item
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
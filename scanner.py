@@ -1,75 +1,310 @@
 import os
+import re
 import json
+import struct
+import time
 import hashlib
 import logging
+import multiprocessing
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import mutagen
 from mutagen.id3 import ID3, APIC
 from mutagen.flac import FLAC
-from mutagen.mp3 import MP3
-from PIL import Image
+from mutagen.mp3 import MP3, MPEGInfo
+from PIL import Image, features
 import io
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from library_store import LibraryStore
+from cover_atlas import CoverAtlas
+from audio_analysis import compute_waveform
+from scan_io import DirectoryCache, Prefetcher
+import metrics
+
+# Pool workers record into their own registry; LibraryScanner merges it back
+SCAN_STAGE_SECONDS = metrics.REGISTRY.histogram(
+    "vinyl_scan_stage_seconds", "Wall time of each scan stage per scan", ("stage",),
+    buckets=(0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+SCAN_FILE_SECONDS = metrics.REGISTRY.histogram("vinyl_scan_file_seconds", "Per-file scan work", ("step",))
+COVER_SECONDS = metrics.REGISTRY.histogram("vinyl_cover_seconds", "Per-cover image work", ("step",))
+SCAN_FILES = metrics.REGISTRY.counter("vinyl_scan_files_total", "Audio files seen by scans", ("result",))
+# Per-file work slower than this is logged with the file name
+SLOW_FILE_SECONDS = 2.0
+
 class Config:
-    def __init__(self, music_dir: str, output_base_dir: str):
+    def __init__(self, music_dir: str, output_base_dir: str, scan_workers: Optional[int] = 1, waveforms: bool = True,
+                 io_workers: Optional[int] = None):
         self.MUSIC_DIR = Path(music_dir)
         self.OUTPUT_BASE = Path(output_base_dir)
         self.COVERS_DIR = self.OUTPUT_BASE / "static" / "covers"
         self.DB_PATH = self.OUTPUT_BASE / "library.json"
+        self.CACHE_PATH = self.OUTPUT_BASE / "scan_cache.db"
+        # The cache before it moved to SQLite; imported once, then deleted
+        self.LEGACY_CACHE_PATH = self.OUTPUT_BASE / "scan_cache.json"
+        self.STORE_PATH = self.OUTPUT_BASE / "library.db"
         
         self.AUDIO_EXT = {'.mp3', '.flac'}
         self.IMAGE_EXT = {'.jpg', '.jpeg', '.png'}
         self.COVER_SIZE = (512, 512)
+        # Every cover is rendered at each of these edge lengths; sizes above the
+        # primary one are only kept when the source artwork is at least that large
+        self.COVER_SIZES = (64, 256, 512, 1024)
+        self.COVER_FORMAT = "WEBP" if features.check("webp") else "PNG"
+        # Process pool size for tag parsing and cover work. 1 = serial, None = one per core.
+        self.SCAN_WORKERS = max(1, scan_workers if scan_workers is not None else (os.cpu_count() or 1))
+        # Decode each new or changed track once to store its waveform (needs NumPy)
+        self.WAVEFORMS = waveforms
+        # Threads reading files ahead of the tag parsers, for network mounts and spinning disks.
+        # Reads mostly wait, so there are more of them than parsers. 0 = no read-ahead.
+        self.IO_WORKERS = max(0, io_workers if io_workers is not None else max(4, 2 * self.SCAN_WORKERS))
         self.COVERS_DIR.mkdir(parents=True, exist_ok=True)
 
+    def cover_path(self, cover_id: str, size: int = None) -> Path:
+        """Rendered cover variant; the primary size (used for cover_url) when size is None."""
+        ext = ".webp" if self.COVER_FORMAT == "WEBP" else ".png"
+        return self.COVERS_DIR / f"{cover_id}_{size or self.COVER_SIZE[0]}{ext}"
+
 class ImageUtils:
-    @staticmethod
-    def save_image(image_data: bytes, output_path: Path, size: tuple) -> bool:
-        try:
-            image = Image.open(io.BytesIO(image_data))
-            if image.mode != "RGB":
-                image = image.convert("RGB")
-            image.thumbnail(size)
-            image.save(output_path, "PNG")
-            return True
-        except Exception:
-            return False
+    # Encoder settings per output format
+    SAVE_OPTIONS = {"WEBP": {"quality": 82, "method": 4}, "PNG": {"optimize": False}}
+    DEFAULT_COLOR = "#44aa88"
+    # Palette: colors quantized to 4 bits per channel, bins under MIN_SHARE of the pixels ignored
+    QUANT_SHIFT = 4
+    PALETTE_SIZE = 6
+    MIN_SHARE = 0.02
 
     @staticmethod
-    def save_file_image(source_path: Path, output_path: Path, size: tuple) -> bool:
+    def save_variants(image_data: bytes, cfg: Config, cover_id: str) -> Optional[Dict]:
+        """
+        Decodes the artwork once and writes a mip chain (largest first, each
+        level downsampled from the previous one) in cfg.COVER_FORMAT. The
+        palette is taken from the smallest level, still in memory.
+        """
         try:
-            with open(source_path, "rb") as f:
-                return ImageUtils.save_image(f.read(), output_path, size)
+            with metrics.timed(COVER_SECONDS, cover_id, SLOW_FILE_SECONDS, step="decode"):
+                image = Image.open(io.BytesIO(image_data))
+                image.load()
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+            source_edge = max(image.size)
+            primary = cfg.COVER_SIZE[0]
+            sizes = [s for s in sorted(cfg.COVER_SIZES, reverse=True) if s <= primary or s <= source_edge]
+            options = ImageUtils.SAVE_OPTIONS.get(cfg.COVER_FORMAT, {})
+            with metrics.timed(COVER_SECONDS, cover_id, SLOW_FILE_SECONDS, step="encode"):
+                for size in sizes:
+                    image.thumbnail((size, size), Image.LANCZOS)
+                    image.save(cfg.cover_path(cover_id, size), cfg.COVER_FORMAT, **options)
+            with metrics.timed(COVER_SECONDS, cover_id, SLOW_FILE_SECONDS, step="color"):
+                return ImageUtils.extract_palette(image)
         except Exception:
-            return False
+            return None
 
     @staticmethod
-    def get_average_color(image_path: Path) -> str:
-        """Returns hex color with guaranteed minimum brightness."""
+    def file_palette(image_path: Path) -> Dict:
+        """Palette of an already rendered cover; only needed for covers rendered before palettes were cached."""
         try:
-            if not image_path.exists(): return "#44aa88"
+            if not image_path.exists(): return ImageUtils.default_palette()
             img = Image.open(image_path)
             if img.mode != "RGB": img = img.convert("RGB")
-            img = img.resize((1, 1))
-            r, g, b = img.getpixel((0, 0))
-            
-            # Calculate Luminance
-            lum = (0.299 * r + 0.587 * g + 0.114 * b)
-            
-            # If too dark, boost brightness
-            if lum < 60:
-                factor = 1.0 + ((60 - lum) / 60) * 1.5 # Boost factor
-                r = min(255, int(r * factor + 40))
-                g = min(255, int(g * factor + 40))
-                b = min(255, int(b * factor + 40))
-
-            return '#{:02x}{:02x}{:02x}'.format(r, g, b)
+            img.thumbnail((64, 64))
+            return ImageUtils.extract_palette(img)
         except Exception:
-            return "#44aa88"
+            return ImageUtils.default_palette()
+
+    @staticmethod
+    def default_palette() -> Dict:
+        return {"dominant": ImageUtils.DEFAULT_COLOR, "accent": ImageUtils.DEFAULT_COLOR, "palette": []}
+
+    @staticmethod
+    def _hex(rgb) -> str:
+        return '#{:02x}{:02x}{:02x}'.format(*(int(c) for c in rgb))
+
+    @staticmethod
+    def _boost(r, g, b) -> tuple:
+        """Guarantees a minimum brightness so the accent reads on the dark scene."""
+        # Calculate Luminance
+        lum = (0.299 * r + 0.587 * g + 0.114 * b)
+
+        # If too dark, boost brightness
+        if lum < 60:
+            factor = 1.0 + ((60 - lum) / 60) * 1.5 # Boost factor
+            r = min(255, int(r * factor + 40))
+            g = min(255, int(g * factor + 40))
+            b = min(255, int(b * factor + 40))
+        return r, g, b
+
+    @staticmethod
+    def extract_palette(image: Image.Image) -> Dict:
+        """
+        Dominant color, accent color (the most vivid well-represented color,
+        brightness-boosted) and up to PALETTE_SIZE colors by coverage.
+        Falls back to the plain average color when NumPy is not installed.
+        """
+        if np is None:
+            r, g, b = image.resize((1, 1)).getpixel((0, 0))
+            color = ImageUtils._hex((r, g, b))
+            return {"dominant": color, "accent": ImageUtils._hex(ImageUtils._boost(r, g, b)), "palette": [color]}
+
+        pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 3)
+        shift = ImageUtils.QUANT_SHIFT
+        levels = 256 >> shift
+        q = (pixels >> shift).astype(np.int32)
+        bins = (q[:, 0] * levels + q[:, 1]) * levels + q[:, 2]
+
+        counts = np.bincount(bins, minlength=levels ** 3)
+        order = np.argsort(counts)[::-1]
+        order = order[counts[order] >= max(1, ImageUtils.MIN_SHARE * len(pixels))][:ImageUtils.PALETTE_SIZE * 2]
+        if not len(order): order = np.argsort(counts)[-1:]
+
+        # Mean of the real pixels in each bin, not the bin's corner color
+        sums = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=levels ** 3) for c in range(3)], axis=1)
+        colors = sums[order] / counts[order, None]
+        shares = counts[order] / len(pixels)
+
+        high, low = colors.max(axis=1), colors.min(axis=1)
+        saturation = np.where(high > 0, (high - low) / np.maximum(high, 1), 0.0)
+        value = high / 255.0
+        # Coverage still matters, but a vivid color beats a larger gray or black area
+        vividness = np.sqrt(shares) * (0.15 + saturation) * (0.25 + value)
+        accent = colors[int(np.argmax(vividness))]
+
+        return {
+            "dominant": ImageUtils._hex(colors[0]),
+            "accent": ImageUtils._hex(ImageUtils._boost(*(int(c) for c in accent))),
+            "palette": [ImageUtils._hex(c) for c in colors[:ImageUtils.PALETTE_SIZE]]
+        }
 
 class TagParser:
+    # FLAC metadata block types
+    FLAC_STREAMINFO, FLAC_VORBIS_COMMENT, FLAC_PICTURE = 0, 4, 6
+    ID3_TEXT_FRAMES = {b"TIT2": "title", b"TPE1": "artist", b"TALB": "album"}
+    ID3_TEXT_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+    @staticmethod
+    def read_tags(file_path: Path) -> Dict:
+        """
+        Same result as extract() but without artwork: FLAC PICTURE blocks and
+        ID3 APIC frames are seeked over, never read. Files the block/frame
+        walkers do not handle (ID3v2.2, unsynchronised or compressed tags, ID3
+        in front of FLAC, ...) go through mutagen instead.
+        """
+        try:
+            with open(file_path, "rb") as f:
+                magic = f.read(4)
+                f.seek(0)
+                if magic == b"fLaC":
+                    meta = TagParser._read_flac(f, file_path)
+                elif magic[:3] == b"ID3":
+                    meta = TagParser._read_id3(f, file_path)
+                else:
+                    meta = None
+        except Exception:
+            meta = None
+        if meta is None:
+            meta = TagParser.extract(file_path)
+            if meta: meta["cover_data"] = None
+        return meta
+
+    @staticmethod
+    def _base_meta(file_path: Path) -> Dict:
+        return {
+            "title": file_path.stem,
+            "artist": "Unknown Artist",
+            "album": "Unknown Album",
+            "duration": 0,
+            "has_embedded_cover": False,
+            "cover_data": None
+        }
+
+    @staticmethod
+    def _read_flac(f, file_path: Path) -> Optional[Dict]:
+        meta = TagParser._base_meta(file_path)
+        f.seek(4)
+        comments = None
+        last = False
+        while not last:
+            header = f.read(4)
+            if len(header) != 4: return None
+            last, block_type = bool(header[0] & 0x80), header[0] & 0x7F
+            length = int.from_bytes(header[1:], "big")
+            if block_type == TagParser.FLAC_STREAMINFO:
+                info = f.read(length)
+                sample_rate = int.from_bytes(info[10:13], "big") >> 4
+                total_samples = int.from_bytes(info[13:18], "big") & 0xFFFFFFFFF
+                if sample_rate: meta["duration"] = total_samples / sample_rate
+            elif block_type == TagParser.FLAC_VORBIS_COMMENT:
+                data = f.read(length)
+                vendor_length = struct.unpack_from("<I", data)[0]
+                offset = 4 + vendor_length
+                count = struct.unpack_from("<I", data, offset)[0]
+                offset += 4
+                comments = {}
+                for _ in range(count):
+                    size = struct.unpack_from("<I", data, offset)[0]
+                    key, _, value = data[offset + 4:offset + 4 + size].decode("utf-8", "replace").partition("=")
+                    comments.setdefault(key.lower(), value)
+                    offset += 4 + size
+            else:
+                if block_type == TagParser.FLAC_PICTURE: meta["has_embedded_cover"] = True
+                f.seek(length, 1)
+
+        # extract() rejects FLAC files without a comment block; leave those to it
+        if comments is None: return None
+        for key in ("title", "artist", "album"):
+            if comments.get(key): meta[key] = comments[key]
+        return meta
+
+    @staticmethod
+    def _read_id3(f, file_path: Path) -> Optional[Dict]:
+        _, major, _, flags, size = struct.unpack(">3sBBB4s", f.read(10))
+        # Header flags would mean unsynchronisation, an extended header or a footer
+        if major not in (3, 4) or flags: return None
+        tag_size = 10 + sum((b & 0x7F) << (7 * (3 - i)) for i, b in enumerate(size))
+
+        meta = TagParser._base_meta(file_path)
+        while f.tell() + 10 <= tag_size:
+            frame_id, frame_size, frame_flags = struct.unpack(">4sIH", f.read(10))
+            if frame_id == b"\0\0\0\0": break  # padding
+            if not frame_id.isalnum(): return None
+            if major == 4:
+                frame_size = sum(((frame_size >> (8 * i)) & 0x7F) << (7 * i) for i in range(4))
+            if f.tell() + frame_size > tag_size: return None
+
+            field = TagParser.ID3_TEXT_FRAMES.get(frame_id)
+            if frame_id == b"APIC":
+                meta["has_embedded_cover"] = True
+                f.seek(frame_size, 1)
+            elif field:
+                # Compressed, encrypted or unsynchronised frames are left to mutagen
+                if frame_flags & 0xFF: return None
+                meta[field] = TagParser._id3_text(f.read(frame_size))
+            else:
+                f.seek(frame_size, 1)
+
+        meta["duration"] = MPEGInfo(f, tag_size).length
+        return meta
+
+    @staticmethod
+    def _id3_text(data: bytes) -> str:
+        # Matches str() of a mutagen text frame: the values joined with NUL
+        text = data[1:].decode(TagParser.ID3_TEXT_ENCODINGS[data[0]])
+        values = [v.lstrip("\ufeff") for v in text.split("\0")]
+        if len(values) > 1 and values[-1] == "": values.pop()
+        return "\0".join(values)
+
     @staticmethod
     def extract(file_path: Path) -> Dict:
         try:
@@ -111,19 +346,354 @@ class TagParser:
         except Exception:
             return {}
 
+def find_backup_cover(directory: Path, image_ext: set, images: list = None) -> Optional[Path]:
+    """Folder art in directory; `images` are the image file names when a DirectoryCache already has them."""
+    if images is None: images = DirectoryCache(image_ext).images(directory)
+    candidates = [directory / name for name in images]
+    for img in candidates:
+        if any(x in img.name.lower() for x in ["front", "cover", "folder"]):
+            return img
+    return candidates[0] if candidates else None
+
+def read_artwork(track_path: Path, has_embedded_cover: bool, image_ext: set, images: list = None) -> Optional[bytes]:
+    """An album's artwork as read from one of its tracks: the embedded picture, else the folder image."""
+    with metrics.timed(SCAN_FILE_SECONDS, str(track_path), SLOW_FILE_SECONDS, step="artwork"):
+        if has_embedded_cover:
+            cover_data = TagParser.extract(track_path).get("cover_data")
+            if cover_data: return cover_data
+        backup = find_backup_cover(track_path.parent, image_ext, images)
+        try:
+            return backup.read_bytes() if backup else None
+        except OSError:
+            return None
+
+def cover_hash(cover_data: bytes) -> str:
+    # Covers are content-addressed: the id of a rendered cover is the hash of its source artwork
+    return hashlib.md5(cover_data).hexdigest()
+
+def render_cover(cover_data: bytes, cover_id: str, cfg: Config) -> Dict:
+    """Writes the cover variants for cover_id and returns its palette."""
+    output_path = cfg.cover_path(cover_id)
+    if output_path.exists():
+        # Rendered before palettes were cached
+        smallest = cfg.cover_path(cover_id, min(cfg.COVER_SIZES))
+        return ImageUtils.file_palette(smallest if smallest.exists() else output_path)
+    return ImageUtils.save_variants(cover_data, cfg, cover_id) or ImageUtils.default_palette()
+
+# --- Process pool tasks (module level so they can be pickled) ---
+
+def _tag_task(file_path: str, waveforms: bool = False) -> Dict:
+    with metrics.timed(SCAN_FILE_SECONDS, file_path, SLOW_FILE_SECONDS, step="tags"):
+        meta = TagParser.read_tags(Path(file_path))
+    if meta and waveforms:
+        with metrics.timed(SCAN_FILE_SECONDS, file_path, SLOW_FILE_SECONDS, step="waveform"):
+            meta["waveform"] = compute_waveform(file_path)
+    return meta
+
+def _tag_chunk(file_paths: list, waveforms: bool = False) -> list:
+    return [_tag_task(file_path, waveforms) for file_path in file_paths]
+
+def _cover_hash_task(track_path: str, has_embedded_cover: bool, image_ext: set, images: list) -> Optional[str]:
+    cover_data = read_artwork(Path(track_path), has_embedded_cover, image_ext, images)
+    return cover_hash(cover_data) if cover_data else None
+
+def _cover_task(track_path: str, has_embedded_cover: bool, cover_id: str, cfg: Config, images: list) -> Dict:
+    cover_data = None
+    if not cfg.cover_path(cover_id).exists():
+        cover_data = read_artwork(Path(track_path), has_embedded_cover, cfg.IMAGE_EXT, images)
+    return render_cover(cover_data, cover_id, cfg)
+
+class ScanCache:
+    """
+    Extracted tag metadata per file, keyed by path and validated by size and
+    mtime; the cover id of every album; and the palette of every rendered
+    cover. A file's waveform is only held until its album is written to the
+    store (written()), which then keeps the one copy in tracks.waveform. Kept in SQLite next to library.db, one row per file, so rescans
+    only open changed files, never decode a cover twice, and read or write
+    only the rows they need instead of the whole cache.
+
+    A full scan records the files it walks in `walked`, in walk order with
+    their disk locality; what changed, the stale files to parse and the
+    albums to write are then queries against it.
+    """
+    # 3: SQLite instead of one JSON document
+    VERSION = 3
+    # Parsed files written per transaction, and rows read per query while streaming
+    FLUSH_ROWS = 500
+    PAGE_ROWS = 1000
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            album_key TEXT NOT NULL,
+            artist TEXT NOT NULL,
+            album TEXT NOT NULL,
+            meta TEXT NOT NULL,
+            waveform TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_files_album ON files(album_key);
+        CREATE TABLE IF NOT EXISTS album_covers (album_key TEXT PRIMARY KEY, cover_id TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS covers (cover_id TEXT PRIMARY KEY, palette TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS walked (
+            path TEXT PRIMARY KEY,
+            walk_order INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            dir_inode INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            cached INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_walked_locality ON walked(cached, dir_inode, inode, path);
+    """
+    # A walked file whose cache row is current
+    CURRENT = "f.path = w.path AND f.size = w.size AND f.mtime_ns = w.mtime_ns"
+
+    def __init__(self, path: Path, album_of, legacy_path: Path = None):
+        """album_of(meta) -> (album key, artist, album name)."""
+        self.path = Path(path)
+        self.album_of = album_of
+        self._lock = threading.RLock()
+        self._pending = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection for the cache's lifetime, used by one scan or update at a time
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(self.SCHEMA)
+        if legacy_path and Path(legacy_path).exists(): self._import_legacy(Path(legacy_path))
+
+    def _import_legacy(self, legacy_path: Path):
+        """Moves a scan_cache.json (version 2) into the database once, then deletes it."""
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") == 2:
+            for path, entry in data.get("files", {}).items():
+                self.put(path, entry["fingerprint"], entry["meta"])
+            self.flush()
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO album_covers VALUES (?, ?)", data.get("album_covers", {}).items())
+                self._conn.executemany("INSERT OR REPLACE INTO covers VALUES (?, ?)",
+                                       [(cover_id, json.dumps(palette)) for cover_id, palette in data.get("covers", {}).items()])
+            logging.info(f"Moved {len(data.get('files', {}))} cached files from {legacy_path.name} to {self.path.name}")
+        legacy_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def fingerprint(file_path: Path) -> list:
+        st = file_path.stat()
+        return [st.st_size, st.st_mtime_ns]
+
+    def get(self, file_path: str, fingerprint: list) -> Optional[Dict]:
+        with self._lock:
+            self.flush()
+            row = self._conn.execute("SELECT meta FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                                     (file_path, *fingerprint)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, file_path: str, fingerprint: list, meta: Dict):
+        meta = dict(meta)
+        waveform = meta.pop("waveform", None)
+        with self._lock:
+            self._pending.append((file_path, *fingerprint, *self.album_of(meta), json.dumps(meta), waveform))
+            if len(self._pending) >= self.FLUSH_ROWS: self.flush()
+
+    @staticmethod
+    def _meta(meta: str, waveform: Optional[str]) -> Dict:
+        meta = json.loads(meta)
+        if waveform: meta["waveform"] = waveform
+        return meta
+
+    def written(self, album_keys):
+        """Drops the waveforms of albums the store now holds."""
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.executemany("UPDATE files SET waveform = NULL WHERE album_key = ? AND waveform IS NOT NULL",
+                                       [(key,) for key in album_keys])
+
+    def flush(self):
+        """Writes the files put since the last flush."""
+        with self._lock:
+            if not self._pending: return
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def remove(self, file_path: str) -> Optional[str]:
+        """Forgets a file; returns the album key it had, if it was cached."""
+        with self._lock:
+            self.flush()
+            with self._conn:
+                row = self._conn.execute("SELECT album_key FROM files WHERE path = ?", (file_path,)).fetchone()
+                if row: self._conn.execute("DELETE FROM files WHERE path = ?", (file_path,))
+        return row[0] if row else None
+
+    def paths_under(self, path: Path) -> List[str]:
+        """Cached paths equal to path or inside it."""
+        prefix = str(path) + os.sep
+        with self._lock:
+            self.flush()
+            rows = self._conn.execute("SELECT path FROM files WHERE path = ? OR (path >= ? AND path < ?)",
+                                      (str(path), prefix, prefix + "\U0010ffff")).fetchall()
+        return [row[0] for row in rows]
+
+    def album_members(self, album_keys) -> Dict[str, list]:
+        """[(path, meta), ...] by path of every cached file in each album, [] for albums without any."""
+        members = {key: [] for key in album_keys}
+        with self._lock:
+            self.flush()
+            for key in members:
+                for path, meta, waveform in self._conn.execute(
+                    "SELECT path, meta, waveform FROM files WHERE album_key = ? ORDER BY path", (key,)
+                ):
+                    members[key].append((Path(path), self._meta(meta, waveform)))
+        return members
+
+    # --- Full scans ---
+
+    def begin_walk(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM walked")
+
+    def add_walked(self, rows: list):
+        """(path, walk order, size, mtime_ns, directory inode, inode) of walked files."""
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO walked (path, walk_order, size, mtime_ns, dir_inode, inode) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def walk_changes(self) -> Tuple[int, int, set]:
+        """
+        After a walk: (cached files, removed files, album keys they or the
+        stale files belonged to). Marks the walked files the cache covers.
+        """
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.execute("UPDATE walked SET cached = EXISTS (SELECT 1 FROM files f WHERE f.path = walked.path "
+                                   "AND f.size = walked.size AND f.mtime_ns = walked.mtime_ns)")
+            cached = self._conn.execute("SELECT COUNT(*) FROM walked WHERE cached = 1").fetchone()[0]
+            removed = self._conn.execute("SELECT COUNT(*) FROM files WHERE path NOT IN (SELECT path FROM walked)").fetchone()[0]
+            affected = {row[0] for row in self._conn.execute(
+                "SELECT DISTINCT album_key FROM files WHERE path NOT IN (SELECT path FROM walked WHERE cached = 1)")}
+        return cached, removed, affected
+
+    def stale_files(self) -> Iterator[Tuple[Path, list]]:
+        """(path, fingerprint) of the walked files the cache does not cover, in disk order, read a page at a time."""
+        last = (-1, -1, "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT dir_inode, inode, path, size, mtime_ns FROM walked WHERE cached = 0 AND (dir_inode, inode, path) > (?, ?, ?) "
+                    "ORDER BY dir_inode, inode, path LIMIT ?", (*last, self.PAGE_ROWS)).fetchall()
+            if not rows: return
+            for dir_inode, inode, path, size, mtime_ns in rows:
+                yield Path(path), [size, mtime_ns]
+            last = rows[-1][:3]
+
+    def walked_albums(self) -> List[Tuple[str, str, str, int]]:
+        """(album key, artist, album name, walk order of its first file) of every album among the walked files."""
+        with self._lock:
+            self.flush()
+            return self._conn.execute(
+                "SELECT f.album_key, f.artist, f.album, MIN(w.walk_order) FROM walked w "
+                f"JOIN files f ON {self.CURRENT} GROUP BY f.album_key").fetchall()
+
+    def walked_members(self, album_keys: List[str]) -> Dict[str, list]:
+        """[(path, meta), ...] in walk order of the walked files in each album."""
+        members = {key: [] for key in album_keys}
+        with self._lock:
+            for key in album_keys:
+                rows = self._conn.execute(
+                    f"SELECT f.path, f.meta, f.waveform FROM walked w JOIN files f ON {self.CURRENT} WHERE f.album_key = ? "
+                    "ORDER BY w.walk_order", (key,))
+                members[key] = [(Path(path), self._meta(meta, waveform)) for path, meta, waveform in rows]
+        return members
+
+    def end_walk(self):
+        """Drops the files the finished scan did not find (or could no longer parse), and their albums' covers."""
+        with self._lock:
+            self.flush()
+            with self._conn:
+                self._conn.execute("DELETE FROM files WHERE NOT EXISTS (SELECT 1 FROM walked w WHERE "
+                                   "w.path = files.path AND w.size = files.size AND w.mtime_ns = files.mtime_ns)")
+                self._conn.execute("DELETE FROM album_covers WHERE album_key NOT IN (SELECT album_key FROM files)")
+                self._conn.execute("DELETE FROM walked")
+
+    # --- Covers ---
+
+    def album_cover(self, album_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT cover_id FROM album_covers WHERE album_key = ?", (album_key,)).fetchone()
+        return row[0] if row else None
+
+    def set_album_cover(self, album_key: str, cover_id: Optional[str]):
+        with self._lock, self._conn:
+            if cover_id: self._conn.execute("INSERT OR REPLACE INTO album_covers VALUES (?, ?)", (album_key, cover_id))
+            else: self._conn.execute("DELETE FROM album_covers WHERE album_key = ?", (album_key,))
+
+    def palette(self, cover_id: Optional[str]) -> Optional[Dict]:
+        if not cover_id: return None
+        with self._lock:
+            row = self._conn.execute("SELECT palette FROM covers WHERE cover_id = ?", (cover_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_palette(self, cover_id: str, palette: Dict):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO covers VALUES (?, ?)", (cover_id, json.dumps(palette)))
+
+    def retain_palettes(self, cover_ids: set):
+        """Forgets the palette of every cover not in cover_ids."""
+        with self._lock:
+            stale = [(row[0],) for row in self._conn.execute("SELECT cover_id FROM covers") if row[0] not in cover_ids]
+            with self._conn:
+                self._conn.executemany("DELETE FROM covers WHERE cover_id = ?", stale)
+
+    def forget_palettes(self, cover_ids: set):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM covers WHERE cover_id = ?", [(cover_id,) for cover_id in cover_ids])
+
+    def save(self):
+        self.flush()
+
 class LibraryScanner:
+    # Files handed to each worker per round trip in parallel mode
+    TAG_CHUNK_SIZE = 16
+    # Albums finished, written to the store and dropped from memory per batch
+    ALBUM_BATCH = 200
+    # Walked files recorded in the scan cache per transaction
+    WALK_BATCH = 1000
+    # Minimum seconds between two progress events of the same phase
+    PROGRESS_INTERVAL = 0.25
+    # Seconds without watcher updates before library.json and the cover atlas are rebuilt
+    EXPORT_DELAY = 30.0
+    # Full scans and delayed watcher exports of every scanner write the same library.json and atlas
+    _export_write_lock = threading.Lock()
+    # Rendered cover variants ({cover id}_{size}.ext); anything else in the covers dir is left alone
+    COVER_FILE_RE = re.compile(r"^([0-9a-f]{32})_\d+\.(?:webp|png)$")
+    # Single-size covers ({cover id}.png) written before variants existed
+    LEGACY_COVER_RE = re.compile(r"^[0-9a-f]{32}\.png$")
+
     def __init__(self, config: Config):
         self.cfg = config
         self.albums_map = {} 
+        self.cache = ScanCache(self.cfg.CACHE_PATH, self._album_key, self.cfg.LEGACY_CACHE_PATH)
+        self.store = LibraryStore(self.cfg.STORE_PATH)
+        # Directory listings of the current scan or update; dropped when it ends
+        self.listings = DirectoryCache(self.cfg.IMAGE_EXT)
+        self.atlas = CoverAtlas(self.cfg.OUTPUT_BASE, self.cfg.COVER_FORMAT)
+        self._cancel = threading.Event()
+        self.progress = {}
+        self.stage_times = {}
+        self._last_event = 0.0
+        self._export_timer = None
+        self._export_lock = threading.Lock()
         logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
-    def _get_backup_cover(self, directory: Path) -> Path:
-        candidates = [f for f in directory.iterdir() if f.suffix.lower() in self.cfg.IMAGE_EXT]
-        for img in candidates:
-            if any(x in img.name.lower() for x in ["front", "cover", "folder"]):
-                return img
-        return candidates[0] if candidates else None
-
     def _clean(self, s):
         return str(s).strip()
 
@@ -133,82 +703,454 @@ class LibraryScanner:
         s = int(seconds % 60)
         return f"{m}:{s:02d}"
 
-    def process_file(self, file_path: Path):
-        meta = TagParser.extract(file_path)
-        if not meta: return
-
+    def _album_key(self, meta: Dict):
         artist = self._clean(meta.get("artist", "Unknown"))
         album_name = self._clean(meta.get("album", "Unknown"))
-        unique_key = f"{artist}||{album_name}"
+        return f"{artist}||{album_name}", artist, album_name
 
-        if unique_key not in self.albums_map:
-            album_hash = hashlib.md5(unique_key.encode('utf-8')).hexdigest()
-            cover_filename = f"{album_hash}.png"
-            output_cover_path = self.cfg.COVERS_DIR / cover_filename
-            
-            if not output_cover_path.exists():
-                saved = False
-                if meta["has_embedded_cover"] and meta["cover_data"]:
-                    saved = ImageUtils.save_image(meta["cover_data"], output_cover_path, self.cfg.COVER_SIZE)
-                if not saved:
-                    backup = self._get_backup_cover(file_path.parent)
-                    if backup: ImageUtils.save_file_image(backup, output_cover_path, self.cfg.COVER_SIZE)
-
-            cover_url = f"/static/covers/{cover_filename}" if output_cover_path.exists() else "/static/covers/default_vinyl.png"
-            
-            # RE-CHECK COLOR ON EXISTING IMAGES TOO
-            accent_color = ImageUtils.get_average_color(output_cover_path)
-
-            self.albums_map[unique_key] = {
-                "id": album_hash,
-                "title": album_name,
-                "artist": artist,
-                "cover_url": cover_url,
-                "accent_color": accent_color,
-                "raw_tracks": []
-            }
+    def _album_id(self, unique_key: str) -> str:
+        return hashlib.md5(unique_key.encode('utf-8')).hexdigest()
+
+    def _cover_variants(self, cover_id: str) -> Dict[str, str]:
+        variants = {}
+        for size in self.cfg.COVER_SIZES:
+            path = self.cfg.cover_path(cover_id, size)
+            if path.exists(): variants[str(size)] = f"/static/covers/{path.name}"
+        return variants
+
+    def _add_album(self, unique_key: str, artist: str, album_name: str, cover_id: Optional[str]):
+        output_cover_path = self.cfg.cover_path(cover_id) if cover_id else None
+        if output_cover_path and output_cover_path.exists():
+            cover_url, cover_variants = f"/static/covers/{output_cover_path.name}", self._cover_variants(cover_id)
+        else:
+            cover_id, cover_url, cover_variants = None, "/static/covers/default_vinyl.png", {}
+        palette = self.cache.palette(cover_id) or ImageUtils.default_palette()
+        self.albums_map[unique_key] = {
+            "id": self._album_id(unique_key),
+            "title": album_name,
+            "artist": artist,
+            "cover_id": cover_id,
+            "cover_url": cover_url,
+            "cover_variants": cover_variants,
+            "accent_color": palette["accent"],
+            "raw_tracks": []
+        }
 
+    def _add_track(self, unique_key: str, meta: Dict, file_path: Path):
         self.albums_map[unique_key]["raw_tracks"].append({
+            "id": LibraryStore.track_id(str(file_path)),
             "title": meta["title"],
             "duration": meta["duration"],
             "duration_str": self._fmt_time(meta["duration"]),
-            "file_path": str(file_path)
+            "file_path": str(file_path),
+            "waveform": meta.get("waveform")
         })
 
-    def run(self):
+    def _iter_audio_files(self, top: Path = None):
+        for file_path, _, _ in self.listings.walk(top or self.cfg.MUSIC_DIR, self.cfg.AUDIO_EXT):
+            yield file_path
+
+    @staticmethod
+    def _resolved(value) -> Future:
+        future = Future()
+        future.set_result(value)
+        return future
+
+    def _submit(self, pool, fn, *args) -> Future:
+        if pool: return pool.submit(fn, *args)
+        return self._resolved(fn(*args))
+
+    def _parse_stale(self, stale, pool) -> Iterator[Tuple[Path, Dict]]:
+        """
+        Reads the tags (and waveform) of every new or modified file, without artwork, yielding
+        (path, meta) as results arrive; meta is empty for unreadable files.
+        The cover pass reads pictures only for albums that need them.
+
+        Files are parsed in the order given, which for a full scan is disk
+        order (see ScanCache.stale_files), and a Prefetcher reads each one
+        ahead of the parsers with IO_WORKERS threads, so how many reads wait
+        on the disk or network at once does not depend on how many processes
+        parse.
+        """
+        if pool is None and self.cfg.WAVEFORMS and np is not None:
+            # Waveforms never decode in this process (see compute_waveform), so a serial scan hands
+            # one private worker TAG_CHUNK_SIZE files per round trip rather than each track on its own
+            with self._start_pool(1) as pool:
+                yield from self._parse_stale(stale, pool)
+            return
+        prefetcher = Prefetcher(self.cfg.IO_WORKERS, whole_files=self.cfg.WAVEFORMS and np is not None)
+        warmed = ((f, fingerprint) for f, _, fingerprint in prefetcher.warmed((f, fingerprint[0], fingerprint) for f, fingerprint in stale))
+        if pool:
+            results = self._pooled_tags(warmed, pool)
+        else:
+            results = ((f, fingerprint, _tag_task(str(f), self.cfg.WAVEFORMS)) for f, fingerprint in warmed)
+
+        for file_path, fingerprint, meta in results:
+            SCAN_FILES.inc(result="parsed" if meta else "failed")
+            if meta:
+                meta.pop("cover_data", None)
+                self.cache.put(str(file_path), fingerprint, meta)
+            yield file_path, meta
+
+    def _pooled_tags(self, entries: Iterator, pool) -> Iterator[Tuple[Path, list, Dict]]:
+        """
+        Parses (path, fingerprint) entries on the pool TAG_CHUNK_SIZE at a time, in order. At most
+        two chunks per worker are queued, so the pool takes files only as fast as they are read ahead.
+        """
+        task = partial(metrics.collected, _tag_chunk, waveforms=self.cfg.WAVEFORMS)
+        in_flight = deque()
+        while True:
+            chunk = list(islice(entries, self.TAG_CHUNK_SIZE))
+            if chunk: in_flight.append((chunk, pool.submit(task, [str(f) for f, _ in chunk])))
+            if not in_flight: return
+            if chunk and len(in_flight) < 2 * self.cfg.SCAN_WORKERS: continue
+            chunk, job = in_flight.popleft()
+            for (file_path, fingerprint), meta in zip(chunk, self._merged(job.result())):
+                yield file_path, fingerprint, meta
+
+    @staticmethod
+    def _merged(result):
+        """Result of a metrics.collected() pool task, after merging the metrics it recorded."""
+        value, recorded = result
+        metrics.REGISTRY.merge(recorded)
+        return value
+
+    @contextmanager
+    def _stage(self, name: str):
+        # Stages can run several times per scan (once per album batch); the totals are reported
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = self.stage_times.get(name, 0.0) + time.perf_counter() - started
+
+    def _report_stages(self):
+        for stage, seconds in self.stage_times.items():
+            SCAN_STAGE_SECONDS.observe(seconds, stage=stage)
+        logging.info("Scan stages: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.stage_times.items()))
+
+    def _start_pool(self, workers: int = None) -> ProcessPoolExecutor:
+        workers = workers or self.cfg.SCAN_WORKERS
+        if workers > 1: logging.info(f"Parallel scan with {workers} workers")
+        # Spawned, not forked: a fork of the launcher would inherit the AudioEngine's open mixer
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=metrics.init_worker)
+
+    def cancel(self):
+        """Stops a running scan_iter() at the next file or album batch (thread-safe)."""
+        self._cancel.set()
+
+    def _event(self, force: bool = False, **changes) -> Optional[Dict]:
+        """Updates the progress counters; returns a snapshot if one is due."""
+        self.progress.update(changes)
+        now = time.monotonic()
+        if not force and "phase" not in changes and now - self._last_event < self.PROGRESS_INTERVAL: return None
+        self._last_event = now
+        elapsed = now - self._started
+        self.progress["elapsed"] = round(elapsed, 2)
+        self.progress["files_per_sec"] = round(self.progress["parsed"] / elapsed, 1) if elapsed else 0.0
+        return dict(self.progress)
+
+    def scan_iter(self) -> Iterator[Dict]:
+        """
+        Full scan as a stream of progress events:
+        {"phase", "discovered", "processed", "parsed", "failed", "albums", "albums_total", "files_per_sec", "elapsed"}
+        Phases run discover -> tags -> albums -> done, or end in "cancelled".
+
+        Unchanged files come straight from the fingerprint cache and only new
+        or modified files are opened. Memory does not grow with the number of
+        files: the walk, the stale files and each album's tracks live in the
+        scan cache's database and are read back a page or an album batch at a
+        time. Albums are finished in library order and written to the store
+        ALBUM_BATCH at a time, so only the album order (one key per album) is
+        held for the whole scan, never the album/track tree or any artwork.
+        """
+        self._cancel.clear()
+        self._started = time.monotonic()
+        self.progress = {"phase": "discover", "discovered": 0, "processed": 0, "parsed": 0, "failed": 0, "albums": 0, "albums_total": 0}
+        # Seconds spent per stage, reported to the metrics when the scan ends
+        self.stage_times = {}
+        self.listings = DirectoryCache(self.cfg.IMAGE_EXT)
         logging.info(f"Scanning: {self.cfg.MUSIC_DIR}")
-        
-        for root, _, files in os.walk(self.cfg.MUSIC_DIR):
-            for file in files:
-                if Path(file).suffix.lower() in self.cfg.AUDIO_EXT:
-                    self.process_file(Path(root) / file)
-
-        library_list = list(self.albums_map.values())
-        library_list.sort(key=lambda x: (x['artist'].lower(), x['title'].lower()))
-
-        for album in library_list:
-            tracks = album['raw_tracks']
-            tracks.sort(key=lambda x: x['title'])
-
-            count = len(tracks)
-            album['type'] = "Single" if count <= 2 else "Album"
-            album['discs'] = []
-            chunk_size = 8
-            
-            for i in range(0, count, chunk_size):
-                chunk = tracks[i : i + chunk_size]
-                disc_num = (i // chunk_size) + 1
-                album['discs'].append({
-                    "disc_number": disc_num,
-                    "tracks": chunk
-                })
-
-            del album['raw_tracks']
-
-        with open(self.cfg.DB_PATH, 'w', encoding='utf-8') as f:
-            json.dump(library_list, f, indent=4)
-        
+        yield self._event(force=True)
+
+        discovered = 0
+        with self._stage("walk"):
+            self.cache.begin_walk()
+            walked = []
+            for file_path, fingerprint, locality in self.listings.walk(self.cfg.MUSIC_DIR, self.cfg.AUDIO_EXT):
+                if self._cancel.is_set(): break
+                walked.append((str(file_path), discovered, *fingerprint, *locality))
+                discovered += 1
+                if len(walked) >= self.WALK_BATCH:
+                    self.cache.add_walked(walked)
+                    walked = []
+                event = self._event(discovered=discovered)
+                if event: yield event
+            self.cache.add_walked(walked)
+            cached, removed, affected = self.cache.walk_changes()
+        SCAN_FILES.inc(cached, result="cached")
+        if self._cancel.is_set():
+            yield self._event(phase="cancelled")
+            return
+
+        logging.info(f"{discovered} files, {discovered - cached} new or changed, {removed} removed")
+        yield self._event(phase="tags", processed=cached)
+
+        with ExitStack() as stack:
+            # The pool is only started once there are tags to parse or covers to render
+            pool = None
+            if self.cfg.SCAN_WORKERS > 1 and cached < discovered:
+                pool = stack.enter_context(self._start_pool())
+            with self._stage("tags"):
+                for file_path, meta in self._parse_stale(self.cache.stale_files(), pool):
+                    if meta: affected.add(self._album_key(meta)[0])
+                    event = self._event(processed=self.progress["processed"] + 1, parsed=self.progress["parsed"] + bool(meta),
+                                        failed=self.progress["failed"] + (not meta))
+                    if event: yield event
+                    if self._cancel.is_set(): break
+            if self._cancel.is_set():
+                if pool: pool.shutdown(wait=False, cancel_futures=True)
+                # Files parsed so far are kept, so the next scan resumes from here
+                self.cache.save()
+                yield self._event(phase="cancelled")
+                return
+
+            albums = self.cache.walked_albums()
+            albums.sort(key=lambda album: (album[1].lower(), album[2].lower(), album[3]))
+            order = [unique_key for unique_key, _, _, _ in albums]
+            names = {unique_key: (artist, album_name) for unique_key, artist, album_name, _ in albums}
+            del albums
+            if pool is None and self.cfg.SCAN_WORKERS > 1 and any(
+                key in affected or not self.cache.album_cover(key) for key in order
+            ):
+                pool = stack.enter_context(self._start_pool())
+            yield self._event(phase="albums", albums_total=len(order))
+
+            for start in range(0, len(order), self.ALBUM_BATCH):
+                batch = order[start:start + self.ALBUM_BATCH]
+                members = self.cache.walked_members(batch)
+                sources = {key: (members[key][0][0], members[key][0][1]["has_embedded_cover"]) for key in batch}
+                with self._stage("covers"):
+                    cover_ids = self._resolve_covers(sources, affected, pool)
+                self.albums_map = {}
+                for unique_key in batch:
+                    self._add_album(unique_key, *names[unique_key], cover_ids[unique_key])
+                    for file_path, meta in members.pop(unique_key):
+                        self._add_track(unique_key, meta, file_path)
+                    self.cache.set_album_cover(unique_key, cover_ids[unique_key])
+                with self._stage("write"):
+                    self.store.put_albums([(start + i, self._finalize_album(self.albums_map[key])) for i, key in enumerate(batch)])
+                    self.cache.written(batch)
+                self.albums_map = {}
+                yield self._event(albums=start + len(batch))
+                if self._cancel.is_set():
+                    self.store.renumber()
+                    self.cache.save()
+                    yield self._event(phase="cancelled")
+                    return
+
+        with self._stage("finalize"):
+            self.store.retain_albums({self._album_id(key) for key in order})
+            self.cache.end_walk()
+            self._collect_covers()
+            self.cache.save()
+            with self._export_write_lock:
+                # library.json is kept as a compatibility export of the store
+                self.store.export_json(self.cfg.DB_PATH)
+                self.atlas.build(self.store.album_summaries())
+        self.listings = DirectoryCache(self.cfg.IMAGE_EXT)
+        self._report_stages()
         logging.info(f"Done. Database saved.")
+        yield self._event(phase="done")
+
+    def _resolve_covers(self, sources: Dict[str, Tuple[Path, bool]], affected: set, pool) -> Dict[str, Optional[str]]:
+        """
+        Cover id per album key, from (source track, has embedded art). Artwork
+        is hashed per album, but albums sharing artwork (compilations, duplicate
+        rips) share one rendered cover that is decoded and encoded only once.
+        Unaffected albums reuse their cached cover id without reading anything.
+        """
+        cover_ids, pending, rendered = {}, {}, 0
+        for unique_key, (file_path, embedded) in sources.items():
+            cached = self.cache.album_cover(unique_key)
+            if unique_key not in affected and cached and self.cfg.cover_path(cached).exists():
+                cover_ids[unique_key] = cached
+            elif pool:
+                pending[unique_key] = pool.submit(metrics.collected, _cover_hash_task, str(file_path), embedded,
+                                                  self.cfg.IMAGE_EXT, self.listings.images(file_path.parent))
+            else:
+                # Serial: the artwork just read for hashing is rendered right away if it is new
+                cover_data = read_artwork(file_path, embedded, self.cfg.IMAGE_EXT, self.listings.images(file_path.parent))
+                cover_id = cover_ids[unique_key] = cover_hash(cover_data) if cover_data else None
+                if cover_id and not self._cover_ready(cover_id):
+                    self.cache.set_palette(cover_id, render_cover(cover_data, cover_id, self.cfg))
+                    rendered += 1
+        cover_ids.update((unique_key, self._merged(job.result())) for unique_key, job in pending.items())
+
+        # Pool: each distinct new cover is rendered by one worker, re-reading a single track
+        render_jobs = {}
+        for unique_key, cover_id in cover_ids.items():
+            if unique_key not in pending or not cover_id or cover_id in render_jobs: continue
+            if self._cover_ready(cover_id): continue
+            file_path, embedded = sources[unique_key]
+            render_jobs[cover_id] = pool.submit(metrics.collected, _cover_task, str(file_path), embedded, cover_id, self.cfg,
+                                                self.listings.images(file_path.parent))
+        for cover_id, job in render_jobs.items():
+            self.cache.set_palette(cover_id, self._merged(job.result()))
+        rendered += len(render_jobs)
+        logging.info(f"{len(set(cover_ids.values()) - {None})} distinct covers, {rendered} rendered")
+        return cover_ids
+
+    def _cover_ready(self, cover_id: str) -> bool:
+        return self.cache.palette(cover_id) is not None and self.cfg.cover_path(cover_id).exists()
+
+    def _collect_covers(self, candidates: set = None):
+        """
+        Deletes rendered covers no album in the store refers to any more: all
+        of the covers dir, or after a watcher update only the covers in
+        `candidates` (those the updated albums used before). Legacy covers are
+        left to the next full scan.
+        """
+        if candidates is not None:
+            orphaned = candidates - self.store.cover_ids(candidates)
+            self.cache.forget_palettes(orphaned)
+            for cover_id in orphaned:
+                for size in self.cfg.COVER_SIZES:
+                    self.cfg.cover_path(cover_id, size).unlink(missing_ok=True)
+            if orphaned: logging.info(f"Removed {len(orphaned)} orphaned covers")
+            return
+        referenced = self.store.cover_ids()
+        self.cache.retain_palettes(referenced)
+        # Albums imported from an old library.json point at legacy covers until they are rescanned
+        legacy_in_use = {url.rsplit("/", 1)[-1] for url in self.store.cover_urls()}
+        removed = 0
+        for entry in os.scandir(self.cfg.COVERS_DIR):
+            match = self.COVER_FILE_RE.match(entry.name)
+            if match: orphaned = match.group(1) not in referenced
+            else: orphaned = bool(self.LEGACY_COVER_RE.match(entry.name)) and entry.name not in legacy_in_use
+            if orphaned:
+                os.remove(entry.path)
+                removed += 1
+        if removed: logging.info(f"Removed {removed} orphaned cover files")
+
+    def _finalize_album(self, album: Dict) -> Dict:
+        """Sorts raw_tracks and splits them into discs."""
+        tracks = album['raw_tracks']
+        tracks.sort(key=lambda x: x['title'])
+
+        count = len(tracks)
+        album['type'] = "Single" if count <= 2 else "Album"
+        album['discs'] = []
+        chunk_size = 8
+        
+        for i in range(0, count, chunk_size):
+            chunk = tracks[i : i + chunk_size]
+            disc_num = (i // chunk_size) + 1
+            album['discs'].append({
+                "disc_number": disc_num,
+                "tracks": chunk
+            })
+
+        del album['raw_tracks']
+        return album
+
+    def update_files(self, paths) -> Dict:
+        """
+        Applies filesystem changes without a rescan. Only the given files (or
+        directories) are stat'ed and parsed, and only the albums they belong to
+        are rebuilt in the store, along with their old covers; library.json and
+        the atlas follow after a quiet period (flush_exports). Returns the delta
+        for the server:
+        {"updated": [album, ...], "removed": [album_id, ...], "removed_files": [path, ...]}
+        """
+        self.listings = DirectoryCache(self.cfg.IMAGE_EXT)
+        changed, removed = [], set()
+        for path in map(Path, paths):
+            under_path = set(self.cache.paths_under(path))
+            if path.is_dir():
+                found = list(self._iter_audio_files(path))
+                changed.extend(found)
+                removed.update(under_path - {str(f) for f in found})
+            elif path.exists() and path.suffix.lower() in self.cfg.AUDIO_EXT:
+                changed.append(path)
+            else:
+                removed.update(under_path)
+
+        affected = set()
+        for file_path in removed:
+            unique_key = self.cache.remove(file_path)
+            if unique_key: affected.add(unique_key)
+
+        stale = []
+        for file_path in dict.fromkeys(changed):
+            fingerprint = ScanCache.fingerprint(file_path)
+            if self.cache.get(str(file_path), fingerprint) is not None: continue
+            previous = self.cache.remove(str(file_path))
+            if previous: affected.add(previous)
+            stale.append((file_path, fingerprint))
+
+        parsed = {file_path: meta for file_path, meta in self._parse_stale(stale, None) if meta}
+        affected.update(self._album_key(meta)[0] for meta in parsed.values())
+        self.cache.flush()
+
+        previous_covers = {self.cache.album_cover(key) for key in affected} - {None}
+        members = self.cache.album_members(affected)
+        sources, removed_ids = {}, []
+        for unique_key in affected:
+            tracks = members.get(unique_key)
+            if not tracks:
+                removed_ids.append(self._album_id(unique_key))
+                self.cache.set_album_cover(unique_key, None)
+                continue
+            embedded = next((p for p, meta in tracks if meta["has_embedded_cover"]), None)
+            sources[unique_key] = (embedded or tracks[0][0], embedded is not None)
+        cover_ids = self._resolve_covers(sources, affected, None)
+
+        self.albums_map = {}
+        updated = []
+        for unique_key, cover_id in cover_ids.items():
+            tracks = members[unique_key]
+            _, artist, album_name = self._album_key(tracks[0][1])
+            self._add_album(unique_key, artist, album_name, cover_id)
+            for file_path, meta in tracks:
+                self._add_track(unique_key, meta, file_path)
+            updated.append(self._finalize_album(self.albums_map[unique_key]))
+            self.cache.set_album_cover(unique_key, cover_id)
+
+        if updated or removed_ids:
+            self.store.update_albums(updated, removed_ids)
+            self.cache.written(affected)
+            self._collect_covers(previous_covers)
+            self._schedule_export()
+        self.cache.save()
+        logging.info(f"Applied {len(paths)} changes: {len(updated)} albums updated, {len(removed_ids)} removed")
+        return {"updated": updated, "removed": removed_ids, "removed_files": sorted(removed)}
+
+    def _schedule_export(self):
+        """
+        Rebuilds library.json and the cover atlas once updates stop for
+        EXPORT_DELAY seconds: both cover the whole library, so a burst of
+        watcher batches pays for them once.
+        """
+        with self._export_lock:
+            if self._export_timer: self._export_timer.cancel()
+            self._export_timer = threading.Timer(self.EXPORT_DELAY, self.flush_exports)
+            self._export_timer.daemon = True
+            self._export_timer.start()
+
+    def flush_exports(self):
+        """Runs a pending library.json/atlas rebuild now; call when the watcher stops."""
+        with self._export_lock:
+            timer, self._export_timer = self._export_timer, None
+        if timer is None: return
+        timer.cancel()
+        with self._export_write_lock:
+            self.store.export_json(self.cfg.DB_PATH)
+            self.atlas.build(self.store.album_summaries())
+
+    def run(self):
+        for _ in self.scan_iter(): pass
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
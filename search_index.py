@@ -0,0 +1,313 @@
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, List, Optional
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=65536)
+def tokenize(text: str) -> tuple:
+    """Lowercased, accent-folded word tokens ("Beyoncé - Halo" -> ("beyonce", "halo"))."""
+    if not text: return ()
+    text = str(text)
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return tuple(_TOKEN_RE.findall(text.lower()))
+
+
+class SearchIndex:
+    """
+    Inverted index over album titles, artists and track titles.
+
+    Postings map each token to the documents containing it, per field; a sorted
+    token list answers prefix lookups with bisect, so "beat" matches "beatles".
+    One- and two-letter prefixes, which expand to much of the vocabulary, keep
+    postings of their own once queried. Every query term must match (AND); the
+    kind and artist filters are answered from postings too. Albums and tracks
+    are added or removed one album at a time, so a rescan or watcher event
+    never rebuilds the index.
+    """
+
+    # Relevance weight of a term hit per field
+    FIELD_WEIGHTS = {"title": 3.0, "artist": 2.0, "album": 1.5}
+    EXACT_BONUS = 2.0
+    ALBUM_BONUS = 0.5
+    # Prefixes up to this long have their own postings instead of a union over the vocabulary
+    SHORT_PREFIX = 2
+    # Above this many candidates only whole-word matches, or else matches of the first
+    # MAX_EXPANSION words a term prefixes, are ranked, if there are enough of them
+    PRUNE_THRESHOLD = 2000
+    MAX_EXPANSION = 64
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, set]] = {}
+        self._prefix_postings: Dict[str, Dict[str, set]] = {}
+        self._vocab: List[str] = []
+        self._docs: Dict[int, Dict] = {}
+        self._kind_docs: Dict[str, set] = {}
+        self._artist_docs: Dict[str, set] = {}
+        # Per kind, doc ids in the order a query without terms ranks them; built on demand
+        self._browse: Dict[str, List[int]] = {}
+        self._album_docs: Dict[str, List[int]] = {}
+        self._album_sigs: Dict[str, int] = {}
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    @staticmethod
+    def _signature(album: Dict) -> int:
+        tracks = tuple(
+            (t.get("title"), t.get("duration"), t.get("file_path"))
+            for disc in album.get("discs", []) for t in disc.get("tracks", [])
+        )
+        return hash((album.get("title"), album.get("artist"), album.get("cover_url"), tracks))
+
+    def rebuild(self, library: List[Dict]):
+        with self._lock:
+            self._postings, self._prefix_postings, self._vocab, self._docs = {}, {}, [], {}
+            self._kind_docs, self._artist_docs, self._browse, self._album_docs, self._album_sigs = {}, {}, {}, {}, {}
+            for album in library:
+                self._add_album(album, sort_vocab=False)
+            self._vocab = sorted(self._postings)
+
+    def sync(self, library: List[Dict]):
+        """Brings the index in line with a freshly scanned library, touching only albums that changed."""
+        with self._lock:
+            if not self._docs:
+                self.rebuild(library)
+                return
+            live = {album["id"]: album for album in library}
+            for album_id in [a for a in self._album_docs if a not in live]:
+                self._remove_album(album_id)
+            for album_id, album in live.items():
+                if self._album_sigs.get(album_id) != self._signature(album):
+                    self._remove_album(album_id)
+                    self._add_album(album, sort_vocab=True)
+
+    def add_album(self, album: Dict):
+        """Indexes an album and its tracks, replacing any previous entry with the same id."""
+        with self._lock:
+            self._remove_album(album["id"])
+            self._add_album(album, sort_vocab=True)
+
+    def remove_album(self, album_id: str):
+        with self._lock:
+            self._remove_album(album_id)
+
+    def _add_album(self, album: Dict, sort_vocab: bool):
+        fields = {"title": album.get("title", ""), "artist": album.get("artist", "")}
+        doc_ids = [self._add_doc("album", album, None, fields, sort_vocab)]
+        for disc in album.get("discs", []):
+            for track in disc.get("tracks", []):
+                fields = {"title": track.get("title", ""), "artist": album.get("artist", ""), "album": album.get("title", "")}
+                doc_ids.append(self._add_doc("track", album, track, fields, sort_vocab))
+        self._album_docs[album["id"]] = doc_ids
+        self._album_sigs[album["id"]] = self._signature(album)
+        self._browse = {}
+
+    def _add_doc(self, kind: str, album: Dict, track: Optional[Dict], fields: Dict, sort_vocab: bool) -> int:
+        doc_id = self._next_id
+        self._next_id += 1
+        tokens = {field: tokenize(text) for field, text in fields.items()}
+        self._docs[doc_id] = {
+            "kind": kind,
+            "album_id": album["id"],
+            "title": fields["title"],
+            "artist": album.get("artist", ""),
+            "album": album.get("title", ""),
+            "cover_url": album.get("cover_url"),
+            "duration": track.get("duration") if track else None,
+            "file_path": track.get("file_path") if track else None,
+            "tokens": tokens,
+        }
+        self._kind_docs.setdefault(kind, set()).add(doc_id)
+        self._artist_docs.setdefault(album.get("artist", "").casefold(), set()).add(doc_id)
+        for field, field_tokens in tokens.items():
+            for token in field_tokens:
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    if sort_vocab: bisect.insort(self._vocab, token)
+                posting.setdefault(field, set()).add(doc_id)
+            if self._prefix_postings:
+                for prefix in self._short_prefixes(field_tokens):
+                    posting = self._prefix_postings.get(prefix)
+                    if posting is not None: posting.setdefault(field, set()).add(doc_id)
+        return doc_id
+
+    def _short_prefixes(self, tokens) -> set:
+        # A token shorter than n yields itself, which the set absorbs
+        return {token[:n] for token in tokens for n in range(1, self.SHORT_PREFIX + 1)}
+
+    @staticmethod
+    def _discard(index: Dict, key, doc_id: int):
+        docs = index.get(key)
+        if docs is not None:
+            docs.discard(doc_id)
+            if not docs: del index[key]
+
+    def _remove_album(self, album_id: str):
+        self._album_sigs.pop(album_id, None)
+        doc_ids = self._album_docs.pop(album_id, [])
+        if doc_ids: self._browse = {}
+        for doc_id in doc_ids:
+            doc = self._docs.pop(doc_id)
+            self._discard(self._kind_docs, doc["kind"], doc_id)
+            self._discard(self._artist_docs, doc["artist"].casefold(), doc_id)
+            for field, field_tokens in doc["tokens"].items():
+                if self._prefix_postings:
+                    for prefix in self._short_prefixes(field_tokens):
+                        posting = self._prefix_postings.get(prefix)
+                        if posting is not None: self._discard(posting, field, doc_id)
+                for token in field_tokens:
+                    posting = self._postings.get(token)
+                    if posting is None: continue
+                    docs = posting.get(field)
+                    if docs is not None:
+                        docs.discard(doc_id)
+                        if not docs: del posting[field]
+                    if not posting:
+                        del self._postings[token]
+                        i = bisect.bisect_left(self._vocab, token)
+                        if i < len(self._vocab) and self._vocab[i] == token: del self._vocab[i]
+
+    def _expand(self, term: str, limit: int = None) -> List[str]:
+        """Vocabulary tokens starting with term, in order; the first `limit` of them if given."""
+        start = bisect.bisect_left(self._vocab, term)
+        end = bisect.bisect_left(self._vocab, term + "\U0010ffff", start)
+        if limit is not None: end = min(end, start + limit)
+        return self._vocab[start:end]
+
+    def _union(self, tokens) -> Dict[str, set]:
+        sets = {}
+        for token in tokens:
+            for field, docs in self._postings[token].items():
+                sets.setdefault(field, []).append(docs)
+        return {field: set().union(*docs) for field, docs in sets.items()}
+
+    def _term_sets(self, term: str):
+        """Per field: docs containing the whole word, and docs containing any word it prefixes."""
+        exact = self._postings.get(term, {})
+        if len(term) <= self.SHORT_PREFIX:
+            prefix = self._prefix_postings.get(term)
+            if prefix is None:
+                prefix = self._prefix_postings[term] = self._union(self._expand(term))
+            return exact, prefix
+        return exact, self._union(self._expand(term))
+
+    def _browse_order(self, kind: str) -> List[int]:
+        order = self._browse.get(kind)
+        if order is None:
+            docs = self._docs
+            order = self._browse[kind] = sorted(self._kind_docs.get(kind, ()), key=lambda d: (len(docs[d]["title"]), d))
+        return order
+
+    def search(self, query: str = "", limit: int = 20, kind: str = None, artist: str = None,
+               title_prefix: str = None, min_duration: float = None, max_duration: float = None) -> List[Dict]:
+        """
+        Ranked documents matching every term of the query (the last term may be
+        partial). kind ("album"/"track"), artist (case-insensitive exact),
+        title_prefix and a duration range narrow the result further.
+        """
+        terms = tokenize(query)
+        artist = artist.casefold() if artist else None
+        title_prefix = title_prefix.casefold() if title_prefix else None
+
+        with self._lock:
+            # Filters answered from postings, smallest first
+            filter_sets = []
+            if kind: filter_sets.append(self._kind_docs.get(kind, set()))
+            if artist: filter_sets.append(self._artist_docs.get(artist, set()))
+            filter_sets.sort(key=len)
+
+            term_sets = [self._term_sets(term) for term in terms]
+            candidates = None
+            ranked = None
+            if term_sets:
+                exact_candidates = None
+                for exact, prefix in sorted(term_sets, key=lambda ts: sum(map(len, ts[1].values()))):
+                    matched = set().union(*prefix.values())
+                    whole = set().union(*exact.values())
+                    candidates = matched if candidates is None else candidates & matched
+                    exact_candidates = whole if exact_candidates is None else exact_candidates & whole
+                    if not candidates: return []
+                for docs in filter_sets:
+                    candidates = candidates & docs
+                    if not candidates: return []
+                exact_candidates &= candidates
+                # Whole-word hits outrank prefix-only ones, and a term's nearest words are the
+                # likeliest completions, so a huge candidate set only needs that part ranked when
+                # it fills the page. Matching never depends on it: filters see every candidate.
+                if len(candidates) > self.PRUNE_THRESHOLD:
+                    if len(exact_candidates) >= limit:
+                        ranked = exact_candidates
+                    else:
+                        near = candidates
+                        for term in terms:
+                            near = near & set().union(*self._union(self._expand(term, self.MAX_EXPANSION)).values())
+                        if len(near) >= limit: ranked = near
+            elif filter_sets:
+                candidates = filter_sets[0]
+                for docs in filter_sets[1:]:
+                    candidates = candidates & docs
+
+            filtered = title_prefix or min_duration is not None or max_duration is not None
+
+            def passes(doc):
+                if title_prefix and not doc["title"].casefold().startswith(title_prefix): return False
+                if min_duration is not None and (doc["duration"] or 0) < min_duration: return False
+                if max_duration is not None and (doc["duration"] is None or doc["duration"] > max_duration): return False
+                return True
+
+            if not term_sets and (candidates is None or len(candidates) > self.PRUNE_THRESHOLD):
+                # Without terms the score is the kind bonus alone: walk the docs in rank order
+                kinds = [kind] if kind else ["album", "track"]
+                top = []
+                for doc_id in chain.from_iterable(self._browse_order(k) for k in kinds):
+                    if candidates is not None and doc_id not in candidates: continue
+                    doc = self._docs[doc_id]
+                    if filtered and not passes(doc): continue
+                    top.append((-(self.ALBUM_BONUS if doc["kind"] == "album" else 0.0), doc_id))
+                    if len(top) == limit: break
+                return [self._result(doc_id, -neg_score) for neg_score, doc_id in top]
+
+            # Per term: (exact weight, whole-word docs, prefix weight, prefix docs) for each field
+            scoring = [
+                [(weight * self.EXACT_BONUS, exact.get(field, ()), weight, prefix.get(field, ()))
+                 for field, weight in self.FIELD_WEIGHTS.items() if field in prefix]
+                for exact, prefix in term_sets
+            ]
+
+            def rank(doc_ids):
+                results = []
+                for doc_id in doc_ids:
+                    doc = self._docs[doc_id]
+                    if filtered and not passes(doc): continue
+
+                    score = self.ALBUM_BONUS if doc["kind"] == "album" else 0.0
+                    for fields in scoring:
+                        best = 0.0
+                        for exact_weight, exact_docs, prefix_weight, prefix_docs in fields:
+                            if doc_id in exact_docs:
+                                if exact_weight > best: best = exact_weight
+                            elif prefix_weight > best and doc_id in prefix_docs:
+                                best = prefix_weight
+                        score += best
+                    results.append((-score, len(doc["title"]), doc_id))
+                return results
+
+            results = rank(ranked if ranked is not None else candidates)
+            if ranked is not None and len(results) < limit:
+                # The title and duration filters left too few of the pruned set
+                results = rank(candidates)
+            return [self._result(doc_id, -neg_score) for neg_score, _, doc_id in heapq.nsmallest(limit, results)]
+
+    def _result(self, doc_id: int, score: float) -> Dict:
+        return {key: value for key, value in self._docs[doc_id].items() if key != "tokens"} | {"score": round(score, 3)}
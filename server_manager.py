@@ -2,29 +2,62 @@ import uvicorn
 import threading
 import os
 import json
+import gzip
+import hashlib
 import logging
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, RedirectResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from audio_engine import AudioEngine
+from audio_analysis import SpectrumAnalyzer, np
+from audio_stream import StreamResponse, Transcoder, media_type
+from event_hub import EventHub, negotiate
+from library_store import LibraryStore
+from search_index import SearchIndex
+from static_assets import AssetFiles, AssetManifest
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("VinylServer")
 
+# Client actions get their own label; anything else is counted as "other"
+WS_ACTIONS = ("UPDATE_NAV", "PLAY", "STOP", "PAUSE", "VOLUME", "SEEK")
+WS_MESSAGES = metrics.REGISTRY.counter("vinyl_ws_messages_received_total", "Commands received from WebSocket clients", ("action",))
+WS_COMMAND_SECONDS = metrics.REGISTRY.histogram("vinyl_ws_command_seconds", "Handling a WebSocket command", ("action",))
+
 class VinylServer:
-    def __init__(self, app_data_path):
+    def __init__(self, app_data_path, position_rate=4.0, spectrum_rate=30.0, host="127.0.0.1", port=8000):
         self.app_data_path = app_data_path
-        self.host = "127.0.0.1"
-        self.port = 8000
+        self.host = host
+        self.port = port
         self.server_thread = None
         self.uvicorn_server = None
         self.is_running = False
         self.audio = AudioEngine()
+        # Position updates per second pushed to clients while a track plays
+        self.position_rate = position_rate
+        self._position_task = None
+        # Binary spectrum frames per second while a track plays (needs NumPy)
+        self.spectrum_rate = spectrum_rate
+        self.analyzer = SpectrumAnalyzer(self.audio.sample_rate, self.audio.channels) if np is not None else None
+        self._spectrum_task = None
         self.config_path = os.path.join(app_data_path, "debug_config.json")
         self.library_path = os.path.join(self.app_data_path, "library.json")
+        self.store = LibraryStore(os.path.join(self.app_data_path, "library.db"))
+        self._config_cache = (None, {})
+        # Opus/MP3 copies for /api/stream clients that cannot play the original (needs ffmpeg)
+        self.transcoder = Transcoder(os.path.join(self.app_data_path, "transcode"))
+        # Serialized /api/library: (etag, {content-encoding: body}), rebuilt lazily after a scan
+        self._library_payload = None
+        self._library_lock = threading.Lock()
         
         self.nav_state = {
             "sortMode": "RAW",
@@ -39,29 +72,211 @@ class VinylServer:
             "playing": False,
             "title": "Select a Track",
             "artist": "Unknown Artist",
-            "cover_path": None
+            "cover_path": None,
+            "file_path": None
         }
+        # Titles of the tracks queued after the current one, by file path
+        self._queue_titles = {}
 
         self.track_cover_map = {} 
-        self.load_metadata_map()
+        self.search_index = SearchIndex()
+
+        # Every connected tab gets playback, navigation and library events
+        self.hub = EventHub()
+        metrics.REGISTRY.gauge("vinyl_ws_clients", "Connected WebSocket clients", function=lambda: len(self.hub))
+        # Bumped on each natural track end; tabs echo it in their auto-advance PLAY
+        # so only the first of them starts the next track
+        self.finish_seq = 0
+        self._pending_finish = None
+        self.audio.add_listener(self._on_audio_event)
+        # The cover map and search index are loaded by start() and serve()
 
     def load_metadata_map(self):
-        if not os.path.exists(self.library_path): return
+        self.invalidate_library()
         try:
-            with open(self.library_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            for album in data:
-                rel_path = album.get("cover_url", "").lstrip("/")
-                abs_cover_path = os.path.join(self.app_data_path, rel_path)
-                if "discs" in album:
-                    for disc in album["discs"]:
-                        for track in disc["tracks"]:
-                            self.track_cover_map[track["file_path"]] = abs_cover_path
+            # Libraries scanned before the SQLite store existed only have library.json
+            if not self.store.exists() and os.path.exists(self.library_path):
+                self.store.import_json(self.library_path)
+            self.track_cover_map = {
+                file_path: os.path.join(self.app_data_path, cover_url.lstrip("/"))
+                for file_path, cover_url in self.store.track_cover_map().items()
+            }
+            self.search_index.sync(self.store.load_library())
         except Exception as e:
             print(f"[Server] Map Build Error: {e}")
 
+    def apply_library_delta(self, delta):
+        """Folds a watcher update (LibraryScanner.update_files) into the in-memory maps and pushes it to clients."""
+        for file_path in delta["removed_files"]:
+            self.track_cover_map.pop(file_path, None)
+        for album_id in delta["removed"]:
+            self.search_index.remove_album(album_id)
+        for album in delta["updated"]:
+            cover_url = LibraryStore.thumbnail_url(album["cover_url"], album.get("cover_variants", {}))
+            abs_cover_path = os.path.join(self.app_data_path, cover_url.lstrip("/"))
+            for disc in album["discs"]:
+                for track in disc["tracks"]:
+                    self.track_cover_map[track["file_path"]] = abs_cover_path
+            self.search_index.add_album(album)
+        self.invalidate_library()
+
+        self.broadcast({
+            "status": "library_delta",
+            "updated": [{field: album[field] for field in LibraryStore.SUMMARY_FIELDS} for album in delta["updated"]],
+            "removed": delta["removed"]
+        })
+
+    def broadcast(self, message: dict, exclude=None):
+        """Sends a message to every connected client. Safe to call from any thread."""
+        self.hub.publish(message, exclude)
+
+    def _on_audio_event(self, event, file_path):
+        # Runs on the audio engine's watcher thread
+        if event == "advanced":
+            self._set_track(file_path, self._queue_titles.get(file_path, "Unknown"), self.state["artist"])
+            self.broadcast(self._playing_message())
+        elif event == "finished":
+            self.state["playing"] = False
+            self.finish_seq += 1
+            self._pending_finish = self.finish_seq
+            self.broadcast({"status": "finished", "seq": self.finish_seq})
+
+    async def _stream_position(self):
+        """Pushes the engine's position to every client while something plays, and once more when it stops."""
+        was_playing = False
+        while len(self.hub):
+            position = self.audio.get_position()
+            if position["playing"] or was_playing:
+                self.broadcast({"status": "position", **position})
+            was_playing = position["playing"]
+            await asyncio.sleep(1.0 / self.position_rate)
+        self._position_task = None
+
+    async def _stream_spectrum(self):
+        """Pushes SpectrumAnalyzer frames of the audible PCM to every client while something plays."""
+        while len(self.hub):
+            block = self.audio.pcm_block(self.analyzer.BLOCK)
+            if block is not None:
+                position, pcm = block
+                # The mixer opens on first play and may not have the format the analyzer was built for
+                if (self.analyzer.rate, self.analyzer.channels) != (self.audio.sample_rate, self.audio.channels):
+                    self.analyzer = SpectrumAnalyzer(self.audio.sample_rate, self.audio.channels)
+                self.hub.publish_binary(self.analyzer.frame(pcm, position))
+                await asyncio.sleep(1.0 / self.spectrum_rate)
+            else:
+                await asyncio.sleep(1.0 / self.position_rate)
+        self._spectrum_task = None
+
+    def _set_track(self, file_path, title, artist):
+        self.state["title"] = title
+        self.state["artist"] = artist
+        self.state["cover_path"] = self.track_cover_map.get(file_path, None)
+        self.state["file_path"] = file_path
+        self.state["playing"] = True
+
+    def _playing_message(self):
+        return {"status": "playing", "track": self.state["title"], "artist": self.state["artist"], "file_path": self.state["file_path"]}
+
+    def invalidate_library(self):
+        self._library_payload = None
+
+    def get_library_payload(self):
+        """Serializes and compresses the library once per scan, not once per request."""
+        payload = self._library_payload
+        if payload is None:
+            with self._library_lock:
+                payload = self._library_payload
+                if payload is None:
+                    body = json.dumps(self.store.load_library(), separators=(",", ":")).encode("utf-8")
+                    variants = {"identity": body, "gzip": gzip.compress(body, compresslevel=6)}
+                    if brotli: variants["br"] = brotli.compress(body, quality=9)
+                    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+                    payload = self._library_payload = (etag, variants)
+        return payload
+
+    @staticmethod
+    def _pick_encoding(accept_encoding: str, available) -> str:
+        accepted = set()
+        for part in accept_encoding.split(","):
+            token, _, params = part.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"): continue
+            accepted.add(token.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in available and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    def load_debug_config(self):
+        """debug_config.json is reparsed only when its mtime changes."""
+        if not os.path.exists(self.config_path): return {}
+        mtime = os.path.getmtime(self.config_path)
+        cached_mtime, cached = self._config_cache
+        if mtime != cached_mtime:
+            with open(self.config_path, 'r') as f: cached = json.load(f)
+            self._config_cache = (mtime, cached)
+        return cached
+
+    async def _handle_command(self, websocket, action, payload):
+        if action == "UPDATE_NAV":
+            changed = {k: v for k, v in payload.items() if self.nav_state.get(k) != v}
+            if changed:
+                self.nav_state.update(changed)
+                self.broadcast({"status": "nav", "navigation": self.nav_state}, exclude=websocket)
+
+        elif action == "PLAY":
+            if payload and "file_path" in payload:
+                fpath = payload["file_path"]
+
+                # Every open tab auto-advances on "finished"; only the first one counts
+                if "finished_seq" in payload:
+                    if payload["finished_seq"] != self._pending_finish: return
+                    self._pending_finish = None
+
+                print(f"[WS] Received PLAY command for: {payload.get('title')}")
+
+                # Update local state first
+                self._set_track(fpath, payload.get("title", "Unknown"), payload.get("artist", ""))
+                # The rest of the disc, played gaplessly after this track
+                queue = payload.get("queue") or []
+                self._queue_titles = {item["file_path"]: item.get("title", "Unknown") for item in queue}
+
+                # Runs on the engine's command thread
+                await asyncio.wrap_future(self.audio.play(
+                    fpath, payload.get("start_time", 0),
+                    [item["file_path"] for item in queue], payload.get("crossfade")
+                ))
+                self.broadcast(self._playing_message())
+
+        elif action == "STOP":
+            print("[WS] Received STOP command")
+            await asyncio.wrap_future(self.audio.stop())
+            self.state["playing"] = False
+            self.broadcast({"status": "stopped"})
+
+        elif action == "PAUSE":
+            print("[WS] Received PAUSE command")
+            playing = await asyncio.wrap_future(self.audio.pause())
+            self.state["playing"] = playing
+            self.broadcast(self._playing_message() if playing else {"status": "paused"})
+
+        elif action == "VOLUME":
+            val = payload.get("value", 0.5)
+            # Not awaited: a knob drag posts many of these and the engine keeps only the latest
+            self.audio.set_volume(val)
+            self.broadcast({"status": "volume", "value": val}, exclude=websocket)
+
+        elif action == "SEEK":
+            t = payload.get("time", 0)
+            self.audio.seek(t)
+
     def _create_app(self):
-        app = FastAPI()
+        @asynccontextmanager
+        async def lifespan(app):
+            yield
+            # Also runs when the headless server exits on SIGINT/SIGTERM
+            await asyncio.wrap_future(self.audio.stop())
+
+        app = FastAPI(lifespan=lifespan)
         
         app.add_middleware(
             CORSMiddleware,
@@ -72,31 +287,125 @@ class VinylServer:
 
         static_dir = os.path.join(self.app_data_path, "static")
         os.makedirs(static_dir, exist_ok=True)
-        app.mount("/static", StaticFiles(directory=static_dir), name="static")
+        # Hashed once per server start; edits to the frontend need a restart
+        manifest = AssetManifest(static_dir)
+        manifest.build()
+        static_files = AssetFiles(directory=static_dir, manifest=manifest, pick_encoding=self._pick_encoding)
+        app.mount("/static", static_files, name="static")
 
         @app.get("/")
-        async def root():
-            return RedirectResponse(url="/static/index.html")
+        def root(request: Request):
+            if not os.path.exists(os.path.join(static_dir, "index.html")):
+                return RedirectResponse(url="/static/index.html")
+            return static_files.index_response(request.headers)
 
         @app.get("/api/library")
-        def get_library():
-            if os.path.exists(self.library_path):
-                with open(self.library_path, 'r') as f: return json.load(f)
-            return []
+        def get_library(request: Request):
+            etag, variants = self.get_library_payload()
+            # no-cache: the browser keeps its copy but revalidates it with If-None-Match
+            headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+            if_none_match = request.headers.get("if-none-match", "")
+            if if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+                return Response(status_code=304, headers=headers)
+
+            encoding = self._pick_encoding(request.headers.get("accept-encoding", ""), variants)
+            if encoding != "identity": headers["Content-Encoding"] = encoding
+            return Response(content=variants[encoding], media_type="application/json", headers=headers)
+
+        @app.get("/api/albums")
+        def get_albums(sort: str = "position", order: str = "asc", cursor: str = None, limit: int = 200):
+            """Album summaries for crates and overview; discs and tracks come from /api/albums/{id}."""
+            limit = max(1, min(limit, 1000))
+            try:
+                albums, next_cursor = self.store.album_page(sort, order == "desc", cursor, limit)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return {"albums": albums, "next_cursor": next_cursor, "total": self.store.album_count()}
+
+        @app.get("/api/albums/{album_id}")
+        def get_album(album_id: str):
+            album = self.store.get_album(album_id)
+            if album is None: raise HTTPException(status_code=404, detail="Album not found")
+            return album
+
+        @app.get("/api/albums/{album_id}/waveforms")
+        def get_waveforms(album_id: str):
+            """Scan-time waveforms of the album's tracks: {file_path: base64 peaks}."""
+            return self.store.album_waveforms(album_id)
+
+        @app.api_route("/api/stream/{track_id}", methods=["GET", "HEAD"])
+        def stream_track(track_id: str, request: Request, format: str = None):
+            """The track's audio file, with Range support; ?format=opus|mp3 serves a cached transcode."""
+            file_path = self.store.track_path(track_id)
+            if file_path is None or not os.path.isfile(file_path):
+                raise HTTPException(status_code=404, detail="Track not found")
+
+            path = file_path
+            if format and format not in Transcoder.FORMATS:
+                raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(Transcoder.FORMATS)}")
+            # Files already in the requested format are served as they are
+            if format and not file_path.lower().endswith(Transcoder.FORMATS[format][2]):
+                if not self.transcoder.available:
+                    raise HTTPException(status_code=501, detail="Transcoding needs ffmpeg")
+                try:
+                    path = self.transcoder.get(track_id, file_path, format)
+                except Exception as e:
+                    logger.error(f"Transcode failed for {file_path}: {e}")
+                    raise HTTPException(status_code=500, detail="Transcode failed")
+
+            return StreamResponse(path, media_type(path), request.headers.get("range"), request.headers.get("if-range"))
+
+        @app.get("/api/search")
+        def search(q: str = "", kind: str = None, artist: str = None, title_prefix: str = None,
+                   min_duration: float = None, max_duration: float = None, limit: int = 20):
+            if kind not in (None, "album", "track"):
+                raise HTTPException(status_code=400, detail="kind must be 'album' or 'track'")
+            results = self.search_index.search(
+                q, limit=max(1, min(limit, 200)), kind=kind, artist=artist, title_prefix=title_prefix,
+                min_duration=min_duration, max_duration=max_duration
+            )
+            return {"query": q, "results": results}
+
+        @app.get("/api/metrics")
+        def get_metrics():
+            return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+        @app.get("/api/profiler")
+        def get_profiler():
+            return metrics.PROFILER.status()
+
+        @app.post("/api/profiler")
+        def set_profiler(enabled: bool, interval_ms: float = 10.0):
+            """Starts (clearing earlier samples) or stops the sampling profiler."""
+            if enabled: metrics.PROFILER.start(interval_ms / 1000.0)
+            else: metrics.PROFILER.stop()
+            return metrics.PROFILER.status()
+
+        @app.get("/api/profiler/stacks")
+        def get_profiler_stacks():
+            """Sampled stacks in collapsed format, for flamegraph.pl or speedscope."""
+            return PlainTextResponse(metrics.PROFILER.report())
 
         @app.get("/api/config")
         def get_config():
-            if os.path.exists(self.config_path):
-                with open(self.config_path, 'r') as f: return json.load(f)
-            return {}
+            return self.load_debug_config()
 
         @app.websocket("/ws")
         async def websocket_endpoint(websocket: WebSocket):
-            await websocket.accept()
-            logger.info("Frontend Connected")
+            # The client offers subprotocols (msgpack, json); clients that offer none get JSON
+            requested = websocket.scope.get("subprotocols", [])
+            codec = negotiate(requested)
+            await websocket.accept(subprotocol=codec.subprotocol if requested else None)
+            logger.info(f"Frontend Connected ({codec.subprotocol})")
+            await self.hub.register(websocket, codec)
+            if self._position_task is None:
+                self._position_task = asyncio.create_task(self._stream_position())
+            if self.analyzer and self._spectrum_task is None:
+                self._spectrum_task = asyncio.create_task(self._stream_spectrum())
             
             # Send initial sync
-            await websocket.send_text(json.dumps({
+            self.hub.send(websocket, {
                 "status": "sync",
                 "playback": {
                     "isPlaying": self.audio.is_playing,
@@ -104,92 +413,59 @@ class VinylServer:
                     "artist": self.state["artist"]
                 },
                 "navigation": self.nav_state
-            }))
-
-            # Background task to check for track finish
-            async def audio_monitor():
-                while True:
-                    # Check if audio finished naturally
-                    if self.audio.check_track_finished():
-                        try:
-                            print("[WS] Detected finish, sending status: 'finished' to client.")
-                            self.state["playing"] = False
-                            await websocket.send_text(json.dumps({"status": "finished"}))
-                        except Exception as e:
-                            print(f"[WS] Send Error: {e}")
-                            break 
-                    await asyncio.sleep(1.0) 
-
-            monitor_task = asyncio.create_task(audio_monitor())
+            })
 
             try:
                 while True:
-                    data = await websocket.receive_text()
-                    cmd = json.loads(data)
-                    action = cmd.get("action")
-                    payload = cmd.get("payload")
-
-                    if action == "UPDATE_NAV":
-                        self.nav_state.update(payload)
-
-                    elif action == "PLAY":
-                        if payload and "file_path" in payload:
-                            fpath = payload["file_path"]
-                            
-                            print(f"[WS] Received PLAY command for: {payload.get('title')}")
-
-                            # Update local state first
-                            self.state["title"] = payload.get("title", "Unknown")
-                            self.state["artist"] = payload.get("artist", "")
-                            self.state["cover_path"] = self.track_cover_map.get(fpath, None)
-                            self.state["playing"] = True
-
-                            # Run in executor to not block async loop
-                            await asyncio.to_thread(self.audio.play, fpath, payload.get("start_time", 0))
-
-                            await websocket.send_text(json.dumps({
-                                "status": "playing", 
-                                "track": self.state["title"],
-                                "artist": self.state["artist"]
-                            }))
-                    
-                    elif action == "STOP":
-                        print("[WS] Received STOP command")
-                        await asyncio.to_thread(self.audio.stop)
-                        self.state["playing"] = False
-                        await websocket.send_text(json.dumps({"status": "stopped"}))
-                    
-                    elif action == "PAUSE":
-                        print("[WS] Received PAUSE command")
-                        await asyncio.to_thread(self.audio.pause)
-                        await websocket.send_text(json.dumps({"status": "paused"}))
-                    
-                    elif action == "VOLUME":
-                        val = payload.get("value", 0.5)
-                        await asyncio.to_thread(self.audio.set_volume, val)
-
-                    elif action == "SEEK":
-                        t = payload.get("time", 0)
-                        await asyncio.to_thread(self.audio.seek, t)
+                    message = await websocket.receive()
+                    if message["type"] == "websocket.disconnect": raise WebSocketDisconnect(message.get("code", 1000))
+                    data = message.get("bytes") if message.get("bytes") is not None else message.get("text")
+                    # Batched codecs carry several actions per frame
+                    for action, payload in codec.decode(data):
+                        label = action if action in WS_ACTIONS else "other"
+                        WS_MESSAGES.inc(action=label)
+                        with metrics.timed(WS_COMMAND_SECONDS, label, slow=1.0, action=label):
+                            await self._handle_command(websocket, action, payload or {})
 
             except WebSocketDisconnect:
                 logger.info("Frontend Disconnected")
             finally:
-                monitor_task.cancel()
+                self.hub.unregister(websocket)
 
         return app
 
+    def _uvicorn_server(self, log_level):
+        # Open WebSockets would otherwise hold up shutdown until every tab disconnects
+        config = uvicorn.Config(app=self._create_app(), host=self.host, port=self.port, log_level=log_level,
+                                timeout_graceful_shutdown=5)
+        return uvicorn.Server(config)
+
     def start(self):
+        """Serves on a background thread (the Tk launcher)."""
         if self.is_running: return
         self.load_metadata_map()
-        app = self._create_app()
-        config = uvicorn.Config(app=app, host=self.host, port=self.port, log_level="error")
-        self.uvicorn_server = uvicorn.Server(config)
+        self.uvicorn_server = self._uvicorn_server("error")
         self.server_thread = threading.Thread(target=self.uvicorn_server.run)
         self.server_thread.daemon = True
         self.server_thread.start()
         self.is_running = True
 
+    def serve(self, log_level="info"):
+        """
+        Serves on the calling thread until SIGINT or SIGTERM (the headless
+        entry point). The cover map and search index load on a worker thread
+        while the server already accepts connections; until they are in,
+        searches find nothing and playback shows no cover.
+        """
+        if self.is_running: return
+        threading.Thread(target=self.load_metadata_map, name="LibraryLoad", daemon=True).start()
+        self.uvicorn_server = self._uvicorn_server(log_level)
+        self.is_running = True
+        try:
+            self.uvicorn_server.run()
+        finally:
+            self.is_running = False
+
     def stop(self):
         if self.is_running and self.uvicorn_server:
             self.audio.stop()
@@ -0,0 +1,178 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("StaticAssets")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+class AssetManifest:
+    """
+    Content hashes of the visualizer's scripts and styles.
+
+    Each asset is addressed as /static/<path>?v=<hash>. index.html gets an
+    import map from plain to hashed URLs: a module's relative imports
+    resolve to plain /static URLs, which the map rewrites, so every module
+    in the graph is fetched under its own hash. Text assets get .br and .gz
+    siblings, written once per content change and served instead of
+    compressing per request.
+    """
+
+    HASHED_EXT = {".js", ".css"}
+    COMPRESSED_EXT = {".js", ".css", ".json", ".svg"}
+    # Generated content that has its own naming (content-addressed covers and atlases)
+    SKIP_DIRS = {"covers"}
+    HASH_LENGTH = 12
+    # Too small to be worth a second file
+    MIN_COMPRESS_BYTES = 512
+
+    def __init__(self, static_dir):
+        self.static_dir = Path(static_dir)
+        self.hashes: Dict[str, str] = {}
+        self.encodings: Dict[str, Dict[str, Path]] = {}
+        self.index: Optional[Dict] = None
+
+    def build(self):
+        hashes, encodings = {}, {}
+        for root, dirs, files in os.walk(self.static_dir):
+            dirs[:] = [d for d in dirs if not (Path(root) == self.static_dir and d in self.SKIP_DIRS)]
+            for name in files:
+                path = Path(root) / name
+                ext = path.suffix.lower()
+                if ext not in self.HASHED_EXT and ext not in self.COMPRESSED_EXT: continue
+                rel = path.relative_to(self.static_dir).as_posix()
+                data = path.read_bytes()
+                if ext in self.HASHED_EXT:
+                    hashes[rel] = hashlib.sha256(data).hexdigest()[:self.HASH_LENGTH]
+                if ext in self.COMPRESSED_EXT and len(data) >= self.MIN_COMPRESS_BYTES:
+                    encodings[rel] = self._precompress(path, data)
+        self.hashes, self.encodings = hashes, encodings
+        self.index = None
+        logger.info(f"{len(hashes)} hashed assets, {len(encodings)} precompressed")
+
+    @staticmethod
+    def _precompress(path: Path, data: bytes) -> Dict[str, Path]:
+        variants = {}
+        for encoding, suffix, compress in (("br", ".br", brotli and (lambda d: brotli.compress(d, quality=11))),
+                                           ("gzip", ".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))):
+            if not compress: continue
+            sibling = path.with_name(path.name + suffix)
+            try:
+                if not sibling.exists() or sibling.stat().st_mtime < path.stat().st_mtime:
+                    sibling.write_bytes(compress(data))
+                variants[encoding] = sibling
+            except OSError as e:
+                logger.warning(f"Could not write {sibling.name}: {e}")
+        return variants
+
+    def url(self, rel: str) -> str:
+        digest = self.hashes.get(rel)
+        return f"/static/{rel}?v={digest}" if digest else f"/static/{rel}"
+
+    def is_current(self, rel: str, version: Optional[str]) -> bool:
+        return version is not None and self.hashes.get(rel) == version
+
+    def render_index(self) -> Optional[Dict]:
+        """index.html with hashed URLs and the import map: {"etag", "encodings": {encoding: bytes}}; None without an index.html."""
+        if self.index is not None: return self.index
+        try:
+            html = (self.static_dir / "index.html").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+        imports = {f"/static/{rel}": self.url(rel) for rel in sorted(self.hashes) if rel.endswith(".js")}
+        match = re.search(r'<script type="importmap">(.*?)</script>', html, re.S)
+        if match:
+            existing = json.loads(match.group(1))
+            existing.setdefault("imports", {}).update(imports)
+            html = html[:match.start(1)] + json.dumps(existing, indent=4) + html[match.end(1):]
+        else:
+            html = html.replace("<head>", f'<head>\n    <script type="importmap">{json.dumps({"imports": imports})}</script>', 1)
+
+        def hashed(m):
+            rel = m.group(2).split("?", 1)[0]
+            return f'{m.group(1)}="{self.url(rel)}"' if rel in self.hashes else m.group(0)
+        html = re.sub(r'\b(src|href)="/static/([^"]+)"', hashed, html)
+
+        body = html.encode("utf-8")
+        encodings = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli: encodings["br"] = brotli.compress(body, quality=11)
+        self.index = {"etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"', "encodings": encodings}
+        return self.index
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles with cache headers: hashed asset URLs and content-addressed
+    covers are immutable, everything else is revalidated. Precompressed
+    siblings are sent when the client accepts them.
+    """
+
+    # covers/<cover id>_<size>.webp and covers/atlas/<atlas key>.webp
+    CONTENT_ADDRESSED = re.compile(r"^covers/(atlas/)?[0-9a-f]{16,}[^/]*\.(webp|png|jpg)$")
+
+    def __init__(self, *, directory, manifest: AssetManifest, pick_encoding, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.manifest = manifest
+        self.pick_encoding = pick_encoding
+
+    async def get_response(self, path: str, scope) -> Response:
+        rel = path.replace(os.sep, "/").lstrip("/")
+        headers = Headers(scope=scope)
+        if rel == "index.html":
+            return self.index_response(headers)
+
+        version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+        cache_control = IMMUTABLE if self.manifest.is_current(rel, version) or self.CONTENT_ADDRESSED.match(rel) else REVALIDATE
+
+        variants = self.manifest.encodings.get(rel)
+        encoding = self.pick_encoding(headers.get("accept-encoding", ""), variants) if variants else "identity"
+        if encoding != "identity":
+            sibling = variants[encoding]
+            try:
+                response = FileResponse(sibling, stat_result=os.stat(sibling), media_type=mimetypes.guess_type(rel)[0],
+                                        headers={"Content-Encoding": encoding})
+            except OSError:
+                response = None
+            if response is not None:
+                if self.is_not_modified(response.headers, headers):
+                    response = Response(status_code=304, headers={"ETag": response.headers["etag"]})
+                response.headers["Cache-Control"] = cache_control
+                response.headers["Vary"] = "Accept-Encoding"
+                return response
+
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = cache_control
+            if variants: response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    def index_response(self, headers: Headers) -> Response:
+        index = self.manifest.render_index()
+        if index is None: raise HTTPException(status_code=404)
+        response_headers = {"ETag": index["etag"], "Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"}
+        if_none_match = headers.get("if-none-match", "")
+        if index["etag"] in [t.strip() for t in if_none_match.split(",")]:
+            return Response(status_code=304, headers=response_headers)
+        encoding = self.pick_encoding(headers.get("accept-encoding", ""), index["encodings"])
+        if encoding != "identity": response_headers["Content-Encoding"] = encoding
+        return Response(index["encodings"][encoding], media_type="text/html", headers=response_headers)
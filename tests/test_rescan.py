@@ -0,0 +1,49 @@
+from mutagen.id3 import ID3, TALB
+
+from benchmarks.synth_library import write_mp3
+from scanner import Config, LibraryScanner
+
+
+def _tags(title, album):
+    return {"title": title, "artist": "Artist", "album": album, "track": 1, "tracks": 1, "year": 2000, "genre": "Rock"}
+
+
+def _scan(music, app_data):
+    scanner = LibraryScanner(Config(str(music), str(app_data), scan_workers=1, waveforms=False))
+    scanner.run()
+    return {album["title"]: sorted(t["title"] for disc in album["discs"] for t in disc["tracks"])
+            for album in scanner.store.load_library()}
+
+
+def _retag(path, album):
+    id3 = ID3(path)
+    id3.add(TALB(encoding=3, text=album))
+    id3.save()
+
+
+def test_rescan_after_retag_moves_the_track(tmp_path):
+    music = tmp_path / "music"
+    music.mkdir()
+    write_mp3(music / "a.mp3", _tags("A", "Alpha"), 1)
+    write_mp3(music / "b.mp3", _tags("B", "Beta"), 1)
+    assert _scan(music, tmp_path / "app") == {"Alpha": ["A"], "Beta": ["B"]}
+
+    _retag(music / "a.mp3", "Zeta")
+    assert _scan(music, tmp_path / "app") == {"Beta": ["B"], "Zeta": ["A"]}
+
+
+def test_rescan_moves_a_track_into_an_earlier_batch(tmp_path, monkeypatch):
+    # One album per batch: the file's new album is written before its old one is rewritten
+    monkeypatch.setattr(LibraryScanner, "ALBUM_BATCH", 1)
+    music = tmp_path / "music"
+    music.mkdir()
+    write_mp3(music / "a.mp3", _tags("A", "Alpha"), 1)
+    write_mp3(music / "y.mp3", _tags("Y", "Yankee"), 1)
+    write_mp3(music / "z.mp3", _tags("Z", "Yankee"), 1)
+    assert _scan(music, tmp_path / "app") == {"Alpha": ["A"], "Yankee": ["Y", "Z"]}
+
+    _retag(music / "z.mp3", "Alpha")
+    assert _scan(music, tmp_path / "app") == {"Alpha": ["A", "Z"], "Yankee": ["Y"]}
+
+    _retag(music / "y.mp3", "Alpha")
+    assert _scan(music, tmp_path / "app") == {"Alpha": ["A", "Y", "Z"]}
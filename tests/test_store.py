@@ -0,0 +1,16 @@
+from library_store import LibraryStore
+
+
+def _album(artist, title):
+    return {"id": f"{artist}|{title}", "title": title, "artist": artist, "discs": []}
+
+
+def test_updates_keep_library_order_when_a_gap_runs_out(tmp_path):
+    store = LibraryStore(tmp_path / "library.db")
+    store.put_albums([(0, _album("A", "a")), (1, _album("C", "c"))])
+    # Each title sorts just before the previous one, so they all land in the gap after "A"
+    titles = [f"b{'z' * (40 - i)}" for i in range(40)]
+    for title in titles:
+        store.update_albums([_album("B", title)])
+    store.update_albums([_album("b", "0")], ["C|c"])
+    assert [album["title"] for album in store.album_summaries()] == ["a", "0"] + sorted(titles)
@@ -0,0 +1,12 @@
+from types import SimpleNamespace
+
+from library_watcher import LibraryWatcher, _EventForwarder
+
+
+def test_deleted_folder_with_a_dot_is_forwarded(tmp_path):
+    watcher = LibraryWatcher(tmp_path, lambda paths: None, [".mp3"])
+    forwarder = _EventForwarder(watcher.notify)
+    gone = str(tmp_path / "Artist" / "Vol. 2")
+    forwarder.on_any_event(SimpleNamespace(event_type="deleted", src_path=gone, is_directory=True))
+    forwarder.on_any_event(SimpleNamespace(event_type="deleted", src_path=str(tmp_path / "cover.jpg"), is_directory=False))
+    assert watcher._pending == {gone}